@@ -1,4 +1,21 @@
 # health_project/devices/admin.py
 from django.contrib import admin
-from .models import Device
-admin.site.register(Device)
+from .models import Device, QueuedUpload
+from . import presence
+
+
+@admin.register(Device)
+class DeviceAdmin(admin.ModelAdmin):
+    list_display = ("name", "owner", "patient", "seen")
+    readonly_fields = ("seen",)
+
+    @admin.display(description="Last seen")
+    def seen(self, obj):
+        # last_seen in the database lags by up to DEVICE_LAST_SEEN_FLUSH_SECONDS
+        return presence.last_seen(obj)
+
+
+@admin.register(QueuedUpload)
+class QueuedUploadAdmin(admin.ModelAdmin):
+    list_display = ("device_id", "patient_user_id", "received_at", "failed_at", "error")
+    list_filter = (("failed_at", admin.EmptyFieldListFilter),)
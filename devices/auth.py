@@ -0,0 +1,79 @@
+# health_project/devices/auth.py
+"""
+Device token authentication for the ingest endpoints.
+
+Token -> Device lookups are cached in-process, keyed on a SHA-256 of the
+token so raw tokens are never held as cache keys. Unknown tokens are
+cached too (for DEVICE_TOKEN_NEGATIVE_TTL seconds) so a misconfigured
+device can't hammer the database. Saving or deleting a Device drops its
+entries through signals (see devices/signals.py); other processes pick
+the change up when their entry expires after DEVICE_TOKEN_CACHE_TTL.
+"""
+import hashlib
+
+from django.conf import settings
+
+from devices.cache import MISSING, TTLCache
+from devices.models import Device
+
+_tokens = TTLCache(
+    maxsize=getattr(settings, "DEVICE_TOKEN_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "DEVICE_TOKEN_CACHE_TTL", 60),
+)
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def request_token(request):
+    """The token from a ``Device <token>`` or ``Bearer <token>`` header, or None."""
+    auth = request.headers.get("Authorization","")
+    if auth.startswith("Device ") or auth.startswith("Bearer "):
+        return auth.split(" ",1)[1].strip()
+    return None
+
+
+def _remember(key, device):
+    if device is None:
+        _tokens.set(key, None, ttl=getattr(settings, "DEVICE_TOKEN_NEGATIVE_TTL", 10))
+    else:
+        _tokens.set(key, device)
+    return device
+
+
+def _lookup(token):
+    return Device.objects.select_related("patient").filter(token=token)
+
+
+def device_for_token(token):
+    """Return the Device for ``token`` or None, using the cache when possible."""
+    if not token:
+        return None
+    key = token_key(token)
+    device = _tokens.get(key)
+    if device is not MISSING:
+        return device
+    return _remember(key, _lookup(token).first())
+
+
+async def adevice_for_token(token):
+    """Async ``device_for_token``; only a cache miss touches the database."""
+    if not token:
+        return None
+    key = token_key(token)
+    device = _tokens.get(key)
+    if device is not MISSING:
+        return device
+    return _remember(key, await _lookup(token).afirst())
+
+
+def invalidate(device):
+    """Forget ``device`` under its current and any previous token."""
+    _tokens.pop(token_key(device.token))
+    _tokens.discard_values(lambda cached: cached is not None and cached.pk == device.pk)
+
+
+def forget_bound_to(patient_id):
+    """Forget cached devices bound to the given PatientProfile."""
+    _tokens.discard_values(lambda cached: cached is not None and cached.patient_id == patient_id)
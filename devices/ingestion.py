@@ -0,0 +1,141 @@
+# health_project/devices/ingestion.py
+"""
+Turning device readings into Measurement rows. Shared by the HTTP ingest
+views and the spool drain worker.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from devices import auth, patients, presence
+from measurements import events, rules
+from measurements.models import Measurement, LatestVitals, VitalsRollup
+
+
+def parse_timestamp(ts):
+    try:
+        dt = parse_datetime(ts) if ts else None
+    except (TypeError, ValueError):
+        dt = None
+    return dt or timezone.now()
+
+
+def optional_number(payload, key, cast):
+    value = payload.get(key)
+    if value is None or value == "":
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {key}")
+
+
+def ppg_sample_rate(payload):
+    return optional_number(payload, "ppg_sample_rate", int) or settings.PPG_SAMPLE_RATE
+
+
+def build_measurement(device_id, reading, patient_id=None):
+    """Validate one reading and return an unsaved Measurement. Raises ValueError."""
+    meas = Measurement(
+        patient_id=patient_id,
+        timestamp=parse_timestamp(reading.get("timestamp")),
+        heart_rate=optional_number(reading, "heart_rate", float),
+        spo2=optional_number(reading, "spo2", float),
+        temperature=optional_number(reading, "temperature", float),
+        device_id=str(device_id),
+        systolic_bp=optional_number(reading, "systolic_bp", int),
+        diastolic_bp=optional_number(reading, "diastolic_bp", int),
+        note=reading.get("note","")
+    )
+    meas.set_raw_ppg(reading.get("raw_ppg", None), ppg_sample_rate(reading))
+    meas.classify()
+    return meas
+
+
+def recommendations(meas):
+    """Advice for a reading, from the clinical rules in measurements/rules.py"""
+    return rules.VITALS.evaluate(meas).advice
+
+
+def _prepare(entries, bound):
+    """Per-entry results (None where valid) and [(index, unsaved Measurement)] for ``entries``."""
+    profiles = patients.resolve_many([reading.get("patient_user_id", default)
+                                      for device_id, reading, default in entries
+                                      if isinstance(reading, dict) and str(device_id) not in bound])
+
+    results = [None] * len(entries)
+    to_create = []
+    for index, (device_id, reading, default_patient) in enumerate(entries):
+        if not isinstance(reading, dict):
+            results[index] = {"index": index, "status": "error", "detail": "Invalid reading"}
+            continue
+        pid = reading.get("patient_user_id", default_patient)
+        try:
+            if str(device_id) in bound:
+                profile_id = patients.patient_for(bound[str(device_id)], pid)
+            elif not pid:
+                raise ValueError("Missing patient_user_id")
+            else:
+                profile_id = profiles.get(patients.patient_key(pid))
+                if profile_id is None:
+                    raise ValueError("Patient not found")
+            meas = build_measurement(device_id, reading, profile_id)
+        except ValueError as e:
+            results[index] = {"index": index, "status": "error", "detail": str(e)}
+            continue
+        to_create.append((index, meas))
+    return results, to_create
+
+
+def _save(to_create):
+    with transaction.atomic():
+        created = Measurement.objects.bulk_create([meas for _, meas in to_create])
+        LatestVitals.record(created)
+        VitalsRollup.record(created)
+        events.publish_measurements(created)
+
+
+def store_readings(entries, touch_devices=True, bound_devices=()):
+    """
+    Validate and save many readings at once. ``entries`` is a list of
+    (device_id, reading dict, default patient_user_id). Patients are
+    resolved through devices.patients (cached, at most one query) and all
+    valid readings go in with a single bulk_create, together with the
+    latest-vitals snapshot, the rollups and (unless ``touch_devices`` is
+    False) each device's last_seen. Live dashboards are notified once the
+    batch commits. Readings from any of ``bound_devices``
+    that are bound to a patient go to that patient without a lookup.
+
+    A profile deleted since it was cached (by another process, whose
+    signal this one never saw) fails the insert with an IntegrityError;
+    the batch's cached patients (and bound devices) are then dropped, the
+    patients resolved again and the insert retried once.
+
+    Returns a list of per-entry results aligned with ``entries``.
+    Database errors propagate so callers can retry the whole batch.
+    """
+    bound = {str(d.pk): d for d in bound_devices if d.patient_id}
+    results, to_create = _prepare(entries, bound)
+    if to_create:
+        try:
+            _save(to_create)
+        except IntegrityError:
+            patients.forget_profiles({meas.patient_id for _, meas in to_create})
+            # The binding may be what went stale: look the patients up instead
+            for device in bound.values():
+                auth.invalidate(device)
+            results, to_create = _prepare(entries, {})
+            if to_create:
+                _save(to_create)
+        if to_create and touch_devices:
+            presence.touch({meas.device_id for _, meas in to_create})
+
+    for index, meas in to_create:
+        results[index] = {
+            "index": index,
+            "status": "ok",
+            "measurement_id": str(meas.id),
+            "recommendations": recommendations(meas),
+        }
+    return results
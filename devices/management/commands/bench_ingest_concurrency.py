@@ -0,0 +1,134 @@
+# health_project/devices/management/commands/bench_ingest_concurrency.py
+import asyncio
+import json
+import random
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate many devices uploading to /device/ingest/ on a running server "
+        "and report, per concurrency level, response times (from the end of each "
+        "upload), errors and whether the server kept up. Run it against the ASGI and the sync WSGI server to "
+        "compare them (see gunicorn.conf.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000",
+                            help="Base URL of the server under test.")
+        parser.add_argument("--token", required=True, help="A device token.")
+        parser.add_argument("--patient", default="",
+                            help="patient_user_id to send (not needed for a device bound to a patient).")
+        parser.add_argument("--connections", default="10,50,100,200,400",
+                            help="Comma-separated numbers of concurrent devices to try.")
+        parser.add_argument("--duration", type=float, default=10,
+                            help="Seconds to run each level.")
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds between one device's uploads.")
+        parser.add_argument("--upload-time", type=float, default=0.2,
+                            help="Seconds a device takes to send its body (a slow uplink).")
+        parser.add_argument("--timeout", type=float, default=10)
+        parser.add_argument("--slo", type=float, default=1000,
+                            help="p95 latency (ms) a level must stay under to count as sustained.")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme not in ("http", "https"):
+            raise CommandError("--url must be http:// or https://")
+        try:
+            levels = [int(n) for n in options["connections"].split(",")]
+        except ValueError:
+            raise CommandError("--connections must be comma-separated integers")
+
+        self.target = (url.hostname, url.port or (443 if url.scheme == "https" else 80), url.scheme == "https")
+        self.path = url.path.rstrip("/") + "/device/ingest/"
+        self.options = options
+        self.stdout.write(
+            f"{options['url']}: {options['interval']}s between uploads, "
+            f"{options['upload_time']}s per upload, {options['duration']}s per level")
+        self.stdout.write(f"{'devices':>8} {'sent':>7} {'ok':>7} {'failed':>7} {'req/s':>8} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+        sustained = 0
+        for level in levels:
+            stats = asyncio.run(self.run_level(level))
+            ok = len(stats["latencies"])
+            sent = ok + stats["failed"]
+            latencies = sorted(stats["latencies"]) or [float("nan")]
+
+            def p(q):
+                return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+            self.stdout.write(
+                f"{level:>8} {sent:>7} {ok:>7} {stats['failed']:>7} {ok / options['duration']:>8.1f} "
+                f"{statistics.median(latencies):>8.0f} {p(0.95):>8.0f} {p(0.99):>8.0f}")
+            if stats["errors"]:
+                self.stdout.write(f"{'':>8} failures: " + ", ".join(
+                    f"{reason} x{count}" for reason, count in stats["errors"].items()))
+            if sent and stats["failed"] <= sent * 0.01 and p(0.95) <= options["slo"]:
+                sustained = level
+            else:
+                break
+        self.stdout.write(self.style.SUCCESS(
+            f"Sustained {sustained} concurrent devices (<=1% failed, p95 <= {options['slo']:.0f} ms)"))
+
+    async def run_level(self, devices):
+        stats = {"latencies": [], "failed": 0, "errors": {}}
+        deadline = time.monotonic() + self.options["duration"]
+        await asyncio.gather(*(self.device(stats, deadline) for _ in range(devices)))
+        return stats
+
+    async def device(self, stats, deadline):
+        interval = self.options["interval"]
+        await asyncio.sleep(random.uniform(0, interval))
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                status, elapsed = await asyncio.wait_for(self.upload(), self.options["timeout"])
+                error = None if status == 201 else f"HTTP {status}"
+            except asyncio.TimeoutError:
+                error = "timeout"
+            except (OSError, ValueError, IndexError) as e:
+                error = type(e).__name__
+            if error:
+                stats["failed"] += 1
+                stats["errors"][error] = stats["errors"].get(error, 0) + 1
+            else:
+                stats["latencies"].append(elapsed * 1000)
+            await asyncio.sleep(max(0, started + interval - time.monotonic()))
+
+    async def upload(self):
+        host, port, tls = self.target
+        body = json.dumps({
+            "patient_user_id": self.options["patient"],
+            "timestamp": timezone.now().isoformat(),
+            "heart_rate": random.randint(55, 110),
+            "spo2": random.randint(93, 100),
+            "temperature": round(random.uniform(36.2, 37.6), 1),
+        }).encode()
+        head = (
+            f"POST {self.path} HTTP/1.1\r\nHost: {host}\r\n"
+            f"Authorization: Device {self.options['token']}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode()
+        reader, writer = await asyncio.open_connection(host, port, ssl=tls or None)
+        try:
+            # Send the body in two halves with a pause, like a device on a slow link
+            half = len(body) // 2
+            writer.write(head + body[:half])
+            await writer.drain()
+            await asyncio.sleep(self.options["upload_time"])
+            writer.write(body[half:])
+            await writer.drain()
+            sent = time.monotonic()
+            status_line = await reader.readline()
+            await reader.read()
+            return int(status_line.split()[1]), time.monotonic() - sent
+        finally:
+            writer.close()
@@ -0,0 +1,48 @@
+# health_project/devices/management/commands/drain_ingest_spool.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from devices import spool
+
+
+class Command(BaseCommand):
+    help = "Write queued device uploads to the database in bulk, retrying on failure."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep draining until stopped.")
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds between drains with --loop.")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Uploads stored per transaction.")
+        parser.add_argument("--requeue-failed", action="store_true",
+                            help="Queue the readings set aside by earlier drains again, then exit.")
+
+    def handle(self, *args, **options):
+        if options["requeue_failed"]:
+            self.stdout.write(f"requeued {spool.requeue_failed()} upload(s)")
+            return
+
+        backoff = options["interval"]
+        while True:
+            close_old_connections()
+            try:
+                claimed, stored, failed = spool.drain(options["batch_size"])
+            except Exception as e:
+                if not options["loop"]:
+                    raise CommandError(f"drain failed: {type(e).__name__}: {e}") from e
+                # Nothing was taken off the queue; try again after backing off
+                self.stderr.write(f"drain failed, will retry: {type(e).__name__}: {e}")
+                claimed, ok = 0, False
+            else:
+                ok = True
+                if claimed:
+                    self.stdout.write(f"stored {stored} reading(s) from {claimed} upload(s)"
+                                      + (f", set aside {failed}" if failed else ""))
+            if not options["loop"]:
+                return
+            if ok and claimed == options["batch_size"]:
+                continue  # more waiting
+            backoff = options["interval"] if ok else min(backoff * 2, 60)
+            time.sleep(backoff)
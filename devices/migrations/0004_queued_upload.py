@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_device_patient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=64)),
+                ('patient_user_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('received_at', models.DateTimeField()),
+                ('readings', models.JSONField()),
+                ('failed_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -9,6 +9,30 @@ class Device(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
     token = models.CharField(max_length=128, unique=True)
     last_seen = models.DateTimeField(null=True, blank=True)
+    # Optional binding: readings from a bound device always belong to this
+    # patient, so ingest doesn't need to look patient_user_id up.
+    patient = models.ForeignKey("measurements.PatientProfile", null=True, blank=True,
+                                related_name="devices", on_delete=models.SET_NULL)
 
     def __str__(self):
         return self.name
+
+
+class QueuedUpload(models.Model):
+    """
+    One spooled upload waiting for `manage.py drain_ingest_spool` (see
+    devices/spool.py). Readings that can't be stored are kept here with
+    ``failed_at`` and ``error`` set instead of being retried.
+    """
+    device_id = models.CharField(max_length=64)
+    patient_user_id = models.CharField(max_length=64, null=True, blank=True)
+    received_at = models.DateTimeField()
+    readings = models.JSONField()
+    failed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.device_id} @ {self.received_at:%Y-%m-%d %H:%M:%S}"
@@ -0,0 +1,90 @@
+# health_project/devices/patients.py
+"""
+Resolving a reading's patient_user_id (the patient's User UUID) to a
+PatientProfile id. The mapping almost never changes, so it is cached
+in-process (bounded, LRU eviction) and dropped when a PatientProfile is
+saved or deleted (see devices/signals.py). Those signals only reach
+this process; an insert that fails because another process deleted a
+cached profile drops the stale entries and resolves again (see
+devices/ingestion.py). Devices bound to a patient (Device.patient) skip
+the lookup altogether.
+"""
+import uuid
+
+from django.conf import settings
+
+from devices.cache import MISSING, TTLCache
+from measurements.models import PatientProfile
+
+_profiles = TTLCache(
+    maxsize=getattr(settings, "PATIENT_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "PATIENT_CACHE_TTL", 600),
+)
+
+
+def patient_key(pid):
+    """Normalised UUID string for a patient_user_id, or None if it isn't one."""
+    try:
+        return str(uuid.UUID(str(pid)))
+    except ValueError:
+        return None
+
+
+def remember(profile):
+    _profiles.set(str(profile.user_id), profile.pk)
+
+
+def forget(profile):
+    _profiles.pop(str(profile.user_id))
+
+
+def forget_profiles(profile_ids):
+    """Drop the cached lookups that resolve to any of ``profile_ids``."""
+    _profiles.discard_values(lambda pk: pk in profile_ids)
+
+
+def forget_all():
+    _profiles.clear()
+
+
+def resolve_many(pids):
+    """Map each patient_user_id to a PatientProfile id (None if unknown) with at most one query."""
+    resolved, missing = {}, set()
+    for pid in pids:
+        key = patient_key(pid)
+        if key is None:
+            continue
+        cached = _profiles.get(key)
+        if cached is MISSING:
+            missing.add(key)
+        else:
+            resolved[key] = cached
+    if missing:
+        found = dict(PatientProfile.objects.filter(user__id__in=missing).values_list("user_id", "pk"))
+        found = {str(k): v for k, v in found.items()}
+        for key in missing:
+            resolved[key] = found.get(key)
+            _profiles.set(key, resolved[key],
+                          ttl=None if key in found else getattr(settings, "PATIENT_NEGATIVE_TTL", 10))
+    return resolved
+
+
+def resolve(pid):
+    return resolve_many([pid]).get(patient_key(pid))
+
+
+def patient_for(device, pid):
+    """
+    PatientProfile id for a reading from ``device`` naming ``pid``.
+    Raises ValueError with a client-facing message.
+    """
+    if device.patient_id:
+        if pid and patient_key(pid) != str(device.patient.user_id):
+            raise ValueError("Device is bound to another patient")
+        return device.patient_id
+    if not pid:
+        raise ValueError("Missing patient_user_id")
+    profile_id = resolve(pid)
+    if profile_id is None:
+        raise ValueError("Patient not found")
+    return profile_id
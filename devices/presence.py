@@ -0,0 +1,136 @@
+# health_project/devices/presence.py
+"""
+Coalesced Device.last_seen updates.
+
+Ingest calls ``touch()`` instead of saving the Device on every reading.
+The newest timestamp per device is written to the cache immediately (so
+readers see it) and kept in memory; at most every
+DEVICE_LAST_SEEN_FLUSH_SECONDS the pending values are written back with a
+single UPDATE. Values are only ever moved forward.
+
+The write-back happens on a background thread (and, when one is due, on
+the next touch), so it never fails or slows the request that reported
+the reading; a failed write is logged and its values kept for the next
+attempt. Values still pending when traffic stops are written by the
+thread.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, DateTimeField, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+_lock = threading.Lock()
+_pending = {}
+_last_flush = time.monotonic()
+_flusher = None
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(device_id):
+    return f"device:last_seen:{device_id}"
+
+
+def touch(device_ids, when=None):
+    """Record that the given device(s) were seen at ``when`` (default now)."""
+    global _last_flush
+    _start_flusher()
+    if isinstance(device_ids, (str, bytes)) or not hasattr(device_ids, "__iter__"):
+        device_ids = [device_ids]
+    when = when or timezone.now()
+    keys = {}
+    with _lock:
+        for device_id in device_ids:
+            device_id = str(device_id)
+            if device_id not in _pending or _pending[device_id] < when:
+                _pending[device_id] = when
+            keys[cache_key(device_id)] = _pending[device_id]
+        due = time.monotonic() - _last_flush >= _interval()
+        if due:
+            _last_flush = time.monotonic()
+    try:
+        cache.set_many(keys, CACHE_TIMEOUT)
+    except Exception:
+        logger.exception("Caching last_seen failed")
+    if due:
+        flush()
+
+
+def _interval():
+    return getattr(settings, "DEVICE_LAST_SEEN_FLUSH_SECONDS", 30)
+
+
+def _flush_periodically():
+    global _last_flush
+    while True:
+        time.sleep(max(_interval(), 1))
+        with _lock:
+            due = bool(_pending) and time.monotonic() - _last_flush >= _interval()
+            if due:
+                _last_flush = time.monotonic()
+        if due:
+            try:
+                flush()
+            finally:
+                # Don't hold a connection (or a pooler slot) while sleeping
+                connection.close()
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        with _lock:
+            if _flusher is None or not _flusher.is_alive():
+                _flusher = threading.Thread(target=_flush_periodically, name="last-seen-flush", daemon=True)
+                _flusher.start()
+
+
+def flush():
+    """
+    Write all pending last_seen values in one UPDATE. Returns the number
+    written; on failure the values are kept for the next flush and 0 is
+    returned.
+    """
+    from devices.models import Device
+
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+    newest = Case(*[When(pk=pk, then=Value(ts)) for pk, ts in pending.items()],
+                  output_field=DateTimeField())
+    try:
+        Device.objects.filter(pk__in=list(pending)).filter(
+            Q(last_seen__isnull=True) | Q(last_seen__lt=newest)
+        ).update(last_seen=Greatest(Coalesce("last_seen", newest), newest))
+    except Exception:
+        logger.exception("Writing last_seen for %d device(s) failed; will retry", len(pending))
+        with _lock:
+            for pk, ts in pending.items():
+                if pk not in _pending or _pending[pk] < ts:
+                    _pending[pk] = ts
+        return 0
+    return len(pending)
+
+
+def last_seen(device):
+    """The freshest known last_seen for ``device``, preferring the cache."""
+    cached = cache.get(cache_key(device.pk))
+    if cached and (device.last_seen is None or cached > device.last_seen):
+        return cached
+    return device.last_seen
+
+
+@atexit.register
+def _flush_on_exit():
+    flush()
@@ -0,0 +1,19 @@
+# health_project/devices/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from devices import auth, patients
+from devices.models import Device
+from measurements.models import PatientProfile
+
+
+@receiver([post_save, post_delete], sender=Device)
+def forget_device_token(sender, instance, **kwargs):
+    auth.invalidate(instance)
+
+
+@receiver([post_save, post_delete], sender=PatientProfile)
+def forget_patient(sender, instance, **kwargs):
+    patients.forget(instance)
+    # Cached devices bound to this patient carry a stale copy of it
+    auth.forget_bound_to(instance.pk)
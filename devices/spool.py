@@ -0,0 +1,119 @@
+# health_project/devices/spool.py
+"""
+Database-backed queue for device uploads (DEVICE_INGEST_MODE = "spool").
+
+Ingest stores each upload as one QueuedUpload row (a single small insert,
+without the patient lookups, snapshot and rollup writes) and answers 202.
+The queue is a table, so every web process and dyno shares it and it
+survives restarts. ``manage.py drain_ingest_spool`` claims the oldest
+uploads, stores their readings and deletes the claimed rows in the same
+transaction, so a reading is stored once even if the worker dies midway.
+Several drains can run at once; each skips rows another one has claimed.
+
+When a batch can't be stored it is split in halves, down to single
+readings, each part in its own savepoint, so only the readings that fail
+are set aside: they stay in the table with ``failed_at`` and ``error``
+set, for ``drain_ingest_spool --requeue-failed`` once fixed. Readings
+rejected by validation (an unknown patient, say) are set aside the same
+way. Errors that mean the database itself is unavailable are not blamed
+on the readings; the batch is left queued and retried.
+"""
+from django.db import IntegrityError, InterfaceError, OperationalError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import patients
+from .ingestion import store_readings
+from .models import Device, QueuedUpload
+
+# The database is down or unreachable, not a problem with the readings
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+def append(device_id, readings, default_patient=None, received_at=None):
+    """Queue one upload (a list of readings)."""
+    QueuedUpload.objects.create(
+        device_id=str(device_id),
+        patient_user_id=str(default_patient) if default_patient is not None else None,
+        received_at=received_at or timezone.now(),
+        readings=readings,
+    )
+
+
+def pending():
+    return QueuedUpload.objects.filter(failed_at__isnull=True)
+
+
+def _store(entries, failures):
+    """
+    Store ``entries`` ((upload, reading) pairs), halving the batch on
+    errors. Readings that can't be stored are added to ``failures`` as
+    (entry, reason). Returns the number stored.
+    """
+    try:
+        with transaction.atomic():
+            results = store_readings([(upload.device_id, reading, upload.patient_user_id)
+                                      for upload, reading in entries], touch_devices=False)
+    except TRANSIENT_ERRORS:
+        raise
+    except Exception as e:
+        if len(entries) == 1:
+            failures.append((entries[0], f"{type(e).__name__}: {e}"))
+            return 0
+        half = len(entries) // 2
+        return _store(entries[:half], failures) + _store(entries[half:], failures)
+    stored = 0
+    for entry, result in zip(entries, results):
+        if result["status"] == "ok":
+            stored += 1
+        else:
+            failures.append((entry, result["detail"]))
+    return stored
+
+
+def drain(batch_size=500):
+    """
+    Store the oldest ``batch_size`` queued uploads. Returns (uploads
+    claimed, readings stored, readings set aside). Raises the database
+    error, with nothing changed, when the database is unavailable.
+    """
+    try:
+        return _drain(batch_size)
+    except IntegrityError:
+        # Foreign keys are checked at commit, so a patient deleted since it
+        # was cached fails the whole drain; look the patients up again
+        patients.forget_all()
+        return _drain(batch_size)
+
+
+def _drain(batch_size):
+    with transaction.atomic():
+        uploads = list(pending().select_for_update(skip_locked=True).order_by("id")[:batch_size])
+        if not uploads:
+            return 0, 0, 0
+        entries = [(upload, reading) for upload in uploads for reading in upload.readings or []]
+        failures = []
+        stored = _store(entries, failures) if entries else 0
+
+        seen = {}
+        for upload in uploads:
+            if upload.device_id not in seen or upload.received_at > seen[upload.device_id]:
+                seen[upload.device_id] = upload.received_at
+        for device_id, received in seen.items():
+            Device.objects.filter(Q(last_seen__lt=received) | Q(last_seen__isnull=True),
+                                  pk=device_id).update(last_seen=received)
+
+        QueuedUpload.objects.filter(pk__in=[upload.pk for upload in uploads]).delete()
+        now = timezone.now()
+        QueuedUpload.objects.bulk_create([
+            QueuedUpload(device_id=upload.device_id, patient_user_id=upload.patient_user_id,
+                         received_at=upload.received_at, readings=[reading],
+                         failed_at=now, error=reason)
+            for (upload, reading), reason in failures
+        ])
+    return len(uploads), stored, len(failures)
+
+
+def requeue_failed():
+    """Queue the set-aside readings again; returns how many uploads."""
+    return QueuedUpload.objects.filter(failed_at__isnull=False).update(failed_at=None, error="")
@@ -1,3 +1,293 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.test import TransactionTestCase, override_settings
+from django.test.client import MULTIPART_CONTENT
+from django.urls import reverse
+
+from measurements import events
+from measurements.models import Measurement, PatientProfile
+from users.models import User
+from . import auth, patients, presence, spool
+from .models import Device, QueuedUpload
+
+
+# Ingest writes on a pool thread with its own database connection, which
+# can't see the open transaction of a TestCase
+class DeviceTestCase(TransactionTestCase):
+    def setUp(self):
+        # The in-process caches outlive the rows that TransactionTestCase flushes
+        auth._tokens.clear()
+        patients.forget_all()
+        presence._pending.clear()
+        self.user = User.objects.create_user("patient", password="pw", is_patient=True)
+        self.profile = PatientProfile.objects.create(user=self.user, gender="F")
+        self.device = Device.objects.create(name="band", token="secret")
+
+    def post(self, name, payload, token="secret"):
+        return self.client.post(reverse(name), payload, content_type="application/json",
+                                headers={"Authorization": f"Device {token}"})
+
+    def reading(self, **values):
+        return dict({"heart_rate": 70, "spo2": 98, "patient_user_id": str(self.user.id)}, **values)
+
+    def stale_profile(self):
+        """Delete the patient's profile as another process would, leaving this one's cache stale."""
+        pk = self.profile.pk
+        self.assertEqual(patients.resolve(self.user.id), pk)
+        self.profile.delete()
+        self.profile.pk = pk
+        patients.remember(self.profile)
+
+
+class BatchIngestTests(DeviceTestCase):
+    def test_valid_readings_are_stored_and_the_rest_reported(self):
+        response = self.post("device-ingest-batch", [
+            self.reading(),
+            "not a reading",
+            self.reading(patient_user_id=None),
+            self.reading(heart_rate="fast"),
+            self.reading(patient_user_id="6a1f0c1e-0000-4000-8000-000000000000"),
+            self.reading(spo2=90),
+        ])
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body["created"], body["failed"]), (2, 4))
+        self.assertEqual([r["status"] for r in body["results"]], ["ok", "error", "error", "error", "error", "ok"])
+        self.assertEqual([r.get("detail") for r in body["results"]][1:5],
+                         ["Invalid reading", "Missing patient_user_id", "Invalid heart_rate", "Patient not found"])
+        self.assertEqual(Measurement.objects.filter(patient=self.profile).count(), 2)
+
+    def test_batch_with_nothing_valid_is_a_bad_request(self):
+        response = self.post("device-ingest-batch", [self.reading(heart_rate="fast")])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Measurement.objects.exists())
+
+
+class IngestTests(DeviceTestCase):
+    def test_waveform_that_cannot_be_packed_is_a_bad_request(self):
+        for extra in ({"raw_ppg": [1, 2, 3], "ppg_sample_rate": 70000},
+                      {"raw_ppg": [1, 2, 3], "ppg_sample_rate": -1},
+                      {"raw_ppg": [1.5, 2, 3]}):
+            response = self.post("device-ingest", self.reading(**extra))
+            self.assertEqual(response.status_code, 400, extra)
+        self.assertFalse(Measurement.objects.exists())
+
+    def test_form_encoded_reading_is_accepted(self):
+        reading = self.reading(temperature="")
+        for body, content_type in ((urlencode(reading), "application/x-www-form-urlencoded"),
+                                   (reading, MULTIPART_CONTENT)):
+            response = self.client.post(reverse("device-ingest"), body, content_type=content_type,
+                                        headers={"Authorization": "Device secret"})
+            self.assertEqual(response.status_code, 201, content_type)
+        self.assertEqual(list(Measurement.objects.values_list("heart_rate", "temperature")), [(70, None)] * 2)
+
+    def test_deleted_profile_in_cache_is_resolved_again(self):
+        self.stale_profile()
+        self.profile = PatientProfile.objects.create(user=self.user, gender="F")
+        response = self.post("device-ingest-batch", [self.reading(), self.reading()])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Measurement.objects.filter(patient=self.profile).count(), 2)
+
+        self.stale_profile()
+        response = self.post("device-ingest", self.reading())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Patient not found")
+
+
+class TokenCacheTests(DeviceTestCase):
+    def test_rotated_token_is_rejected_on_the_next_request(self):
+        self.assertEqual(self.post("device-ingest", self.reading()).status_code, 201)
+        self.device.token = "rotated"
+        self.device.save()
+        self.assertEqual(self.post("device-ingest", self.reading()).status_code, 401)
+        self.assertEqual(self.post("device-ingest", self.reading(), token="rotated").status_code, 201)
+
+    def test_deleted_device_is_rejected_on_the_next_request(self):
+        self.assertEqual(self.post("device-ingest", self.reading()).status_code, 201)
+        self.device.delete()
+        self.assertEqual(self.post("device-ingest", self.reading()).status_code, 401)
+
+    def test_unknown_token_is_cached_until_it_expires(self):
+        with mock.patch.object(auth, "_lookup", wraps=auth._lookup) as lookup:
+            for _ in range(3):
+                self.assertEqual(self.post("device-ingest", self.reading(), token="later").status_code, 401)
+            self.assertEqual(lookup.call_count, 1)
+            # a token set without signals (another process) waits out the negative entry
+            Device.objects.filter(pk=self.device.pk).update(token="later")
+            self.assertEqual(self.post("device-ingest", self.reading(), token="later").status_code, 401)
+            with mock.patch("devices.cache.time.monotonic", return_value=time.monotonic() + 11):
+                self.assertEqual(self.post("device-ingest", self.reading(), token="later").status_code, 201)
+            self.assertEqual(lookup.call_count, 2)
+
+    def test_new_device_replaces_a_cached_unknown_token(self):
+        self.assertEqual(self.post("device-ingest", self.reading(), token="later").status_code, 401)
+        Device.objects.create(name="strap", token="later")
+        self.assertEqual(self.post("device-ingest", self.reading(), token="later").status_code, 201)
+
+
+class BoundDeviceTests(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device.patient = self.profile
+        self.device.save()
+        other = User.objects.create_user("other", password="pw", is_patient=True)
+        PatientProfile.objects.create(user=other, gender="M")
+        self.other_id = str(other.id)
+
+    def test_reading_without_patient_goes_to_the_bound_patient(self):
+        response = self.post("device-ingest", self.reading(patient_user_id=None))
+        self.assertEqual(response.status_code, 201)
+        reading = self.reading()
+        del reading["patient_user_id"]
+        response = self.post("device-ingest-batch", [reading, self.reading()])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Measurement.objects.filter(patient=self.profile).count(), 3)
+
+    def test_reading_for_another_patient_is_rejected(self):
+        response = self.post("device-ingest", self.reading(patient_user_id=self.other_id))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Device is bound to another patient")
+        response = self.post("device-ingest-batch", [self.reading(), self.reading(patient_user_id=self.other_id)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r.get("detail") for r in response.json()["results"]],
+                         [None, "Device is bound to another patient"])
+        self.assertEqual(list(Measurement.objects.values_list("patient_id", flat=True)), [self.profile.pk])
+
+    @override_settings(DEVICE_INGEST_MODE="spool")
+    def test_spooled_readings_are_checked_against_the_bound_patient(self):
+        self.assertEqual(self.post("device-ingest", self.reading(patient_user_id=None)).status_code, 202)
+        response = self.post("device-ingest", self.reading(patient_user_id=self.other_id))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Device is bound to another patient")
+        self.assertEqual([upload.readings[0]["patient_user_id"] for upload in QueuedUpload.objects.all()],
+                         [str(self.user.id)])
+
+
+@override_settings(DEVICE_LAST_SEEN_FLUSH_SECONDS=0)
+@mock.patch("devices.presence._start_flusher")
+class PresenceTests(DeviceTestCase):
+    def test_failed_last_seen_write_does_not_fail_ingest(self, start_flusher):
+        with mock.patch("devices.presence.Greatest", side_effect=DatabaseError("down")), \
+                self.assertLogs("devices.presence", "ERROR"):
+            response = self.post("device-ingest", self.reading())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Measurement.objects.count(), 1)
+        self.assertIn(str(self.device.pk), presence._pending)
+
+        # Kept for the next flush
+        self.assertEqual(presence.flush(), 1)
+        self.device.refresh_from_db()
+        self.assertIsNotNone(self.device.last_seen)
+        self.assertTrue(start_flusher.called)
+
+
+@override_settings(DEVICE_INGEST_MODE="spool")
+class SpoolTests(DeviceTestCase):
+    def test_batch_is_queued_and_drained(self):
+        response = self.post("device-ingest-batch", [self.reading(), self.reading(heart_rate=80)])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["queued"], 2)
+        self.assertEqual(QueuedUpload.objects.count(), 1)
+        self.assertFalse(Measurement.objects.exists())
+
+        self.assertEqual(spool.drain(), (1, 2, 0))
+        self.assertEqual(Measurement.objects.filter(patient=self.profile).count(), 2)
+        self.assertFalse(QueuedUpload.objects.exists())
+        self.device.refresh_from_db()
+        self.assertIsNotNone(self.device.last_seen)
+
+    @skipUnless(connection.vendor == "postgresql", "live events cross processes with PostgreSQL NOTIFY")
+    @override_settings(LIVE_EVENTS_HEARTBEAT=0.1)
+    def test_drained_readings_reach_live_streams(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def subscribe():
+            return events.broker.subscribe([self.profile.pk])
+        subscription = loop.run_until_complete(subscribe())
+        self.addCleanup(subscription.close)
+        events._start_listener()
+        self.addCleanup(events._stop_listener)
+
+        def next_event(timeout):
+            event = loop.run_until_complete(subscription.get(timeout))
+            while event and event["id"] == "probe":
+                event = loop.run_until_complete(subscription.get(timeout))
+            return event
+
+        # Notify until the listener has connected
+        probe = json.dumps({"patient": self.profile.pk, "id": "probe"})
+        for _ in range(50):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [events.CHANNEL, probe])
+            if loop.run_until_complete(subscription.get(0.1)):
+                break
+
+        self.post("device-ingest", self.reading(heart_rate=130))
+        self.assertIsNone(next_event(0.2))
+        self.assertEqual(spool.drain(), (1, 1, 0))
+        event = next_event(5)
+        self.assertEqual((event["patient"], event["heart_rate"]), (self.profile.pk, 130))
+
+    def test_only_bad_readings_are_set_aside(self):
+        # Too large for the column: fails in the database, not in validation
+        readings = [self.reading(heart_rate=60 + i) for i in range(7)]
+        readings[4]["systolic_bp"] = 10 ** 20
+        self.post("device-ingest-batch", readings)
+        self.post("device-ingest", self.reading(heart_rate=99))
+
+        self.assertEqual(spool.drain(), (2, 7, 1))
+        self.assertEqual(Measurement.objects.count(), 7)
+        failed = QueuedUpload.objects.get()
+        self.assertIsNotNone(failed.failed_at)
+        self.assertEqual(failed.readings[0]["systolic_bp"], 10 ** 20)
+        self.assertTrue(failed.error)
+        # Set-aside readings don't hold up the queue
+        self.assertEqual(spool.drain(), (0, 0, 0))
+
+    def test_unknown_patient_is_set_aside(self):
+        spool.append(self.device.id, [self.reading(patient_user_id="6a1f0c1e-0000-4000-8000-000000000000")])
+        self.assertEqual(spool.drain(), (1, 0, 1))
+        self.assertEqual(QueuedUpload.objects.get().error, "Patient not found")
+
+    def test_deleted_profile_in_cache_is_set_aside(self):
+        spool.append(self.device.id, [self.reading()])
+        self.stale_profile()
+        self.assertEqual(spool.drain(), (1, 0, 1))
+        self.assertEqual(QueuedUpload.objects.get().error, "Patient not found")
+
+    def test_unexpected_error_is_set_aside(self):
+        self.post("device-ingest", self.reading())
+        with mock.patch("devices.spool.store_readings", side_effect=RuntimeError("boom")):
+            self.assertEqual(spool.drain(), (1, 0, 1))
+        self.assertIn("boom", QueuedUpload.objects.get().error)
+
+        call_command("drain_ingest_spool", requeue_failed=True, stdout=mock.Mock())
+        call_command("drain_ingest_spool", stdout=mock.Mock())
+        self.assertEqual(Measurement.objects.count(), 1)
+        self.assertFalse(QueuedUpload.objects.exists())
+
+    def test_database_outage_keeps_the_queue(self):
+        self.post("device-ingest", self.reading())
+        with mock.patch("devices.spool.store_readings", side_effect=OperationalError("down")):
+            with self.assertRaises(OperationalError):
+                spool.drain()
+            # A one-off drain fails loudly; the --loop worker logs and backs off
+            with self.assertRaisesMessage(CommandError, "OperationalError: down"):
+                call_command("drain_ingest_spool", stdout=mock.Mock(), stderr=mock.Mock())
+            stderr = mock.Mock()
+            with mock.patch("devices.management.commands.drain_ingest_spool.time.sleep",
+                            side_effect=KeyboardInterrupt) as sleep:
+                with self.assertRaises(KeyboardInterrupt):
+                    call_command("drain_ingest_spool", "--loop", stdout=mock.Mock(), stderr=stderr)
+            sleep.assert_called_once_with(2.0)
+            self.assertIn("will retry", stderr.write.call_args[0][0])
+        upload = QueuedUpload.objects.get()
+        self.assertIsNone(upload.failed_at)
+        self.assertEqual(spool.drain(), (1, 1, 0))
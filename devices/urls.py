@@ -1,6 +1,7 @@
 # health_project/devices/urls.py
 from django.urls import path
-from .views import ingest
+from .views import ingest, ingest_batch
 urlpatterns = [
     path("ingest/", ingest, name="device-ingest"),
+    path("ingest/batch/", ingest_batch, name="device-ingest-batch"),
 ]
@@ -1,112 +1,188 @@
 # devices/views.py
+import json
+
+from asgiref.sync import sync_to_async
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from django.utils.dateparse import parse_datetime
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
 from django.utils import timezone
-from measurements.models import PatientProfile, Measurement,MenstrualCycle
-from devices.models import Device
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from measurements.models import PatientProfile, MenstrualCycle
+from devices import patients, spool
+from devices.auth import adevice_for_token, request_token
+from devices.ingestion import build_measurement, recommendations, store_readings
 from django.contrib.auth.decorators import login_required
 
 
-@api_view(['POST'])
-@permission_classes([])  # allow unauthenticated — device uses its token header
-def ingest(request):
-    # Device authentication
-    auth = request.headers.get("Authorization","")
-    token = None
-    if auth.startswith("Device "):
-        token = auth.split(" ",1)[1].strip()
-    elif auth.startswith("Bearer "):
-        token = auth.split(" ",1)[1].strip()
-    else:
-        return Response({"detail":"Missing device auth"}, status=status.HTTP_401_UNAUTHORIZED)
+def _spooling():
+    return getattr(settings, "DEVICE_INGEST_MODE", "direct") == "spool"
+
 
+def _spool_readings(device, readings, default_patient=None):
+    """
+    Validate readings without looking anything up and queue the valid ones
+    (devices/spool.py). Patient ids are checked when it is drained,
+    except for bound devices whose readings are queued under their patient.
+    Returns per-reading results.
+    """
+    if device.patient_id:
+        bound_patient = str(device.patient.user_id)
+    results, accepted = [], []
+    for index, reading in enumerate(readings):
+        if not isinstance(reading, dict):
+            results.append({"index": index, "status": "error", "detail": "Invalid reading"})
+            continue
+        try:
+            pid = reading.get("patient_user_id", default_patient)
+            if device.patient_id:
+                patients.patient_for(device, pid)
+                reading = dict(reading, patient_user_id=bound_patient)
+            elif not pid:
+                raise ValueError("Missing patient_user_id")
+            meas = build_measurement(device.id, reading)
+        except ValueError as e:
+            results.append({"index": index, "status": "error", "detail": str(e)})
+            continue
+        # Pin the timestamp now so a late drain doesn't shift it
+        accepted.append(dict(reading, timestamp=meas.timestamp.isoformat()))
+        results.append({"index": index, "status": "queued", "recommendations": recommendations(meas)})
+    if accepted:
+        spool.append(device.id, accepted, default_patient, timezone.now())
+    return results
+
+
+FORM_CONTENT_TYPES = ("application/x-www-form-urlencoded", "multipart/form-data")
+
+
+async def _read_upload(request):
+    """
+    Authenticate the device and parse the body: JSON, or a form post (one
+    reading, as the DRF views accepted it).
+    Returns (device, payload, None) or (None, None, error response).
+    """
+    if not request_token(request):
+        return None, None, JsonResponse({"detail":"Missing device auth"}, status=401)
+    device = await adevice_for_token(request_token(request))
+    if device is None:
+        return None, None, JsonResponse({"detail":"Invalid device token"}, status=401)
+    if request.content_type in FORM_CONTENT_TYPES:
+        return device, request.POST.dict(), None
     try:
-        device = Device.objects.get(token=token)
-    except Device.DoesNotExist:
-        return Response({"detail":"Invalid device token"}, status=status.HTTP_401_UNAUTHORIZED)
+        payload = json.loads(request.body or b"null")
+    except ValueError:
+        return None, None, JsonResponse({"detail":"Invalid JSON"}, status=400)
+    return device, payload, None
 
-    # Get patient data
-    payload = request.data
-    patient_id = payload.get("patient_user_id")
-    if not patient_id:
-        return Response({"detail":"Missing patient_user_id"}, status=status.HTTP_400_BAD_REQUEST)
 
+def _store(entries, bound_devices):
+    # Runs on a pool thread, where Django doesn't manage connections, so do
+    # what its request_started/request_finished handlers would
+    close_old_connections()
     try:
-        patient_profile = PatientProfile.objects.get(user__id=patient_id)
-    except PatientProfile.DoesNotExist:
-        return Response({"detail":"Patient not found"}, status=status.HTTP_400_BAD_REQUEST)
+        return store_readings(entries, bound_devices=bound_devices)
+    finally:
+        close_old_connections()
 
-    # Parse timestamp
-    ts = payload.get("timestamp")
-    try:
-        dt = parse_datetime(ts) if ts else None
-        if dt is None:
-            dt = timezone.now()
-    except:
-        dt = timezone.now()
 
-    # Create measurement with MAX30102 data
-    try:
-        meas = Measurement.objects.create(
-            patient=patient_profile,
-            timestamp=dt,
-            heart_rate=payload.get("heart_rate"),
-            spo2=payload.get("spo2"),
-            temperature=payload.get("temperature"),
-            device_id=str(device.id),
-            raw_ppg=payload.get("raw_ppg", None),
-            systolic_bp=payload.get("systolic_bp"),  # Optional BP data
-            diastolic_bp=payload.get("diastolic_bp"),  # Optional BP data
-            note=payload.get("note","")
-        )
+# The write is one self-contained transaction, so it doesn't need the
+# request's thread: concurrent uploads write in parallel on pool threads
+_astore = sync_to_async(_store, thread_sensitive=False)
 
-        # Update device last seen
-        device.last_seen = timezone.now()
-        device.save(update_fields=["last_seen"])
 
-        # Generate recommendations based on WHO standards
-        recs = []
-        
-        # SpO2 checks
-        try:
-            if meas.spo2 is not None:
-                spo2 = float(meas.spo2)
-                if spo2 < 92:
-                    recs.append("Low SpO₂ detected — seek medical attention.")
-                elif spo2 < 95:
-                    recs.append("Borderline SpO₂ — rest and re-check.")
-        except:
-            pass
-
-        # Heart rate checks
-        try:
-            if meas.heart_rate is not None:
-                hr = float(meas.heart_rate)
-                if hr > 120:
-                    recs.append("High heart rate — rest and consult doctor if persists.")
-                elif hr < 45:
-                    recs.append("Low heart rate — seek medical advice.")
-        except:
-            pass
-
-        # Blood pressure checks
-        if meas.systolic_bp and meas.diastolic_bp:
-            bp_category = meas.bp_category
-            if bp_category == "Stage 2 Hypertension":
-                recs.append("HIGH BLOOD PRESSURE ALERT: Seek immediate medical attention.")
-            elif bp_category == "Stage 1 Hypertension":
-                recs.append("Blood pressure elevated - schedule doctor consultation.")
+# The device endpoints are async so a slow upload doesn't hold a worker
+# under ASGI; production serves them from sync WSGI workers, which measured
+# faster for these short writes (see gunicorn.conf.py). The token lookup is cached and async; the write
+# itself is one transaction, which runs as a single hop through _astore.
 
-        return Response({
-            "status": "ok",
-            "measurement_id": str(meas.id),
-            "recommendations": recs
-        }, status=status.HTTP_201_CREATED)
+@csrf_exempt  # devices authenticate with their token header
+@require_POST
+async def ingest(request):
+    device, payload, error = await _read_upload(request)
+    if error:
+        return error
+    if not isinstance(payload, dict):
+        return JsonResponse({"detail":"Invalid reading"}, status=400)
+
+    # Get patient data
+    patient_id = payload.get("patient_user_id")
+    if not patient_id and not device.patient_id:
+        return JsonResponse({"detail":"Missing patient_user_id"}, status=400)
+
+    if _spooling():
+        result = (await sync_to_async(_spool_readings)(device, [payload]))[0]
+        if result["status"] != "queued":
+            return JsonResponse({"detail": result["detail"]}, status=400)
+        return JsonResponse({
+            "status": "queued",
+            "recommendations": result["recommendations"]
+        }, status=202)
+
+    # Validate, save and update the snapshot, rollups and last_seen
+    try:
+        result = (await _astore([(device.id, payload, None)], [device]))[0]
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    if result["status"] != "ok":
+        return JsonResponse({"detail": result["detail"]}, status=400)
+    return JsonResponse({
+        "status": "ok",
+        "measurement_id": result["measurement_id"],
+        "recommendations": result["recommendations"]
+    }, status=201)
+
+
+@csrf_exempt  # devices authenticate with their token header
+@require_POST
+async def ingest_batch(request):
+    """
+    Accept many readings in one request. The body is either a list of
+    readings or {"patient_user_id": ..., "readings": [...]}; a top-level
+    patient_user_id is used for readings that don't carry their own.
+    The device is authenticated once, patients are resolved in one query
+    (none for a device bound to a patient) and all valid readings are written with a single bulk_create.
+    """
+    device, payload, error = await _read_upload(request)
+    if error:
+        return error
+
+    if isinstance(payload, list):
+        readings, default_patient = payload, None
+    elif isinstance(payload, dict):
+        readings, default_patient = payload.get("readings"), payload.get("patient_user_id")
+    else:
+        readings = None
+    if not isinstance(readings, list) or not readings:
+        return JsonResponse({"detail":"Missing readings"}, status=400)
+    max_batch = getattr(settings, "DEVICE_INGEST_BATCH_MAX", 1000)
+    if len(readings) > max_batch:
+        return JsonResponse({"detail":f"Too many readings (max {max_batch})"}, status=400)
+
+    if _spooling():
+        results = await sync_to_async(_spool_readings)(device, readings, default_patient)
+        queued = sum(r["status"] == "queued" for r in results)
+        return JsonResponse({
+            "status": "queued" if queued else "error",
+            "queued": queued,
+            "failed": len(readings) - queued,
+            "results": results,
+        }, status=202 if queued else 400)
 
+    try:
+        results = await _astore([(device.id, reading, default_patient) for reading in readings], [device])
     except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({"error": str(e)}, status=500)
+
+    created = sum(r["status"] == "ok" for r in results)
+    return JsonResponse({
+        "status": "ok" if created else "error",
+        "created": created,
+        "failed": len(readings) - created,
+        "results": results,
+    }, status=201 if created else 400)
 
 
 
@@ -0,0 +1,39 @@
+# health_project/gunicorn.conf.py
+"""
+Gunicorn settings for the web and live processes (picked up automatically
+from the working directory).
+
+The web process serves the site as WSGI with sync workers. Measured with
+``manage.py bench_ingest_concurrency`` (one worker, one CPU, SQLite, 2s
+uploads every 5s), sync WSGI sustained 400 devices at a p95 of 0.2s where
+uvicorn workers managed 300 at up to 1s: an ingest request is a short
+database write, and the kernel buffers a slow body before a sync worker
+picks it up.
+
+The live dashboard stream (/api/live/) holds its connection open, which
+would pin a sync worker each, so the ``live`` process serves it as ASGI
+with uvicorn workers (see the Procfile); route /api/live/ to it at the
+proxy. Events reach it from every process through PostgreSQL NOTIFY
+(measurements/events.py).
+
+    gunicorn health_project.wsgi:application          # web (Procfile)
+    gunicorn health_project.asgi:application -k uvicorn_worker.UvicornWorker  # live
+    uvicorn health_project.asgi:application --reload  # local development, everything
+
+To repeat the comparison, run one of each and point
+``manage.py bench_ingest_concurrency`` at it:
+
+    gunicorn health_project.wsgi:application --workers 1 --bind 127.0.0.1:8000
+    gunicorn health_project.asgi:application -k uvicorn_worker.UvicornWorker --workers 1 --bind 127.0.0.1:8001
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "sync"
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Worker heartbeat, not a request limit: open event streams are fine
+timeout = 60
+graceful_timeout = 20
+keepalive = 5
+errorlog = "-"
@@ -2,6 +2,8 @@
 ASGI config for health_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The live process serves it (see gunicorn.conf.py): the dashboard stream
+(/api/live/) needs it.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -0,0 +1,25 @@
+# health_project/health_project/middleware.py
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.utils.decorators import sync_and_async_middleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+@sync_and_async_middleware
+def static_files(get_response):
+    """
+    WhiteNoise for both WSGI and ASGI. WhiteNoiseMiddleware is sync-only, so
+    under ASGI Django would run every request below it on the single sync
+    thread; here only requests for static files go through WhiteNoise.
+    """
+    if not iscoroutinefunction(get_response):
+        return WhiteNoiseMiddleware(get_response)
+
+    whitenoise = WhiteNoiseMiddleware(async_to_sync(get_response))
+    serve = sync_to_async(whitenoise)
+
+    async def middleware(request):
+        if request.path_info.startswith(whitenoise.static_prefix):
+            return await serve(request)
+        return await get_response(request)
+
+    return middleware
@@ -51,7 +51,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "health_project.middleware.static_files",  # WhiteNoise, ASGI-friendly
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -176,6 +176,67 @@ STATICFILES_DIRS = [
 
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# Raw PPG waveform storage (see measurements/ppg.py): "packed" (int16/int32
+# samples, read in place), "compressed" (delta encoded and zlib-compressed,
+# smaller but copied on every read) or "json"
+PPG_STORAGE = os.getenv("PPG_STORAGE", "packed")
+PPG_SAMPLE_RATE = int(os.getenv("PPG_SAMPLE_RATE", 100))
+
+# Device ingest: "direct" writes readings to the database inside the request;
+# "spool" queues them in the QueuedUpload table, answers 202 and leaves the
+# writes to `manage.py drain_ingest_spool` (the Procfile's `ingest` process).
+# Spool mode needs that worker running, or the command scheduled, so keep
+# "direct" on hosts without one, like the serverless deploy in vercel.json.
+DEVICE_INGEST_MODE = os.getenv("DEVICE_INGEST_MODE", "direct")
+
+# Device.last_seen is kept in the cache and written back in bulk at most
+# this often (see devices/presence.py). Point REDIS_URL at a shared cache
+# so every worker process, and the admin, sees the same fresh values.
+DEVICE_LAST_SEEN_FLUSH_SECONDS = int(os.getenv("DEVICE_LAST_SEEN_FLUSH_SECONDS", 30))
+
+# In-process device token cache (devices/auth.py). Unknown tokens are
+# remembered for the shorter negative TTL.
+DEVICE_TOKEN_CACHE_SIZE = 1024
+DEVICE_TOKEN_CACHE_TTL = 60
+DEVICE_TOKEN_NEGATIVE_TTL = 10
+
+# In-process patient_user_id -> PatientProfile cache (devices/patients.py)
+PATIENT_CACHE_SIZE = 10000
+PATIENT_CACHE_TTL = 600
+PATIENT_NEGATIVE_TTL = 10
+
+# Cached doctor dashboard rows (measurements/summaries.py), keyed on
+# updated_at stamps in the database; entries for old versions expire
+DOCTOR_SUMMARY_CACHE_TTL = 600
+
+# Cached fragments of the patient dashboard, keyed on per-patient data
+# versions read from the database (measurements/fragments.py)
+PATIENT_DASHBOARD_CACHE_TTL = 600
+
+# Raw readings older than this are moved into compressed MeasurementArchive
+# chunks by `manage.py archive_measurements`; hourly/daily rollups are kept.
+# On PostgreSQL `manage.py partition_measurements` keeps monthly partitions
+# ready this many months ahead (see measurements/partitions.py).
+MEASUREMENT_RETENTION_DAYS = int(os.getenv("MEASUREMENT_RETENTION_DAYS", 180))
+MEASUREMENT_ARCHIVE_CHUNK_SIZE = 5000
+MEASUREMENT_PARTITION_MONTHS_AHEAD = 3
+
+# Live dashboard updates over Server-Sent Events (measurements/events.py)
+LIVE_EVENTS_HEARTBEAT = 15
+LIVE_EVENTS_QUEUE_SIZE = 100
+# Events reach every process through PostgreSQL LISTEN/NOTIFY. LISTEN holds
+# a session, which the transaction pooler on PORT can't: the listener
+# connects to the session pooler instead
+LIVE_EVENTS_LISTEN_PORT = int(os.getenv("DB_LISTEN_PORT", 5432))
+
+if os.getenv("REDIS_URL"):
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache",
+                          "LOCATION": os.getenv("REDIS_URL")}}
+else:
+    # The default of 300 entries is too few for a row per patient
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                          "OPTIONS": {"MAX_ENTRIES": 20000}}}
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR/"media"
 
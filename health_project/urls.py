@@ -18,7 +18,11 @@ urlpatterns = [
     path('patient/symptom/submit/', meas_views.submit_symptom, name='submit-symptom'),
     # AJAX endpoints for charts / calendar:
     path("api/patient/measurements/", meas_views.patient_measurements_json, name="api-patient-measurements"),
+    path("api/patient/export/", meas_views.patient_export, name="api-patient-export"),
+    path("api/live/", meas_views.live_events, name="api-live-events"),
     path("api/doctor/patients/", meas_views.doctor_patients_json, name="api-doctor-patients"),
+    path("api/doctor/alerts/", meas_views.doctor_alerts_json, name="api-doctor-alerts"),
+    path("api/doctor/patient-detail/", meas_views.doctor_patient_detail_json, name="api-doctor-patient-detail"),
     path("api/patient/symptoms/", meas_views.patient_symptoms_json, name="patient-symptoms-json"),
     path('patient/menstrual/record/', meas_views.record_menstrual_cycle, name='record-menstrual'),  # Add this line
 # urls.py
@@ -1,7 +1,10 @@
 # health_project/measurements/admin.py
 
 from django.contrib import admin
-from .models import PatientProfile, Measurement, Symptom
+from .models import PatientProfile, Measurement, Symptom, LatestVitals, VitalsRollup, MeasurementArchive
 admin.site.register(PatientProfile)
 admin.site.register(Measurement)
 admin.site.register(Symptom)
+admin.site.register(LatestVitals)
+admin.site.register(VitalsRollup)
+admin.site.register(MeasurementArchive)
@@ -0,0 +1,257 @@
+# health_project/measurements/events.py
+"""
+Live updates for the dashboards: a publish/subscribe broker and the
+Server-Sent Events stream built on it.
+
+Ingest publishes one event per new measurement once its transaction has
+committed (``publish_measurements``). Each open dashboard holds a
+``Subscription`` to the patients it shows (the patient their own profile,
+a doctor every assigned patient) and every event for a patient is fanned
+out to all of its subscribers. Publishing is thread-safe and never
+blocks: events are handed to each subscriber's event loop and a
+subscriber that falls behind loses its oldest events rather than holding
+up ingest.
+
+On PostgreSQL events travel between processes with NOTIFY, sent in the
+ingest transaction so they go out when it commits, from any process
+(web workers, ``drain_ingest_spool``). Every process serving streams
+LISTENs on one connection of its own (``_listen``) and feeds its broker.
+LISTEN needs a session connection, which the transaction pooler can't
+provide: it connects to LIVE_EVENTS_LISTEN_PORT. Other databases (SQLite
+in development) publish in-process only.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+
+from . import rules
+
+CHANNEL = "live_measurements"
+
+_listener = None
+_listener_lock = threading.Lock()
+_stopping = threading.Event()
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, broker, topics, maxsize):
+        self.broker = broker
+        self.topics = frozenset(topics)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def _deliver(self, event):
+        # Runs on the subscriber's loop
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """The next event, or None if none arrives within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def update(self, topics):
+        """Follow ``topics`` instead of the current ones."""
+        self.broker.resubscribe(self, topics)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # topic -> set of Subscription
+
+    def subscribe(self, topics, maxsize=None):
+        """Subscribe the running event loop to ``topics`` (patient profile ids)."""
+        sub = Subscription(self, topics, maxsize or getattr(settings, "LIVE_EVENTS_QUEUE_SIZE", 100))
+        with self._lock:
+            for topic in sub.topics:
+                self._subscribers.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for topic in sub.topics:
+                subs = self._subscribers.get(topic)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[topic]
+
+    def resubscribe(self, sub, topics):
+        topics = frozenset(topics)
+        with self._lock:
+            for topic in sub.topics - topics:
+                subs = self._subscribers.get(topic)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[topic]
+            for topic in topics - sub.topics:
+                self._subscribers.setdefault(topic, set()).add(sub)
+            sub.topics = topics
+
+    def has_subscribers(self, topic):
+        return topic in self._subscribers
+
+    def publish(self, topic, event):
+        """Fan ``event`` out to every subscriber of ``topic``. Safe from any thread."""
+        with self._lock:
+            subs = list(self._subscribers.get(topic, ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._deliver, event)
+            except RuntimeError:  # the subscriber's loop has closed
+                self.unsubscribe(sub)
+        return len(subs)
+
+
+broker = Broker()
+
+
+def measurement_event(meas):
+    result = rules.VITALS.evaluate(meas)
+    return {
+        "type": "measurement",
+        "id": str(meas.pk),
+        "patient": meas.patient_id,
+        "timestamp": meas.timestamp,
+        "heart_rate": meas.heart_rate,
+        "spo2": meas.spo2,
+        "temperature": meas.temperature,
+        "systolic_bp": meas.systolic_bp,
+        "diastolic_bp": meas.diastolic_bp,
+        "bp_category": result.label("bp"),
+        "alert_level": result.level_name,
+        "condition": result.condition,
+        "alerts": result.alerts,
+    }
+
+
+def publish_measurements(measurements):
+    """Publish saved ``measurements`` once the current transaction commits."""
+    if connection.vendor == "postgresql":
+        # Delivered to every listening process at commit, and dropped on rollback
+        payloads = [json.dumps(measurement_event(meas), cls=DjangoJSONEncoder, separators=(",", ":"))
+                    for meas in measurements]
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+                           [CHANNEL, payloads])
+        return
+
+    def send():
+        for meas in measurements:
+            # Most patients have nobody watching; skip building their events
+            if broker.has_subscribers(meas.patient_id):
+                broker.publish(meas.patient_id, measurement_event(meas))
+    transaction.on_commit(send)
+
+
+def _listen_connection():
+    db = connections[DEFAULT_DB_ALIAS]
+    params = db.get_connection_params()
+    port = getattr(settings, "LIVE_EVENTS_LISTEN_PORT", None)
+    if port:
+        params["port"] = port
+    conn = db.Database.connect(**params)
+    conn.autocommit = True
+    return conn
+
+
+def _listen():
+    """Feed NOTIFY events from every process to this process's broker, reconnecting on errors."""
+    idle = 4 * getattr(settings, "LIVE_EVENTS_HEARTBEAT", 15)
+    while not _stopping.is_set():
+        conn = None
+        try:
+            conn = _listen_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+                while not _stopping.is_set():
+                    if not select.select([conn], [], [], idle)[0]:
+                        cursor.execute("SELECT 1")  # notice a dead connection
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        event = json.loads(conn.notifies.pop(0).payload)
+                        broker.publish(event["patient"], event)
+        except Exception:
+            logger.exception("Listening for live events failed; reconnecting")
+            _stopping.wait(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def _start_listener():
+    global _listener
+    if connection.vendor != "postgresql":
+        return
+    if _listener is None or not _listener.is_alive():
+        with _listener_lock:
+            if _listener is None or not _listener.is_alive():
+                _stopping.clear()
+                _listener = threading.Thread(target=_listen, name="live-events-listen", daemon=True)
+                _listener.start()
+
+
+def _stop_listener():
+    """Stop listening and close the connection (processes just exit; tests need the database back)."""
+    _stopping.set()
+    if _listener is not None:
+        _listener.join()
+
+
+def sse(event):
+    """Encode ``event`` as one Server-Sent Events message."""
+    data = json.dumps(event, cls=DjangoJSONEncoder, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+async def stream(following):
+    """
+    SSE body following the patients returned by ``following``, an async
+    callable giving a map of profile id to the patient user id the
+    dashboards know them by. It is called again every LIVE_EVENTS_HEARTBEAT
+    seconds, so patients assigned after the stream opened show up (and
+    unassigned ones stop). Subscribes when the response starts and
+    unsubscribes when the client goes away. Sends a comment line when
+    there has been no event for a heartbeat so proxies keep the
+    connection open.
+    """
+    heartbeat = getattr(settings, "LIVE_EVENTS_HEARTBEAT", 15)
+    patients = await following()
+    _start_listener()
+    subscription = broker.subscribe(patients)
+    refreshed = time.monotonic()
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            event = await subscription.get(heartbeat)
+            if time.monotonic() - refreshed >= heartbeat:
+                patients = await following()
+                subscription.update(patients)
+                refreshed = time.monotonic()
+            if event is None:
+                yield ": ping\n\n"
+                continue
+            if event["patient"] in patients:
+                yield sse(dict(event, patient_user_id=patients[event["patient"]]))
+    finally:
+        subscription.close()
@@ -0,0 +1,187 @@
+# health_project/measurements/export.py
+"""
+Streaming export of a patient's full history (measurements, symptoms,
+tooltips and menstrual cycles) as NDJSON or CSV.
+
+Readings moved into MeasurementArchive chunks by ``archive_measurements``
+come first, a chunk at a time, then the rows still in the tables. Those
+are read in fixed-size keyset chunks (ordered by time, then id) and
+written out as they arrive, so memory use is the same for a week or for
+years of history. Keyset chunks are used rather than ``.iterator()``
+because the production database sits behind a transaction-mode pooler,
+where server-side cursors can't be held across statements.
+
+Under ASGI a response must stream from an async iterator: Django reads a
+plain generator to the end in a thread before sending anything, which
+would hold the whole export in memory. ``astream`` is the async version
+of ``stream`` for that case, reading the same chunks through the async ORM.
+"""
+import csv
+import io
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from . import partitions
+from .models import Measurement, MeasurementArchive, MenstrualCycle, Symptom, ToolTip
+
+CHUNK_SIZE = 2000
+
+# record type -> (model, time field, exported fields)
+SECTIONS = {
+    "measurement": (Measurement, "timestamp", (
+        "device_id", "heart_rate", "spo2", "temperature", "systolic_bp", "diastolic_bp",
+        "alert_level", "alert_flags", "ppg_heart_rate", "ppg_hrv_rmssd", "ppg_spo2", "ppg_quality", "note")),
+    "symptom": (Symptom, "created_at", ("symptom_type", "severity")),
+    "tooltip": (ToolTip, "created_at", ("symptom_id", "message")),
+    "menstrual_cycle": (MenstrualCycle, "start_date", (
+        "end_date", "cycle_length", "flow_intensity", "pain_level", "notes")),
+}
+CSV_COLUMNS = ["type", "id", "time"] + list(dict.fromkeys(
+    f for _, _, fields in SECTIONS.values() for f in fields))
+
+
+def _pages(profile, start, end, chunk_size):
+    """
+    For each record type: (type, time field, first page queryset, next(last)
+    returning the queryset for the page after ``last``).
+    """
+    for kind, (model, time_field, fields) in SECTIONS.items():
+        qs = model.objects.filter(patient=profile)
+        if start:
+            qs = qs.filter(**{f"{time_field}__gte": start})
+        if end:
+            qs = qs.filter(**{f"{time_field}__lt": end})
+        qs = qs.order_by(time_field, "id").values("id", time_field, *fields)
+
+        def after(last, qs=qs, time_field=time_field):
+            return qs.filter(Q(**{f"{time_field}__gt": last[0]}) |
+                             Q(**{time_field: last[0], "id__gt": last[1]}))[:chunk_size]
+
+        yield kind, time_field, qs[:chunk_size], after
+
+
+def _archives(profile, start, end):
+    """Ids of the archive chunks holding ``profile``'s readings in the window, oldest first."""
+    qs = MeasurementArchive.objects.filter(patient=profile)
+    if start:
+        qs = qs.filter(end__gte=start)
+    if end:
+        qs = qs.filter(start__lt=end)
+    if partitions.supported() and partitions.is_partitioned():
+        # A partition that couldn't be dropped still holds its readings
+        qs = qs.exclude(partition__in=[name for name, _, _ in partitions.partitions()])
+    return list(qs.order_by("start", "id").values_list("id", flat=True))
+
+
+def _archived(archive, start, end):
+    """The readings of ``archive`` in the window as export rows, oldest first."""
+    fields = SECTIONS["measurement"][2]
+    rows = [{"id": m.id, "time": m.timestamp, **{name: getattr(m, name) for name in fields}}
+            for m in archive.measurements()
+            if not (start and m.timestamp < start) and not (end and m.timestamp >= end)]
+    return sorted(rows, key=lambda row: (row["time"], row["id"]))
+
+
+def records(profile, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Yield (type, row dict) for every record of ``profile``, oldest first per type."""
+    for pk in _archives(profile, start, end):
+        for row in _archived(MeasurementArchive.objects.get(pk=pk), start, end):
+            yield "measurement", row
+    for kind, time_field, page, after in _pages(profile, start, end, chunk_size):
+        while True:
+            rows = list(page)
+            for row in rows:
+                row["time"] = row.pop(time_field)
+                yield kind, row
+            if len(rows) < chunk_size:
+                break
+            page = after((rows[-1]["time"], rows[-1]["id"]))
+
+
+async def arecords(profile, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """``records`` for async code: each chunk is one query through the async ORM."""
+    for pk in await sync_to_async(_archives)(profile, start, end):
+        archive = await MeasurementArchive.objects.aget(pk=pk)
+        for row in await sync_to_async(_archived)(archive, start, end):
+            yield "measurement", row
+    for kind, time_field, page, after in _pages(profile, start, end, chunk_size):
+        while True:
+            rows = [row async for row in page]
+            for row in rows:
+                row["time"] = row.pop(time_field)
+                yield kind, row
+            if len(rows) < chunk_size:
+                break
+            page = after((rows[-1]["time"], rows[-1]["id"]))
+
+
+class NDJSONWriter:
+    """Buffers records and hands back NDJSON text every 500 of them."""
+
+    def __init__(self):
+        self.encoder = DjangoJSONEncoder(separators=(",", ":"))
+        self.lines = []
+
+    def write(self, kind, row):
+        self.lines.append(self.encoder.encode({"type": kind, **row}))
+        if len(self.lines) >= 500:
+            return self.flush()
+        return None
+
+    def flush(self):
+        text = "\n".join(self.lines) + "\n" if self.lines else ""
+        self.lines = []
+        return text
+
+
+class CSVWriter:
+    """Buffers records and hands back CSV text (header first) every 64 KiB."""
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.DictWriter(self.buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, kind, row):
+        row["type"] = kind
+        row["time"] = row["time"].isoformat()
+        self.writer.writerow(row)
+        if self.buffer.tell() > 64 * 1024:
+            return self.flush()
+        return None
+
+    def flush(self):
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return text
+
+
+WRITERS = {"ndjson": NDJSONWriter, "csv": CSVWriter}
+FORMATS = tuple(WRITERS)
+
+
+def stream(profile, fmt, start=None, end=None):
+    """The export as a generator of text chunks, for WSGI."""
+    writer = WRITERS[fmt]()
+    for kind, row in records(profile, start, end):
+        text = writer.write(kind, row)
+        if text:
+            yield text
+    text = writer.flush()
+    if text:
+        yield text
+
+
+async def astream(profile, fmt, start=None, end=None):
+    """The export as an async generator of text chunks, for ASGI."""
+    writer = WRITERS[fmt]()
+    async for kind, row in arecords(profile, start, end):
+        text = writer.write(kind, row)
+        if text:
+            yield text
+    text = writer.flush()
+    if text:
+        yield text
@@ -0,0 +1,61 @@
+# health_project/measurements/fragments.py
+"""
+Data versions for the patient dashboard's cached template fragments
+({% cache %} blocks in patient_dashboard.html).
+
+Each patient has one version per section of their data (vitals, symptoms,
+menstrual cycles, tooltips). Fragments are keyed on the versions of the
+data they show, so a repeat visit renders them from the cache without
+loading that data. Readings arrive every second, so a single version per
+patient would also throw away the symptom and tooltip fragments on every
+reading.
+
+Versions are read from the database along with the profile
+(``with_versions``): the vitals snapshot's ``updated_at``, the count and
+newest id of symptoms and tooltips, and the count and newest
+``updated_at`` of menstrual cycles. A change made by any process, such as
+process_ppg filling in vitals, shows up on the next visit, whatever the
+cache backend.
+"""
+from django.db.models import Count, Max, OuterRef, Subquery
+
+from . import rules
+from .models import MenstrualCycle, Symptom, ToolTip
+
+SECTIONS = ("vitals", "symptoms", "cycles", "tooltips")
+
+# Fragments hold rule output (recommendations), so new rules mean new versions
+PREFIX = f"{rules.VITALS.fingerprint}{rules.CYCLE.fingerprint}"
+
+# section -> (model, field whose newest value moves on every change)
+STAMPED = {
+    "symptoms": (Symptom, "id"),
+    "cycles": (MenstrualCycle, "updated_at"),
+    "tooltips": (ToolTip, "id"),
+}
+
+
+def _aggregate(model, function):
+    rows = model.objects.filter(patient=OuterRef("pk")).order_by().values("patient")
+    return Subquery(rows.annotate(value=function).values("value")[:1])
+
+
+def with_versions(profiles):
+    """Annotate a PatientProfile queryset with what ``data_versions`` reads."""
+    annotations = {}
+    for section, (model, field) in STAMPED.items():
+        annotations[f"{section}_count"] = _aggregate(model, Count("id"))
+        annotations[f"{section}_newest"] = _aggregate(model, Max(field))
+    return profiles.annotate(**annotations)
+
+
+def data_versions(profile):
+    """{section: version} for a profile loaded through ``with_versions``."""
+    vitals = profile.vitals
+    versions = {"vitals": f"{PREFIX}:{vitals.updated_at.isoformat() if vitals else '-'}"}
+    for section in STAMPED:
+        newest = getattr(profile, f"{section}_newest")
+        if hasattr(newest, "isoformat"):
+            newest = newest.isoformat()
+        versions[section] = f"{PREFIX}:{getattr(profile, f'{section}_count') or 0}:{newest}"
+    return versions
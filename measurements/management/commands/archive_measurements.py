@@ -0,0 +1,41 @@
+# health_project/measurements/management/commands/archive_measurements.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from measurements import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Move raw measurements older than --days (MEASUREMENT_RETENTION_DAYS) into compressed "
+        "MeasurementArchive chunks, keeping the hourly/daily rollups. On a partitioned PostgreSQL "
+        "table whole months are archived and dropped; elsewhere rows are deleted in chunks. Run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None,
+                            help="Keep this many days of raw readings (default MEASUREMENT_RETENTION_DAYS).")
+        parser.add_argument("--chunk-size", type=int, default=None,
+                            help="Readings per archive chunk (default MEASUREMENT_ARCHIVE_CHUNK_SIZE).")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived.")
+
+    def handle(self, *args, **options):
+        days = options["days"] or getattr(settings, "MEASUREMENT_RETENTION_DAYS", 180)
+        chunk_size = options["chunk_size"] or getattr(settings, "MEASUREMENT_ARCHIVE_CHUNK_SIZE", 5000)
+        if days < 1 or chunk_size < 1:
+            raise CommandError("--days and --chunk-size must be positive")
+
+        if options["dry_run"]:
+            before, count = retention.pending(days)
+            self.stdout.write(f"{count} reading(s) before {before:%Y-%m-%d %H:%M %Z} would be archived.")
+            return
+
+        stats = retention.run(days, chunk_size)
+        for name in stats["dropped"]:
+            self.stdout.write(f"Archived and dropped partition {name}")
+        for name in stats["kept"]:
+            self.stdout.write(self.style.WARNING(
+                f"Partition {name} changed while it was archived; it will be archived again next run."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {stats['rows']} reading(s) before {stats['before']:%Y-%m-%d %H:%M %Z} "
+            f"into {stats['chunks']} chunk(s), {stats['bytes'] / 1024:.1f} KiB compressed."))
@@ -0,0 +1,183 @@
+# health_project/measurements/management/commands/bench_measurement_indexes.py
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from measurements.models import PatientProfile, Measurement, Symptom, MenstrualCycle, ToolTip
+from users.models import User
+
+BENCH_ALIAS = "bench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway local database with synthetic history and report query "
+        "plans and latencies for the per-patient access paths with and without "
+        "the composite (patient, -timestamp) style indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2_000_000,
+                            help="Number of measurements to seed (default 2,000,000).")
+        parser.add_argument("--patients", type=int, default=500)
+        parser.add_argument("--runs", type=int, default=50,
+                            help="Timed executions per query.")
+        parser.add_argument("--path", help="SQLite file to use (default: a temp file).")
+        parser.add_argument("--database", help=(
+            "Use this configured database alias instead of a temporary SQLite file, "
+            "e.g. a local Postgres. It must be an empty scratch database."))
+        parser.add_argument("--keep", action="store_true", help="Keep the SQLite file afterwards.")
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        path = None
+        if alias:
+            if alias not in connections.databases:
+                raise CommandError(f"Unknown database alias {alias!r}")
+        else:
+            alias = BENCH_ALIAS
+            path = options["path"] or os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+            connections.databases[alias] = {
+                **connections.databases["default"],
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": path,
+            }
+        call_command("migrate", database=alias, verbosity=0)
+        if PatientProfile.objects.using(alias).exists():
+            raise CommandError(f"Database {alias!r} already contains patients; use an empty one.")
+
+        try:
+            patient_ids = self.seed(alias, options["patients"], options["rows"])
+            samples = random.Random(1).choices(patient_ids, k=options["runs"])
+
+            self.set_indexes(alias, enabled=False)
+            before = self.measure(alias, samples)
+            self.set_indexes(alias, enabled=True)
+            after = self.measure(alias, samples)
+
+            self.stdout.write("\nSummary (median ms, before -> after):")
+            for name in before:
+                b, a = before[name], after[name]
+                self.stdout.write(f"  {name:<28} {b:9.3f} -> {a:9.3f}  ({b / a if a else float('inf'):.1f}x)")
+        finally:
+            connections[alias].close()
+            if path and not options["keep"]:
+                os.remove(path)
+            elif path:
+                self.stdout.write(f"Database kept at {path}")
+
+    def seed(self, alias, patients, rows):
+        self.stdout.write(f"Seeding {patients} patients and {rows:,} measurements into {alias!r}...")
+        started = time.perf_counter()
+        users = User.objects.using(alias).bulk_create([
+            User(username=f"bench-patient-{i}", is_patient=True) for i in range(patients)
+        ])
+        profiles = PatientProfile.objects.using(alias).bulk_create([
+            PatientProfile(user=u, gender="MF"[i % 2]) for i, u in enumerate(users)
+        ])
+        ids = [p.pk for p in profiles]
+
+        rng = random.Random(0)
+        now = timezone.now()
+        table = Measurement._meta.db_table
+        columns = ["patient_id", "timestamp", "heart_rate", "spo2", "temperature",
+                   "systolic_bp", "diastolic_bp"]
+        connection = connections[alias]
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            connection.ops.quote_name(table),
+            ", ".join(connection.ops.quote_name(c) for c in columns),
+            ", ".join(["%s"] * len(columns)),
+        )
+        batch = 20_000
+        for start in range(0, rows, batch):
+            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                cursor.executemany(sql, [
+                    (rng.choice(ids), now - timedelta(seconds=rng.randrange(90 * 86400)),
+                     rng.uniform(45, 130), rng.uniform(88, 100), rng.uniform(36, 39.5),
+                     rng.randint(95, 170), rng.randint(60, 110))
+                    for _ in range(min(batch, rows - start))
+                ])
+
+        for model, field, count in ((Symptom, "created_at", rows // 50),
+                                    (ToolTip, "created_at", rows // 50),
+                                    (MenstrualCycle, "start_date", patients * 24)):
+            objs = []
+            for _ in range(count):
+                when = now - timedelta(seconds=rng.randrange(720 * 86400))
+                if model is Symptom:
+                    obj = Symptom(patient_id=rng.choice(ids), symptom_type="fatigue", severity=3)
+                elif model is ToolTip:
+                    obj = ToolTip(patient_id=rng.choice(ids), message="bench")
+                else:
+                    obj = MenstrualCycle(patient_id=rng.choice(ids), flow_intensity="light", pain_level=2)
+                    when = when.date()
+                setattr(obj, field, when)
+                objs.append(obj)
+            model.objects.using(alias).bulk_create(objs, batch_size=5000)
+            # auto_now_add overwrote created_at; spread it back out
+            if field == "created_at":
+                for obj in objs:
+                    obj.created_at = now - timedelta(seconds=rng.randrange(720 * 86400))
+                model.objects.using(alias).bulk_update(objs, ["created_at"], batch_size=5000)
+
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+        return ids
+
+    def set_indexes(self, alias, enabled):
+        connection = connections[alias]
+        with connection.schema_editor() as editor:
+            for model in (Measurement, Symptom, MenstrualCycle, ToolTip):
+                for index in model._meta.indexes:
+                    if enabled:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def queries(self, alias, patient_id):
+        return {
+            "latest measurement": Measurement.objects.using(alias)
+                .filter(patient_id=patient_id).order_by("-timestamp")[:1],
+            "chart window (500 rows)": Measurement.objects.using(alias)
+                .filter(patient_id=patient_id).order_by("-timestamp")[:500],
+            "recent symptoms (20)": Symptom.objects.using(alias)
+                .filter(patient_id=patient_id).order_by("-created_at")[:20],
+            "recent cycles (10)": MenstrualCycle.objects.using(alias)
+                .filter(patient_id=patient_id).order_by("-start_date")[:10],
+            "latest tooltip": ToolTip.objects.using(alias)
+                .filter(patient_id=patient_id).order_by("-created_at")[:1],
+        }
+
+    def measure(self, alias, samples):
+        label = "with" if Measurement._meta.indexes and self.has_index(alias) else "without"
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {label} composite indexes ==="))
+        medians = {}
+        for name, qs in self.queries(alias, samples[0]).items():
+            self.stdout.write(self.style.MIGRATE_LABEL(name))
+            self.stdout.write("  " + qs.explain().replace("\n", "\n  "))
+            timings = []
+            for patient_id in samples:
+                query = self.queries(alias, patient_id)[name]
+                started = time.perf_counter()
+                list(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            medians[name] = statistics.median(timings)
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(f"  median {medians[name]:.3f} ms, p95 {p95:.3f} ms")
+        return medians
+
+    def has_index(self, alias):
+        with connections[alias].cursor() as cursor:
+            constraints = connections[alias].introspection.get_constraints(
+                cursor, Measurement._meta.db_table)
+        return Measurement._meta.indexes[0].name in constraints
@@ -0,0 +1,49 @@
+# health_project/measurements/management/commands/partition_measurements.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from measurements import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Create monthly partitions of the measurement table ahead of time (PostgreSQL only; "
+        "see measurements/partitions.py). With --convert, first partition an existing "
+        "unpartitioned table. Run it at least once a month."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=None,
+                            help="Months of partitions to keep ready (default MEASUREMENT_PARTITION_MONTHS_AHEAD).")
+        parser.add_argument("--convert", action="store_true",
+                            help="Partition the existing table, starting next month.")
+
+    def handle(self, *args, **options):
+        if not partitions.supported():
+            self.stdout.write(self.style.WARNING(
+                f"Partitioning needs PostgreSQL; on {connection.vendor} measurements stay in one table."))
+            return
+        ahead = options["months_ahead"]
+        if ahead is None:
+            ahead = getattr(settings, "MEASUREMENT_PARTITION_MONTHS_AHEAD", 3)
+
+        this_month = partitions.month_start(timezone.now())
+        if not partitions.is_partitioned():
+            if not options["convert"]:
+                raise CommandError(f"{partitions.TABLE} is not partitioned yet; run again with --convert.")
+            first = partitions.next_month(this_month)
+            partitions.convert(first)
+            self.stdout.write(f"Partitioned {partitions.TABLE}; monthly partitions start {first:%Y-%m-%d}.")
+
+        until = this_month
+        for _ in range(ahead):
+            until = partitions.next_month(until)
+        try:
+            created = partitions.ensure(until)
+        except partitions.PartitionError as e:
+            raise CommandError(str(e))
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"Partitions ready through {until:%Y-%m}."))
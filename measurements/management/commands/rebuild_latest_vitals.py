@@ -0,0 +1,20 @@
+# health_project/measurements/management/commands/rebuild_latest_vitals.py
+from django.core.management.base import BaseCommand
+
+from measurements.models import PatientProfile, LatestVitals
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-patient LatestVitals snapshot from measurement history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patient", action="append", dest="patients", metavar="USER_ID",
+                            help="Only rebuild this patient (user id); may be repeated.")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        patients = PatientProfile.objects.all()
+        if options["patients"]:
+            patients = patients.filter(user__id__in=options["patients"])
+        count = LatestVitals.rebuild(patients, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt latest vitals for {count} patient(s)."))
@@ -0,0 +1,25 @@
+# health_project/measurements/management/commands/rebuild_vitals_rollups.py
+from django.core.management.base import BaseCommand, CommandError
+
+from measurements.models import PatientProfile, VitalsRollup
+from measurements.timeseries import TimeSeriesError, parse_when
+
+
+class Command(BaseCommand):
+    help = "Rebuild hourly and daily VitalsRollup rows from raw measurements."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patient", action="append", dest="patients", metavar="USER_ID",
+                            help="Only rebuild this patient (user id); may be repeated.")
+        parser.add_argument("--since", help="Only rebuild buckets from this date/datetime onwards.")
+
+    def handle(self, *args, **options):
+        patients = PatientProfile.objects.all()
+        if options["patients"]:
+            patients = patients.filter(user__id__in=options["patients"])
+        try:
+            since = parse_when(options["since"], "--since")
+        except TimeSeriesError as e:
+            raise CommandError(str(e))
+        count = VitalsRollup.rebuild(patients, since=since)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} rollup row(s)."))
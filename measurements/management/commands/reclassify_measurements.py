@@ -0,0 +1,103 @@
+# health_project/measurements/management/commands/reclassify_measurements.py
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from measurements import rules
+from measurements.models import LatestVitals, Measurement
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute alert_level and alert_flags for every measurement with the current "
+        "clinical rules. Rows are streamed in id order, classified in NumPy batches and "
+        "only changed rows are written back, grouped into bulk UPDATEs, along with the "
+        "latest-vitals snapshots that point at them. Progress is checkpointed so an interrupted "
+        "run picks up where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--checkpoint", default=str(Path(settings.BASE_DIR) / ".reclassify_checkpoint.json"),
+                            help="File recording the last id done (default: %(default)s).")
+        parser.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint.")
+        parser.add_argument("--only-unclassified", action="store_true",
+                            help="Skip rows that already have an alert_level.")
+
+    def handle(self, *args, **options):
+        checkpoint = Path(options["checkpoint"])
+        fingerprint = rules.VITALS.fingerprint
+        last_id = 0 if options["restart"] else self.load_checkpoint(checkpoint, fingerprint)
+        if last_id:
+            self.stdout.write(f"Resuming after id {last_id}")
+
+        qs = Measurement.objects.order_by("id")
+        if options["only_unclassified"]:
+            qs = qs.filter(alert_level__isnull=True)
+        columns = ("id", "alert_level", "alert_flags") + rules.VITALS.metrics
+
+        started = time.perf_counter()
+        seen = changed = 0
+        while True:
+            chunk_started = time.perf_counter()
+            rows = list(qs.filter(id__gt=last_id).values_list(*columns)[:options["chunk_size"]])
+            if not rows:
+                break
+            ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            data = np.array(rows, dtype=np.float64)  # None -> NaN
+            result = rules.VITALS.evaluate_batch(
+                {metric: data[:, 3 + i] for i, metric in enumerate(rules.VITALS.metrics)})
+
+            # Unclassified rows have NaN here, which never compares equal.
+            dirty = (data[:, 1] != result.levels) | (data[:, 2] != result.flags)
+            # Only a handful of distinct (level, flags) pairs occur, so write
+            # one UPDATE ... WHERE id IN (...) per pair instead of per row.
+            groups = {}
+            for pk, level, flags in zip(ids[dirty].tolist(), result.levels[dirty].tolist(),
+                                        result.flags[dirty].tolist()):
+                groups.setdefault((level, flags), []).append(pk)
+            now = timezone.now()
+            with transaction.atomic():
+                for (level, flags), pks in groups.items():
+                    for start in range(0, len(pks), 900):
+                        chunk = pks[start:start + 900]
+                        Measurement.objects.filter(id__in=chunk).update(alert_level=level, alert_flags=flags)
+                        # Keep the snapshots of these readings (and the caches keyed on them) in step
+                        LatestVitals.objects.filter(measurement_id__in=chunk).update(
+                            alert_level=level, alert_flags=flags, updated_at=now)
+            updated = int(dirty.sum())
+
+            last_id = int(ids[-1])
+            self.save_checkpoint(checkpoint, fingerprint, last_id)
+            seen += len(rows)
+            changed += updated
+            elapsed = time.perf_counter() - chunk_started
+            self.stdout.write(f"  up to id {last_id}: {len(rows)} rows, {updated} changed "
+                              f"({len(rows) / elapsed:,.0f} rows/s)")
+
+        checkpoint.unlink(missing_ok=True)
+        elapsed = time.perf_counter() - started
+        rate = seen / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Classified {seen} measurement(s), updated {changed}, in {elapsed:.1f}s ({rate:,.0f} rows/s)."))
+
+    def load_checkpoint(self, path, fingerprint):
+        try:
+            state = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+        if state.get("rules") != fingerprint:
+            self.stdout.write("Rules changed since the checkpoint was written; starting over.")
+            return 0
+        return int(state.get("last_id", 0))
+
+    def save_checkpoint(self, path, fingerprint, last_id):
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"rules": fingerprint, "last_id": last_id}))
+        tmp.replace(path)
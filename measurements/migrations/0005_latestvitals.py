@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_latest_vitals(apps, schema_editor):
+    PatientProfile = apps.get_model('measurements', 'PatientProfile')
+    Measurement = apps.get_model('measurements', 'Measurement')
+    LatestVitals = apps.get_model('measurements', 'LatestVitals')
+    db = schema_editor.connection.alias
+    latest = Measurement.objects.using(db).filter(
+        patient=models.OuterRef('pk')).order_by('-timestamp', '-pk').values('pk')[:1]
+    ids = [pk for pk in PatientProfile.objects.using(db).annotate(latest_id=models.Subquery(latest))
+           .values_list('latest_id', flat=True) if pk is not None]
+    for start in range(0, len(ids), 500):
+        LatestVitals.objects.using(db).bulk_create([
+            LatestVitals(
+                patient_id=m.patient_id, measurement_id=m.pk, timestamp=m.timestamp,
+                heart_rate=m.heart_rate, spo2=m.spo2, temperature=m.temperature,
+                systolic_bp=m.systolic_bp, diastolic_bp=m.diastolic_bp, device_id=m.device_id,
+            )
+            for m in Measurement.objects.using(db).filter(pk__in=ids[start:start + 500])
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0004_measurement_bleeding_intensity_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestVitals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('heart_rate', models.FloatField(blank=True, null=True)),
+                ('spo2', models.FloatField(blank=True, null=True)),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('systolic_bp', models.IntegerField(blank=True, null=True)),
+                ('diastolic_bp', models.IntegerField(blank=True, null=True)),
+                ('device_id', models.CharField(blank=True, max_length=128, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('measurement', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='measurements.measurement')),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='latest_vitals', to='measurements.patientprofile')),
+            ],
+            options={
+                'verbose_name_plural': 'latest vitals',
+            },
+        ),
+        migrations.RunPython(backfill_latest_vitals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0005_latestvitals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['patient', '-timestamp'], name='meas_patient_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menstrualcycle',
+            index=models.Index(fields=['patient', '-start_date'], name='cycle_patient_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='symptom',
+            index=models.Index(fields=['patient', '-created_at'], name='symptom_patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tooltip',
+            index=models.Index(fields=['patient', '-created_at'], name='tooltip_patient_created_idx'),
+        ),
+    ]
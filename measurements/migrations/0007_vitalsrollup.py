@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0006_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('heart_rate_count', models.PositiveIntegerField(default=0)),
+                ('heart_rate_sum', models.FloatField(default=0)),
+                ('heart_rate_min', models.FloatField(blank=True, null=True)),
+                ('heart_rate_max', models.FloatField(blank=True, null=True)),
+                ('heart_rate_out_of_range', models.PositiveIntegerField(default=0)),
+                ('spo2_count', models.PositiveIntegerField(default=0)),
+                ('spo2_sum', models.FloatField(default=0)),
+                ('spo2_min', models.FloatField(blank=True, null=True)),
+                ('spo2_max', models.FloatField(blank=True, null=True)),
+                ('spo2_out_of_range', models.PositiveIntegerField(default=0)),
+                ('temperature_count', models.PositiveIntegerField(default=0)),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('temperature_out_of_range', models.PositiveIntegerField(default=0)),
+                ('systolic_bp_count', models.PositiveIntegerField(default=0)),
+                ('systolic_bp_sum', models.FloatField(default=0)),
+                ('systolic_bp_min', models.FloatField(blank=True, null=True)),
+                ('systolic_bp_max', models.FloatField(blank=True, null=True)),
+                ('systolic_bp_out_of_range', models.PositiveIntegerField(default=0)),
+                ('diastolic_bp_count', models.PositiveIntegerField(default=0)),
+                ('diastolic_bp_sum', models.FloatField(default=0)),
+                ('diastolic_bp_min', models.FloatField(blank=True, null=True)),
+                ('diastolic_bp_max', models.FloatField(blank=True, null=True)),
+                ('diastolic_bp_out_of_range', models.PositiveIntegerField(default=0)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='measurements.patientprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'period', 'bucket_start'), name='rollup_patient_bucket_uniq')],
+            },
+        ),
+    ]
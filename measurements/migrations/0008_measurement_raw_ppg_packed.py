@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:11
+
+from django.db import migrations, models
+
+
+def pack_json_waveforms(apps, schema_editor):
+    from measurements import ppg
+    Measurement = apps.get_model('measurements', 'Measurement')
+    rows = (Measurement.objects.using(schema_editor.connection.alias)
+            .filter(raw_ppg__isnull=False, raw_ppg_packed__isnull=True).only('id', 'raw_ppg'))
+    batch = []
+    for m in rows.iterator(chunk_size=500):
+        try:
+            m.raw_ppg_packed = ppg.encode(m.raw_ppg)
+        except ppg.PPGFormatError:
+            continue  # leave unrecognised payloads as JSON
+        m.raw_ppg = None
+        batch.append(m)
+        if len(batch) >= 500:
+            Measurement.objects.using(schema_editor.connection.alias).bulk_update(batch, ['raw_ppg', 'raw_ppg_packed'])
+            batch = []
+    Measurement.objects.using(schema_editor.connection.alias).bulk_update(batch, ['raw_ppg', 'raw_ppg_packed'])
+
+
+def unpack_waveforms(apps, schema_editor):
+    from measurements import ppg
+    Measurement = apps.get_model('measurements', 'Measurement')
+    rows = (Measurement.objects.using(schema_editor.connection.alias)
+            .filter(raw_ppg_packed__isnull=False).only('id', 'raw_ppg_packed'))
+    batch = []
+    for m in rows.iterator(chunk_size=500):
+        m.raw_ppg = ppg.to_python(m.raw_ppg_packed)
+        batch.append(m)
+        if len(batch) >= 500:
+            Measurement.objects.using(schema_editor.connection.alias).bulk_update(batch, ['raw_ppg'])
+            batch = []
+    Measurement.objects.using(schema_editor.connection.alias).bulk_update(batch, ['raw_ppg'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0007_vitalsrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='raw_ppg_packed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_json_waveforms, unpack_waveforms),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0008_measurement_raw_ppg_packed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='ppg_heart_rate',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='ppg_hrv_rmssd',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='ppg_processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='ppg_quality',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='ppg_spo2',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(condition=models.Q(('ppg_processed_at__isnull', True), ('raw_ppg_packed__isnull', False)), fields=['id'], name='meas_ppg_pending_idx'),
+        ),
+    ]
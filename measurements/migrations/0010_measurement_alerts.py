@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0009_measurement_ppg_derived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='alert_flags',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='alert_level',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+from measurements import rules
+
+
+def classify_latest_vitals(apps, schema_editor):
+    LatestVitals = apps.get_model('measurements', 'LatestVitals')
+    db = schema_editor.connection.alias
+    rows = list(LatestVitals.objects.using(db).all())
+    for row in rows:
+        result = rules.VITALS.evaluate(row)
+        row.alert_level, row.alert_flags = result.level, result.flags
+    LatestVitals.objects.using(db).bulk_update(rows, ['alert_level', 'alert_flags'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0010_measurement_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='latestvitals',
+            name='alert_flags',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='latestvitals',
+            name='alert_level',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='latestvitals',
+            index=models.Index(fields=['patient', 'alert_level', 'timestamp', 'alert_flags'], name='latest_alert_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(condition=models.Q(('alert_level__gte', 2)), fields=['patient', '-timestamp', 'alert_level', 'alert_flags'], name='meas_patient_alerts_idx'),
+        ),
+        migrations.RunPython(classify_latest_vitals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0011_alert_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='latestvitals',
+            name='measurement',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='measurements.measurement'),
+        ),
+        migrations.CreateModel(
+            name='MeasurementArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('rows', models.PositiveIntegerField()),
+                ('before', models.DateTimeField()),
+                ('partition', models.CharField(blank=True, max_length=63)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='measurement_archives', to='measurements.patientprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'start'], name='archive_patient_start_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models, transaction
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+
+from measurements.rules import NORMAL_RANGES
+
+
+def backfill(apps, schema_editor):
+    """
+    Rollups are only kept from when 0007 was deployed, so rebuild them from
+    the raw readings for every patient with readings older than their first
+    rollup. Buckets before the patient's archive horizon are left alone.
+    """
+    PatientProfile = apps.get_model("measurements", "PatientProfile")
+    Measurement = apps.get_model("measurements", "Measurement")
+    VitalsRollup = apps.get_model("measurements", "VitalsRollup")
+    MeasurementArchive = apps.get_model("measurements", "MeasurementArchive")
+
+    aggregates = {"n": models.Count("id")}
+    for metric, (low, high) in NORMAL_RANGES.items():
+        bad = models.Q()
+        if low is not None:
+            bad |= models.Q(**{f"{metric}__lt": low})
+        if high is not None:
+            bad |= models.Q(**{f"{metric}__gte": high})
+        aggregates[f"{metric}_count"] = models.Count(metric)
+        aggregates[f"{metric}_sum"] = Coalesce(models.Sum(metric, output_field=models.FloatField()), 0.0)
+        aggregates[f"{metric}_min"] = models.Min(metric)
+        aggregates[f"{metric}_max"] = models.Max(metric)
+        aggregates[f"{metric}_out_of_range"] = models.Count("id", filter=bad)
+
+    for patient_id in PatientProfile.objects.order_by("pk").values_list("pk", flat=True):
+        readings = Measurement.objects.filter(patient_id=patient_id).order_by()
+        rollups = VitalsRollup.objects.filter(patient_id=patient_id)
+        horizon = MeasurementArchive.objects.filter(patient_id=patient_id).aggregate(h=models.Max("before"))["h"]
+        if horizon is not None:
+            readings = readings.filter(timestamp__gte=horizon)
+            rollups = rollups.filter(bucket_start__gte=horizon)
+        first = rollups.filter(period="hour").aggregate(first=models.Min("bucket_start"))["first"]
+        if first is not None and not readings.filter(timestamp__lt=first).exists():
+            continue
+
+        # One patient at a time, so the rebuild doesn't hold one huge transaction
+        with transaction.atomic():
+            rollups.delete()
+            for period, trunc in (("hour", TruncHour), ("day", TruncDay)):
+                rows = readings.annotate(bucket=trunc("timestamp")).values("bucket").annotate(**aggregates)
+                batch = []
+                for row in rows.iterator():
+                    bucket, n = row.pop("bucket"), row.pop("n")
+                    batch.append(VitalsRollup(patient_id=patient_id, period=period, bucket_start=bucket,
+                                              count=n, **row))
+                    if len(batch) >= 1000:
+                        VitalsRollup.objects.bulk_create(batch)
+                        batch = []
+                VitalsRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('measurements', '0012_measurement_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('measurements', '0014_updated_at_stamps'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='latestvitals',
+            name='latest_alert_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='measurement',
+            name='meas_patient_alerts_idx',
+        ),
+        migrations.AddIndex(
+            model_name='latestvitals',
+            index=models.Index(condition=models.Q(('alert_level__gte', 2)), fields=['patient', 'alert_level', 'timestamp', 'alert_flags'], name='latest_alert_idx'),
+        ),
+    ]
@@ -1,7 +1,18 @@
 # health_project/measurements/models.py
-from django.db import models
+import base64
+import datetime
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDay, TruncHour
 from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import ppg, rules
+from .rules import NORMAL_RANGES, out_of_range
 
 class PatientProfile(models.Model):
     GENDER_CHOICES = [
@@ -16,6 +27,8 @@ class PatientProfile(models.Model):
                                       related_name='patients', on_delete=models.SET_NULL)
     last_menstrual_date = models.DateField(null=True, blank=True)
     has_fibroid_history = models.BooleanField(default=False)
+    # Also moved when the patient's user is edited (see measurements/signals.py)
+    updated_at = models.DateTimeField(auto_now=True)
     
     @property
     def age(self):
@@ -24,6 +37,14 @@ class PatientProfile(models.Model):
             return (today - self.dob).days // 365
         return None
 
+    @property
+    def vitals(self):
+        """The LatestVitals snapshot for this patient, or None."""
+        try:
+            return self.latest_vitals
+        except LatestVitals.DoesNotExist:
+            return None
+
     def __str__(self):
         return self.user.username
 
@@ -42,23 +63,74 @@ class Measurement(models.Model):
                                        choices=[('light', 'Light'), ('moderate', 'Moderate'), ('heavy', 'Heavy')])
     
     raw_ppg = models.JSONField(null=True, blank=True)
+    # Packed waveform (see measurements/ppg.py); replaces raw_ppg when PPG_STORAGE is "packed" or "compressed"
+    raw_ppg_packed = models.BinaryField(null=True, blank=True)
     note = models.TextField(blank=True, null=True)
 
+    # Derived from the waveform by ``manage.py process_ppg``
+    ppg_heart_rate = models.FloatField(null=True, blank=True)
+    ppg_hrv_rmssd = models.FloatField(null=True, blank=True)
+    ppg_spo2 = models.FloatField(null=True, blank=True)
+    ppg_quality = models.FloatField(null=True, blank=True)
+    ppg_processed_at = models.DateTimeField(null=True, blank=True)
+
+    # Classification by the clinical rules (measurements/rules.py): the
+    # highest level matched and the bitmask of matched rules. NULL until
+    # classified; ``manage.py reclassify_measurements`` recomputes them.
+    alert_level = models.PositiveSmallIntegerField(null=True, blank=True)
+    alert_flags = models.BigIntegerField(null=True, blank=True)
+
     class Meta:
         ordering = ("-timestamp",)
+        indexes = [
+            models.Index(fields=["patient", "-timestamp"], name="meas_patient_ts_idx"),
+            models.Index(fields=["id"], name="meas_ppg_pending_idx",
+                         condition=models.Q(raw_ppg_packed__isnull=False, ppg_processed_at__isnull=True)),
+        ]
+
+    def classify(self):
+        """Set alert_level and alert_flags from the clinical rules; returns the Evaluation."""
+        result = rules.VITALS.evaluate(self)
+        self.alert_level, self.alert_flags = result.level, result.flags
+        return result
+
+    def save(self, *args, **kwargs):
+        # Always reclassify, so edited vitals never keep a stale alert level
+        self.classify()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & set(rules.VITALS.metrics):
+            kwargs["update_fields"] = {*update_fields, "alert_level", "alert_flags"}
+        super().save(*args, **kwargs)
+
+    def set_raw_ppg(self, samples, sample_rate=None):
+        """Store a device waveform using the configured PPG_STORAGE mode."""
+        if samples is None:
+            return
+        storage = getattr(settings, "PPG_STORAGE", "packed")
+        if storage in ("packed", "compressed"):
+            compressed = storage == "compressed"
+            self.raw_ppg_packed = ppg.encode(samples, sample_rate or 0, delta=compressed, compress=compressed)
+            self.raw_ppg = None
+        else:
+            self.raw_ppg = samples
+
+    @property
+    def ppg(self):
+        """
+        The waveform as (channel names, int array of shape (channels, samples),
+        sample rate or None), or None when the reading has no waveform.
+        """
+        if self.raw_ppg_packed is not None:
+            return ppg.decode(self.raw_ppg_packed)
+        if self.raw_ppg is not None:
+            names, data = ppg.from_python(self.raw_ppg)
+            return names, data, None
+        return None
 
     @property
     def bp_category(self):
-        if not (self.systolic_bp and self.diastolic_bp):
-            return None
-        if self.systolic_bp < 120 and self.diastolic_bp < 80:
-            return "Normal"
-        elif self.systolic_bp < 130 and self.diastolic_bp < 80:
-            return "Elevated"
-        elif 130 <= self.systolic_bp < 140 or 80 <= self.diastolic_bp < 90:
-            return "Stage 1 Hypertension"
-        else:
-            return "Stage 2 Hypertension"    
+        return rules.VITALS.evaluate(self).label("bp")
+
 
 class Symptom(models.Model):
     SYMPTOM_CHOICES = [
@@ -83,6 +155,11 @@ class Symptom(models.Model):
     severity = models.IntegerField(choices=[(i, str(i)) for i in range(1, 11)])  # 1-10 scale
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient", "-created_at"], name="symptom_patient_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.patient.user.username} - {self.get_symptom_type_display()}"
 
@@ -98,6 +175,12 @@ class MenstrualCycle(models.Model):
     ])
     pain_level = models.IntegerField(choices=[(i, str(i)) for i in range(11)])  # 0-10 scale
     notes = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient", "-start_date"], name="cycle_patient_start_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         if self.end_date and self.start_date:
@@ -115,11 +198,375 @@ class ToolTip(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient", "-created_at"], name="tooltip_patient_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.patient.user.username} - {self.message[:40]}"
-    
 
 
+class LatestVitals(models.Model):
+    """
+    Denormalized copy of a patient's most recent measurement, maintained
+    on ingest so read paths don't have to sort the measurement history.
+    Rebuild with ``manage.py rebuild_latest_vitals``.
+    """
+    patient = models.OneToOneField(PatientProfile, on_delete=models.CASCADE, related_name="latest_vitals")
+    # No database constraint: a partitioned measurement table can't be the
+    # target of one (see measurements/partitions.py)
+    measurement = models.ForeignKey(Measurement, null=True, blank=True, on_delete=models.SET_NULL,
+                                    related_name="+", db_constraint=False)
+    timestamp = models.DateTimeField()
+    heart_rate = models.FloatField(null=True, blank=True)
+    spo2 = models.FloatField(null=True, blank=True)
+    temperature = models.FloatField(null=True, blank=True)
+    systolic_bp = models.IntegerField(null=True, blank=True)
+    diastolic_bp = models.IntegerField(null=True, blank=True)
+    device_id = models.CharField(max_length=128, null=True, blank=True)
+    alert_level = models.PositiveSmallIntegerField(default=0)
+    alert_flags = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    SNAPSHOT_FIELDS = ("timestamp", "heart_rate", "spo2", "temperature",
+                       "systolic_bp", "diastolic_bp", "device_id",
+                       "alert_level", "alert_flags")
+
+    class Meta:
+        verbose_name_plural = "latest vitals"
+        indexes = [
+            # Covers the doctor alerts endpoint (warning and above). Partial:
+            # PostgreSQL passed over the full index for a sequential scan,
+            # but reads this one index-only and joins the doctor's patients
+            models.Index(fields=["patient", "alert_level", "timestamp", "alert_flags"],
+                         name="latest_alert_idx", condition=models.Q(alert_level__gte=rules.WARNING)),
+        ]
+
+    bp_category = Measurement.bp_category
+
+    @classmethod
+    def fields_from(cls, measurement):
+        if measurement.alert_level is None:
+            measurement.classify()
+        fields = {name: getattr(measurement, name) for name in cls.SNAPSHOT_FIELDS}
+        fields["measurement_id"] = measurement.pk
+        fields["updated_at"] = timezone.now()  # QuerySet.update() skips auto_now
+        return fields
+
+    @classmethod
+    def record(cls, measurements):
+        """
+        Fold newly saved measurements into their patients' snapshots.
+        A snapshot is only replaced by a strictly newer reading (ties broken
+        on id), so late or out-of-order uploads never overwrite fresher data.
+        They still move ``updated_at``, which versions.ameasurements keys on.
+        """
+        newest = {}
+        for m in measurements:
+            current = newest.get(m.patient_id)
+            if current is None or (m.timestamp, m.pk) > (current.timestamp, current.pk):
+                newest[m.patient_id] = m
+
+        for patient_id, m in newest.items():
+            fields = cls.fields_from(m)
+            older = cls.objects.filter(patient_id=patient_id).filter(
+                models.Q(timestamp__lt=m.timestamp) |
+                models.Q(timestamp=m.timestamp, measurement_id__lt=m.pk)
+            )
+            if older.update(**fields):
+                continue
+            _, created = cls.objects.get_or_create(patient_id=patient_id, defaults=fields)
+            # Lost a race with a concurrent insert (retry the guarded update),
+            # or the reading is older than the snapshot
+            if not created and not older.update(**fields):
+                cls.objects.filter(patient_id=patient_id).update(updated_at=fields["updated_at"])
 
+    @classmethod
+    def rebuild(cls, patients, batch_size=500):
+        """Recompute snapshots for ``patients`` from measurement history."""
+        latest = Measurement.objects.filter(
+            patient=models.OuterRef("pk")).order_by("-timestamp", "-pk").values("pk")[:1]
+        ids = list(patients.annotate(latest_id=models.Subquery(latest))
+                   .values_list("pk", "latest_id"))
+        empty = [pk for pk, latest_id in ids if latest_id is None]
+        # Patients whose readings have all been archived keep the newest archived one
+        newest = MeasurementArchive.objects.filter(
+            patient=models.OuterRef("patient")).order_by("-end", "-pk").values("pk")[:1]
+        archived = [max(archive.measurements(), key=lambda m: (m.timestamp, m.pk)) for archive in
+                    MeasurementArchive.objects.filter(patient_id__in=empty, pk=models.Subquery(newest))]
+        cls.objects.filter(patient_id__in=set(empty) - {m.patient_id for m in archived}).delete()
+        for m in archived:
+            m.pk = None  # no longer in the table, like the snapshots retention leaves
+        cls._upsert(archived)
 
+        ids = [latest_id for _, latest_id in ids if latest_id is not None]
+        for start in range(0, len(ids), batch_size):
+            cls._upsert(Measurement.objects.in_bulk(ids[start:start + batch_size]).values())
+        return len(ids) + len(archived)
 
+    @classmethod
+    def _upsert(cls, measurements):
+        cls.objects.bulk_create(
+            [cls(patient_id=m.patient_id, **cls.fields_from(m)) for m in measurements],
+            update_conflicts=True,
+            unique_fields=["patient"],
+            update_fields=["measurement", *cls.SNAPSHOT_FIELDS, "updated_at"],
+        )
+
+    def __str__(self):
+        return f"{self.patient.user.username} @ {self.timestamp:%Y-%m-%d %H:%M}"
+
+
+class VitalsRollup(models.Model):
+    """
+    Per-patient hourly and daily aggregates of the vitals, kept up to date
+    as readings arrive. Rebuild with ``manage.py rebuild_vitals_rollups``.
+    """
+    HOUR = "hour"
+    DAY = "day"
+    PERIOD_CHOICES = [(HOUR, "Hourly"), (DAY, "Daily")]
+    METRICS = tuple(NORMAL_RANGES)
+
+    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name="rollups")
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    heart_rate_count = models.PositiveIntegerField(default=0)
+    heart_rate_sum = models.FloatField(default=0)
+    heart_rate_min = models.FloatField(null=True, blank=True)
+    heart_rate_max = models.FloatField(null=True, blank=True)
+    heart_rate_out_of_range = models.PositiveIntegerField(default=0)
+
+    spo2_count = models.PositiveIntegerField(default=0)
+    spo2_sum = models.FloatField(default=0)
+    spo2_min = models.FloatField(null=True, blank=True)
+    spo2_max = models.FloatField(null=True, blank=True)
+    spo2_out_of_range = models.PositiveIntegerField(default=0)
+
+    temperature_count = models.PositiveIntegerField(default=0)
+    temperature_sum = models.FloatField(default=0)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+    temperature_out_of_range = models.PositiveIntegerField(default=0)
+
+    systolic_bp_count = models.PositiveIntegerField(default=0)
+    systolic_bp_sum = models.FloatField(default=0)
+    systolic_bp_min = models.FloatField(null=True, blank=True)
+    systolic_bp_max = models.FloatField(null=True, blank=True)
+    systolic_bp_out_of_range = models.PositiveIntegerField(default=0)
+
+    diastolic_bp_count = models.PositiveIntegerField(default=0)
+    diastolic_bp_sum = models.FloatField(default=0)
+    diastolic_bp_min = models.FloatField(null=True, blank=True)
+    diastolic_bp_max = models.FloatField(null=True, blank=True)
+    diastolic_bp_out_of_range = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["patient", "period", "bucket_start"], name="rollup_patient_bucket_uniq"),
+        ]
+
+    @staticmethod
+    def bucket_for(timestamp, period):
+        local = timezone.localtime(timestamp).replace(minute=0, second=0, microsecond=0)
+        if period == VitalsRollup.DAY:
+            local = local.replace(hour=0)
+        return local
+
+    @staticmethod
+    def out_of_range(metric):
+        """A Q matching readings whose ``metric`` is outside its normal range."""
+        low, high = NORMAL_RANGES[metric]
+        bad = models.Q()
+        if low is not None:
+            bad |= models.Q(**{f"{metric}__lt": low})
+        if high is not None:
+            bad |= models.Q(**{f"{metric}__gte": high})
+        return bad
+
+    def mean(self, metric):
+        n = getattr(self, f"{metric}_count")
+        return getattr(self, f"{metric}_sum") / n if n else None
+
+    @classmethod
+    def record(cls, measurements, count_readings=True):
+        """
+        Fold newly saved measurements into their hourly and daily buckets.
+        With ``count_readings=False`` only the per-metric stats are added,
+        for values filled in after the reading was first recorded.
+        """
+        groups = {}
+        for m in measurements:
+            for period in (cls.HOUR, cls.DAY):
+                key = (m.patient_id, period, cls.bucket_for(m.timestamp, period))
+                groups.setdefault(key, []).append(m)
+
+        for (patient_id, period, bucket_start), rows in groups.items():
+            deltas = {"count": len(rows) if count_readings else 0}
+            for metric in cls.METRICS:
+                values = [getattr(m, metric) for m in rows if getattr(m, metric) is not None]
+                if not values:
+                    continue
+                deltas[metric] = {
+                    "count": len(values),
+                    "sum": float(sum(values)),
+                    "min": min(values),
+                    "max": max(values),
+                    "out_of_range": sum(out_of_range(metric, v) for v in values),
+                }
+            existing = cls.objects.filter(patient_id=patient_id, period=period, bucket_start=bucket_start)
+            if existing.update(**cls._increments(deltas)):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(patient_id=patient_id, period=period,
+                                       bucket_start=bucket_start, **cls._initial(deltas))
+            except IntegrityError:
+                # Created concurrently; apply our readings on top of it.
+                existing.update(**cls._increments(deltas))
+
+    @classmethod
+    def _increments(cls, deltas):
+        fields = {"count": models.F("count") + deltas["count"]}
+        for metric in cls.METRICS:
+            d = deltas.get(metric)
+            if d is None:
+                continue
+            fields[f"{metric}_count"] = models.F(f"{metric}_count") + d["count"]
+            fields[f"{metric}_sum"] = models.F(f"{metric}_sum") + d["sum"]
+            fields[f"{metric}_out_of_range"] = models.F(f"{metric}_out_of_range") + d["out_of_range"]
+            fields[f"{metric}_min"] = Least(Coalesce(f"{metric}_min", models.Value(d["min"])), models.Value(d["min"]))
+            fields[f"{metric}_max"] = Greatest(Coalesce(f"{metric}_max", models.Value(d["max"])), models.Value(d["max"]))
+        return fields
+
+    @classmethod
+    def _initial(cls, deltas):
+        fields = {"count": deltas["count"]}
+        for metric in cls.METRICS:
+            for key, value in deltas.get(metric, {}).items():
+                fields[f"{metric}_{key}"] = value
+        return fields
+
+    @classmethod
+    def rebuild(cls, patients, since=None):
+        """
+        Recompute rollups for ``patients`` (from ``since`` onwards) from raw
+        history. Buckets before each patient's archive horizon are kept as
+        they are, since their raw readings have been archived.
+        """
+        aggregates = {"n": models.Count("id")}
+        for metric in cls.METRICS:
+            aggregates[f"{metric}_count"] = models.Count(metric)
+            aggregates[f"{metric}_sum"] = Coalesce(models.Sum(metric, output_field=models.FloatField()), 0.0)
+            aggregates[f"{metric}_min"] = models.Min(metric)
+            aggregates[f"{metric}_max"] = models.Max(metric)
+            aggregates[f"{metric}_out_of_range"] = models.Count("id", filter=cls.out_of_range(metric))
+
+        created = 0
+        for patient in patients:
+            start = since
+            horizon = MeasurementArchive.horizon(patient)
+            if horizon is not None and (start is None or start < horizon):
+                start = horizon
+            scope = cls.objects.filter(patient=patient)
+            readings = Measurement.objects.filter(patient=patient).order_by()
+            if start is not None:
+                scope = scope.filter(bucket_start__gte=cls.bucket_for(start, cls.DAY))
+                readings = readings.filter(timestamp__gte=cls.bucket_for(start, cls.DAY))
+
+            with transaction.atomic():
+                scope.delete()
+                for period, trunc in ((cls.HOUR, TruncHour), (cls.DAY, TruncDay)):
+                    rows = (readings.annotate(bucket=trunc("timestamp"))
+                            .values("bucket").annotate(**aggregates).iterator())
+                    batch = []
+                    for row in rows:
+                        bucket, n = row.pop("bucket"), row.pop("n")
+                        batch.append(cls(patient=patient, period=period, bucket_start=bucket, count=n, **row))
+                        if len(batch) >= 1000:
+                            created += len(cls.objects.bulk_create(batch))
+                            batch = []
+                    created += len(cls.objects.bulk_create(batch))
+        return created
+
+    def __str__(self):
+        return f"{self.patient.user.username} {self.period} {self.bucket_start:%Y-%m-%d %H:%M}"
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder cuts times to milliseconds; archives keep them exact
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class MeasurementArchive(models.Model):
+    """
+    A chunk of one patient's raw readings moved out of Measurement by
+    ``manage.py archive_measurements``: every column of each reading, one
+    JSON object per line, gzip-compressed. The VitalsRollup rows for the
+    period are kept.
+    """
+    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name="measurement_archives")
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    rows = models.PositiveIntegerField()
+    # The run's cutoff: once it completes, all of the patient's readings
+    # before this are archived
+    before = models.DateTimeField()
+    # Partition the chunk was read from, when the partition was dropped whole
+    partition = models.CharField(max_length=63, blank=True)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    FIELDS = tuple(f.attname for f in Measurement._meta.concrete_fields)
+    BINARY_FIELDS = tuple(f.attname for f in Measurement._meta.concrete_fields
+                          if isinstance(f, models.BinaryField))
+    DATETIME_FIELDS = tuple(f.attname for f in Measurement._meta.concrete_fields
+                            if isinstance(f, models.DateTimeField))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient", "start"], name="archive_patient_start_idx"),
+        ]
+
+    @classmethod
+    def pack(cls, rows):
+        """Compress Measurement ``values(*FIELDS)`` rows into archive data."""
+        encoder = ArchiveEncoder(separators=(",", ":"))
+        lines = []
+        for row in rows:
+            for name in cls.BINARY_FIELDS:
+                if row[name] is not None:
+                    row[name] = base64.b64encode(bytes(row[name])).decode()
+            lines.append(encoder.encode(row))
+        return gzip.compress("\n".join(lines).encode(), compresslevel=6)
+
+    def readings(self):
+        """The archived readings as dicts (times as ISO strings, binary fields as bytes)."""
+        for line in gzip.decompress(bytes(self.data)).decode().splitlines():
+            row = json.loads(line)
+            for name in self.BINARY_FIELDS:
+                if row[name] is not None:
+                    row[name] = base64.b64decode(row[name])
+            yield row
+
+    def measurements(self):
+        """The archived readings as unsaved Measurement instances."""
+        for row in self.readings():
+            meas = Measurement(**row)
+            for name in self.DATETIME_FIELDS:
+                if row[name] is not None:
+                    setattr(meas, name, parse_datetime(row[name]))
+            yield meas
+
+    @classmethod
+    def horizon(cls, patient):
+        """The patient's latest archive cutoff, or None."""
+        return cls.objects.filter(patient=patient).aggregate(h=models.Max("before"))["h"]
+
+    def __str__(self):
+        return f"{self.patient_id} {self.start:%Y-%m-%d %H:%M}..{self.end:%Y-%m-%d %H:%M} ({self.rows})"
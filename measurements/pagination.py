@@ -0,0 +1,96 @@
+# health_project/measurements/pagination.py
+"""
+Keyset (cursor) pagination for the JSON list endpoints.
+
+Pages are ordered newest first on (field, id) and the next page starts
+strictly after the last row of the previous one, so every page costs the
+same index range scan however deep into the history it is (no OFFSET).
+Cursors are opaque URL-safe strings. Responses stay plain JSON lists;
+the cursor for the next page is sent in the ``X-Next-Cursor`` and
+``Link: <...>; rel="next"`` headers and is absent on the last page.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([value.isoformat(), pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        if not isinstance(pk, int) or not (parse_datetime(value) or parse_date(value)):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+    return value, pk
+
+
+def page_size(params, default, maximum=MAX_PAGE_SIZE):
+    value = params.get("page_size")
+    if not value:
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        raise PaginationError("page_size must be an integer")
+    if not 1 <= size <= maximum:
+        raise PaginationError(f"page_size must be between 1 and {maximum}")
+    return size
+
+
+def _page(qs, params, field, default_size, maximum):
+    size = page_size(params, default_size, maximum)
+    qs = qs.order_by(f"-{field}", "-id")
+    if params.get("cursor"):
+        value, pk = decode_cursor(params["cursor"])
+        qs = qs.filter(Q(**{f"{field}__lt": value}) | Q(**{field: value, "id__lt": pk}))
+    return qs[:size + 1], size
+
+
+def _next(rows, size, field):
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    last = rows[-1]
+    if isinstance(last, dict):  # a .values() queryset
+        return rows, encode_cursor(last[field], last["id"])
+    return rows, encode_cursor(getattr(last, field), last.pk)
+
+
+def paginate(qs, params, field, default_size, maximum=MAX_PAGE_SIZE):
+    """
+    One page of ``qs`` ordered by ``-field, -id``, starting after
+    ``params["cursor"]``. Returns (rows, next cursor or None).
+    Raises PaginationError for a bad cursor or page_size.
+    """
+    page, size = _page(qs, params, field, default_size, maximum)
+    return _next(list(page), size, field)
+
+
+async def apaginate(qs, params, field, default_size, maximum=MAX_PAGE_SIZE):
+    """Async ``paginate`` for async views."""
+    page, size = _page(qs, params, field, default_size, maximum)
+    return _next([row async for row in page], size, field)
+
+
+def with_next(response, request, cursor):
+    """Advertise the next page's cursor on ``response``."""
+    if cursor:
+        params = request.GET.copy()
+        params["cursor"] = cursor
+        response["X-Next-Cursor"] = cursor
+        response["Link"] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+    return response
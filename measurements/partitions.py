@@ -0,0 +1,186 @@
+# health_project/measurements/partitions.py
+"""
+Monthly range partitions of the measurement table on PostgreSQL.
+
+``convert()`` turns the existing table into one partitioned by timestamp.
+The current table becomes the "legacy" partition, which holds everything
+before the first monthly partition. Each month after that gets its own
+``<table>_yYYYYmMM`` partition, created ahead of time by ``ensure()``
+(``manage.py partition_measurements``). A default partition catches
+readings beyond the last one; ``ensure()`` moves them into the month's
+partition when it is created. Old months are archived and dropped whole
+by ``manage.py archive_measurements`` (measurements/retention.py).
+
+The primary key becomes (id, timestamp), as Postgres requires the
+partition key in unique constraints. ids still come from one sequence,
+so Django keeps treating ``id`` as the primary key. Partition bounds are
+UTC month starts. Other databases keep the single table.
+"""
+import datetime
+import re
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import Measurement
+
+TABLE = Measurement._meta.db_table
+LEGACY = f"{TABLE}_legacy"
+DEFAULT = f"{TABLE}_default"
+SEQUENCE = f"{TABLE}_id_seq"
+ID_TS_INDEX = f"{TABLE}_id_ts_uniq"
+LEGACY_CHECK = f"{TABLE}_legacy_range"
+
+_BOUND = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+class PartitionError(Exception):
+    pass
+
+
+def supported():
+    return connection.vendor == "postgresql"
+
+
+def month_start(when):
+    when = when.astimezone(datetime.timezone.utc)
+    return datetime.datetime(when.year, when.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def _literal(when):
+    return "'%s'" % when.isoformat()
+
+
+def _bound(value):
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return parse_datetime(value.strip("'"))
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [TABLE])
+        return cursor.fetchone()[0] == "p"
+
+
+def partitions():
+    """[(name, lower, upper)] of the table's partitions, oldest first; None for open bounds."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass", [TABLE])
+        rows = cursor.fetchall()
+    found = []
+    for name, bound in rows:
+        match = _BOUND.search(bound)
+        if match:
+            found.append((name, _bound(match.group(1)), _bound(match.group(2))))
+    return sorted(found, key=lambda p: p[2] or datetime.datetime.max.replace(tzinfo=datetime.timezone.utc))
+
+
+def convert(first_month):
+    """
+    Partition the table by timestamp, starting monthly partitions at
+    ``first_month`` (a future UTC month start). The slow parts, building
+    the (id, timestamp) index and checking that existing rows fall before
+    ``first_month``, run first without blocking writes. The switch itself
+    then takes an exclusive lock only briefly.
+    """
+    if is_partitioned():
+        raise PartitionError(f"{TABLE} is already partitioned")
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {ID_TS_INDEX} "
+                       f'ON {TABLE} (id, "timestamp")')
+        # Rows arriving meanwhile must satisfy the check too, hence a future month
+        cursor.execute(f"ALTER TABLE {TABLE} DROP CONSTRAINT IF EXISTS {LEGACY_CHECK}")
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {LEGACY_CHECK} '
+                       f'CHECK ("timestamp" < {_literal(first_month)}) NOT VALID')
+        cursor.execute(f"ALTER TABLE {TABLE} VALIDATE CONSTRAINT {LEGACY_CHECK}")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = %s::regclass AND NOT x.indisprimary AND i.relname <> %s", [TABLE, ID_TS_INDEX])
+        indexes = cursor.fetchall()
+        cursor.execute("SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = %s::regclass AND contype IN ('p', 'f')", [TABLE])
+        constraints = cursor.fetchall()
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {TABLE}")
+        last_id = cursor.fetchone()[0]
+
+        # The old table keeps its data under new names...
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {LEGACY}")
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX "{name}" RENAME TO "{name[:56]}_legacy"')
+        for name, _, _ in constraints:
+            cursor.execute(f'ALTER TABLE {LEGACY} RENAME CONSTRAINT "{name}" TO "{name[:56]}_legacy"')
+        cursor.execute(f"ALTER TABLE {LEGACY} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+        cursor.execute(f"ALTER TABLE {LEGACY} ALTER COLUMN id DROP DEFAULT")
+
+        # ...and the partitioned table takes over the old ones
+        cursor.execute(f"CREATE TABLE {TABLE} (LIKE {LEGACY} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                       f'PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f"ALTER TABLE {TABLE} DROP CONSTRAINT {LEGACY_CHECK}")
+        cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE}")
+        cursor.execute(f"ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id")
+        cursor.execute("SELECT setval(%s, %s, false)", [SEQUENCE, last_id + 1])
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+        for name, kind, definition in constraints:
+            if kind == "p":
+                definition = 'PRIMARY KEY (id, "timestamp")'
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+        for _, definition in indexes:
+            cursor.execute(definition)
+
+        # Existing rows satisfy the validated check, so attaching doesn't scan them
+        cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY} "
+                       f"FOR VALUES FROM (MINVALUE) TO ({_literal(first_month)})")
+        cursor.execute(f"ALTER TABLE {LEGACY} DROP CONSTRAINT {LEGACY_CHECK}")
+        cursor.execute(f"CREATE TABLE {DEFAULT} PARTITION OF {TABLE} DEFAULT")
+
+
+def ensure(until):
+    """Create the monthly partitions up to and including ``until``'s month; returns their names."""
+    existing = partitions()
+    month = max((upper for _, _, upper in existing if upper), default=None)
+    if month is None:
+        raise PartitionError(f"{TABLE} has no bounded partitions; convert it first")
+    created = []
+    while month <= month_start(until):
+        name, end = partition_name(month), next_month(month)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Readings already in the default partition move to the new one
+            cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {DEFAULT} WHERE \"timestamp\" >= {_literal(month)} "
+                f"AND \"timestamp\" < {_literal(end)} RETURNING *) INSERT INTO {name} SELECT * FROM moved")
+            cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+                           f"FOR VALUES FROM ({_literal(month)}) TO ({_literal(end)})")
+        created.append(name)
+        month = end
+    return created
+
+
+def drop(name, expected_rows):
+    """
+    Detach and drop partition ``name`` if it still holds ``expected_rows``
+    readings (the number archived from it). Returns whether it was dropped.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Blocks writes to the partition (there shouldn't be any) but not reads
+        cursor.execute(f'LOCK TABLE "{name}" IN SHARE MODE')
+        cursor.execute(f'SELECT COUNT(*) FROM "{name}"')
+        if cursor.fetchone()[0] != expected_rows:
+            return False
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION "{name}"')
+        cursor.execute(f'DROP TABLE "{name}"')
+    return True
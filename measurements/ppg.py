@@ -0,0 +1,145 @@
+# health_project/measurements/ppg.py
+"""
+Compact binary encoding for MAX30102 PPG waveforms.
+
+A packed waveform is a small header followed by the samples of every
+channel as one little-endian int16/int32 array (channels x samples):
+
+    magic "PG" | version | dtype ('h'/'i') | flags | n_channels | sample_rate (uint16)
+    | n_samples (uint32) | channel names ("red,ir", length-prefixed) | samples
+
+Flags: bit 0 = samples are first differences (delta encoded),
+       bit 1 = sample block is zlib-compressed.
+
+Raw (uncompressed, non-delta) waveforms, the default, decode with
+``numpy.frombuffer`` directly over the stored bytes, without copying.
+Delta encoding and compression trade that for size.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"PG"
+VERSION = 1
+HEADER = struct.Struct("<2sBcBBHI")
+DELTA = 0x01
+ZLIB = 0x02
+DTYPES = {b"h": np.dtype("<i2"), b"i": np.dtype("<i4")}
+DEFAULT_CHANNEL = "ppg"
+# Header field limits
+MAX_SAMPLE_RATE = 2 ** 16 - 1
+MAX_CHANNELS = 2 ** 8 - 1
+MAX_SAMPLES = 2 ** 32 - 1
+MAX_LABEL = 2 ** 16 - 1
+
+
+class PPGFormatError(ValueError):
+    pass
+
+
+def from_python(samples):
+    """Normalise a list of ints or a {name: [ints]} mapping to (names, 2-D array)."""
+    if isinstance(samples, dict):
+        names = [str(name) for name in samples]
+        columns = list(samples.values())
+    elif isinstance(samples, (list, tuple)):
+        names, columns = [DEFAULT_CHANNEL], [samples]
+    else:
+        raise PPGFormatError("raw_ppg must be a list of samples or a mapping of channel to samples")
+    if not names or any("," in name for name in names):
+        raise PPGFormatError("Invalid raw_ppg channel names")
+    try:
+        data = np.asarray(columns)
+    except (TypeError, ValueError):
+        data = None
+    # Only numbers (not strings or booleans); whole floats such as 512.0 are accepted
+    if data is None or data.ndim != 2 or data.dtype.kind not in "iuf":
+        raise PPGFormatError("raw_ppg samples must be integers of equal length per channel")
+    if data.dtype.kind == "f" and data.size:
+        if not np.isfinite(data).all() or (data != np.round(data)).any():
+            raise PPGFormatError("raw_ppg samples must be integers")
+        if np.abs(data).max() >= 2 ** 63:
+            raise PPGFormatError("raw_ppg samples exceed the int64 range")
+    return names, data.astype(np.int64)
+
+
+def _fits(data, dtype):
+    if not data.size:
+        return True
+    info = np.iinfo(dtype)
+    return data.min() >= info.min and data.max() <= info.max
+
+
+def encode(samples, sample_rate=0, delta=False, compress=False):
+    """
+    Pack ``samples`` (list or {channel: list}) into bytes; a sample rate of
+    0 means unknown. Raises PPGFormatError when they don't fit the format.
+    """
+    names, data = from_python(samples)
+    if not isinstance(sample_rate, int) or not 0 <= sample_rate <= MAX_SAMPLE_RATE:
+        raise PPGFormatError(f"ppg_sample_rate must be an integer between 0 and {MAX_SAMPLE_RATE}")
+    if len(names) > MAX_CHANNELS:
+        raise PPGFormatError(f"raw_ppg may have at most {MAX_CHANNELS} channels")
+    if data.shape[1] > MAX_SAMPLES:
+        raise PPGFormatError(f"raw_ppg may have at most {MAX_SAMPLES} samples per channel")
+    try:
+        label = ",".join(names).encode("ascii")
+    except UnicodeEncodeError:
+        raise PPGFormatError("raw_ppg channel names must be ASCII")
+    if len(label) > MAX_LABEL:
+        raise PPGFormatError("raw_ppg channel names are too long")
+    flags = 0
+    if delta and data.shape[1] > 1:
+        data = np.concatenate([data[:, :1], np.diff(data, axis=1)], axis=1)
+        flags |= DELTA
+    for code, dtype in DTYPES.items():
+        if _fits(data, dtype):
+            break
+    else:
+        raise PPGFormatError("raw_ppg samples exceed the int32 range")
+    block = data.astype(dtype).tobytes()
+    if compress:
+        block = zlib.compress(block, 6)
+        flags |= ZLIB
+    header = HEADER.pack(MAGIC, VERSION, code, flags, len(names), sample_rate, data.shape[1])
+    return header + struct.pack("<H", len(label)) + label + block
+
+
+def decode(blob):
+    """
+    Unpack a waveform. Returns (channel names, int array of shape
+    (channels, samples), sample rate or None). The array is read-only.
+    """
+    view = memoryview(blob)
+    try:
+        magic, version, code, flags, n_channels, sample_rate, n_samples = HEADER.unpack_from(view)
+        (label_len,) = struct.unpack_from("<H", view, HEADER.size)
+    except struct.error:
+        raise PPGFormatError("Truncated PPG blob")
+    if magic != MAGIC or version != VERSION or code not in DTYPES:
+        raise PPGFormatError("Not a packed PPG blob")
+    offset = HEADER.size + 2
+    try:
+        names = bytes(view[offset:offset + label_len]).decode("ascii").split(",")
+        block = view[offset + label_len:]
+        if flags & ZLIB:
+            block = zlib.decompress(block)
+        data = np.frombuffer(block, dtype=DTYPES[code]).reshape(n_channels, n_samples)
+    except (zlib.error, struct.error, ValueError) as e:
+        # UnicodeDecodeError is a ValueError, as are numpy's size mismatches
+        raise PPGFormatError(f"Corrupt PPG blob: {e}")
+    if len(names) != n_channels:
+        raise PPGFormatError("Corrupt PPG blob: channel names don't match the header")
+    if flags & DELTA:
+        data = np.cumsum(data, axis=1, dtype=np.int64)
+        data.flags.writeable = False
+    return names, data, sample_rate or None
+
+
+def to_python(blob):
+    """Decode back to the JSON shape devices send (list or {channel: list})."""
+    names, data, _ = decode(blob)
+    if names == [DEFAULT_CHANNEL]:
+        return data[0].tolist()
+    return {name: row.tolist() for name, row in zip(names, data)}
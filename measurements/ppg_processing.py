@@ -0,0 +1,125 @@
+# health_project/measurements/ppg_processing.py
+"""
+Vectorized PPG analysis. Every function works on a whole batch of
+equal-length waveforms at once (arrays of shape (batch, samples)), so a
+worker can process hundreds of readings with a handful of NumPy calls.
+"""
+import numpy as np
+
+CARDIAC_BAND = (0.5, 4.0)  # Hz, 30-240 bpm
+
+
+def bandpass(x, fs, low=CARDIAC_BAND[0], high=CARDIAC_BAND[1]):
+    """Zero-phase FFT band-pass along the last axis."""
+    x = np.asarray(x, dtype=np.float64)
+    spectrum = np.fft.rfft(x - x.mean(axis=-1, keepdims=True), axis=-1)
+    freqs = np.fft.rfftfreq(x.shape[-1], d=1.0 / fs)
+    spectrum[..., (freqs < low) | (freqs > high)] = 0
+    return np.fft.irfft(spectrum, n=x.shape[-1], axis=-1)
+
+
+def band_power_ratio(x, fs, low=CARDIAC_BAND[0], high=CARDIAC_BAND[1]):
+    """Fraction of non-DC spectral power that falls inside the cardiac band."""
+    x = np.asarray(x, dtype=np.float64)
+    power = np.abs(np.fft.rfft(x - x.mean(axis=-1, keepdims=True), axis=-1)) ** 2
+    freqs = np.fft.rfftfreq(x.shape[-1], d=1.0 / fs)
+    total = power[..., 1:].sum(axis=-1)
+    inside = power[..., (freqs >= low) & (freqs <= high)].sum(axis=-1)
+    return np.divide(inside, total, out=np.zeros_like(total), where=total > 0)
+
+
+def find_peaks(filtered, fs, max_rate=CARDIAC_BAND[1]):
+    """
+    Boolean mask of systolic peaks: strict local maxima above the row's
+    mean amplitude, with peaks closer than one period at ``max_rate``
+    suppressed in favour of the larger one.
+    """
+    f = filtered
+    peaks = np.zeros(f.shape, dtype=bool)
+    peaks[:, 1:-1] = (f[:, 1:-1] > f[:, :-2]) & (f[:, 1:-1] >= f[:, 2:])
+    peaks &= f > 0.3 * f.std(axis=-1, keepdims=True)
+
+    # Refractory period: a peak survives only if it is the maximum within
+    # +/- min_gap samples. A sliding-window max keeps this vectorized.
+    min_gap = max(1, int(fs / max_rate))
+    padded = np.pad(f, ((0, 0), (min_gap, min_gap)), constant_values=-np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * min_gap + 1, axis=-1)
+    peaks &= f >= windows.max(axis=-1)
+    return peaks
+
+
+def intervals(peaks, fs):
+    """
+    Peak-to-peak intervals in seconds, flattened across the batch.
+    Returns (row index of each interval, interval).
+    """
+    rows, cols = np.nonzero(peaks)
+    same_row = rows[1:] == rows[:-1]
+    return rows[1:][same_row], (np.diff(cols) / fs)[same_row]
+
+
+def _per_row_mean(rows, values, n):
+    counts = np.bincount(rows, minlength=n)
+    sums = np.bincount(rows, weights=values, minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan), counts
+
+
+def heart_rate_and_hrv(peaks, fs):
+    """Mean heart rate (bpm), RMSSD (ms) and interval CV for each row."""
+    n = peaks.shape[0]
+    rows, ibi = intervals(peaks, fs)
+    mean_ibi, counts = _per_row_mean(rows, ibi, n)
+    mean_sq, _ = _per_row_mean(rows, ibi ** 2, n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hr = 60.0 / mean_ibi
+        cv = np.sqrt(np.maximum(mean_sq - mean_ibi ** 2, 0)) / mean_ibi
+
+    same_row = rows[1:] == rows[:-1]
+    successive = (np.diff(ibi) ** 2)[same_row]
+    ms_succ, succ_counts = _per_row_mean(rows[1:][same_row], successive, n)
+    rmssd = np.where(succ_counts > 0, np.sqrt(ms_succ) * 1000.0, np.nan)
+
+    hr = np.where(counts >= 2, hr, np.nan)
+    return hr, rmssd, cv
+
+
+def spo2_ratio_of_ratios(red, ir, fs):
+    """
+    SpO2 from the red/IR ratio of ratios R = (AC_red/DC_red) / (AC_ir/DC_ir),
+    using Maxim's MAX30102 calibration curve.
+    """
+    red = np.asarray(red, dtype=np.float64)
+    ir = np.asarray(ir, dtype=np.float64)
+    ac_red = bandpass(red, fs).std(axis=-1)
+    ac_ir = bandpass(ir, fs).std(axis=-1)
+    dc_red = red.mean(axis=-1)
+    dc_ir = ir.mean(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = (ac_red / dc_red) / (ac_ir / dc_ir)
+    spo2 = -45.060 * r ** 2 + 30.354 * r + 94.845
+    valid = np.isfinite(r) & (dc_red > 0) & (dc_ir > 0)
+    return np.where(valid, np.clip(spo2, 0, 100), np.nan), np.where(valid, r, np.nan)
+
+
+def analyze(ir, fs, red=None):
+    """
+    Analyze a batch of waveforms sampled at ``fs`` Hz. ``ir`` (and ``red``
+    when available) are (batch, samples) arrays. Returns a dict of
+    per-row arrays: heart_rate, hrv_rmssd, spo2, quality (0-1). Rows
+    without a usable estimate are NaN.
+    """
+    ir = np.atleast_2d(np.asarray(ir, dtype=np.float64))
+    filtered = bandpass(ir, fs)
+    peaks = find_peaks(filtered, fs)
+    hr, rmssd, cv = heart_rate_and_hrv(peaks, fs)
+
+    regularity = np.clip(1.0 - np.nan_to_num(cv, nan=1.0), 0, 1)
+    quality = band_power_ratio(ir, fs) * regularity
+    quality = np.where(np.isfinite(hr), quality, 0.0)
+
+    if red is not None:
+        spo2, _ = spo2_ratio_of_ratios(np.atleast_2d(red), ir, fs)
+    else:
+        spo2 = np.full(ir.shape[0], np.nan)
+    return {"heart_rate": hr, "hrv_rmssd": rmssd, "spo2": spo2, "quality": quality}
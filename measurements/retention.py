@@ -0,0 +1,112 @@
+# health_project/measurements/retention.py
+"""
+Moving raw readings older than MEASUREMENT_RETENTION_DAYS out of the
+measurement table into compressed MeasurementArchive chunks
+(``manage.py archive_measurements``). VitalsRollup rows are kept, so the
+hourly and daily views still cover the archived period.
+
+On a partitioned PostgreSQL table (measurements/partitions.py), months
+that end before the cutoff are archived and then dropped whole instead of
+being deleted row by row. Whatever else is older than the cutoff (the
+start of the boundary month, or everything on SQLite and on an
+unpartitioned table) is archived and deleted a chunk at a time, each
+chunk in the same transaction as its archive row.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import partitions
+from .models import LatestVitals, Measurement, MeasurementArchive, PatientProfile, VitalsRollup
+
+
+def cutoff(days, now=None):
+    """Start of the local day ``days`` ago; readings before it are archived."""
+    return VitalsRollup.bucket_for((now or timezone.now()) - datetime.timedelta(days=days), VitalsRollup.DAY)
+
+
+def _chunks(readings, chunk_size):
+    """Rows of ``readings`` oldest first, in keyset chunks of ``chunk_size``."""
+    readings = readings.order_by("timestamp", "id").values(*MeasurementArchive.FIELDS)
+    last = None
+    while True:
+        page = readings
+        if last is not None:
+            page = readings.filter(Q(timestamp__gt=last[0]) | Q(timestamp=last[0], id__gt=last[1]))
+        rows = list(page[:chunk_size])
+        if rows:
+            last = (rows[-1]["timestamp"], rows[-1]["id"])
+            yield rows
+        if len(rows) < chunk_size:
+            return
+
+
+def _archive(patient_id, rows, before, stats, partition=""):
+    archive = MeasurementArchive.objects.create(
+        patient_id=patient_id, start=rows[0]["timestamp"], end=rows[-1]["timestamp"], rows=len(rows),
+        before=before, partition=partition, data=MeasurementArchive.pack(rows))
+    stats["rows"] += len(rows)
+    stats["chunks"] += 1
+    stats["bytes"] += len(archive.data)
+
+
+def archive_partition(name, lower, upper, before, chunk_size, stats):
+    """Archive every reading in partition ``name``, then drop it. Returns whether it was dropped."""
+    # Chunks left by an interrupted run are written again
+    MeasurementArchive.objects.filter(partition=name).delete()
+    readings = Measurement.objects.filter(timestamp__lt=upper)
+    snapshots = LatestVitals.objects.filter(measurement__timestamp__lt=upper)
+    if lower is not None:
+        readings = readings.filter(timestamp__gte=lower)
+        snapshots = snapshots.filter(measurement__timestamp__gte=lower)
+
+    archived = 0
+    for patient_id in list(readings.order_by().values_list("patient_id", flat=True).distinct()):
+        for rows in _chunks(readings.filter(patient_id=patient_id), chunk_size):
+            _archive(patient_id, rows, before, stats, partition=name)
+            archived += len(rows)
+
+    with transaction.atomic():
+        snapshots.update(measurement=None)
+        # Readings that arrived after their partition was archived stop the
+        # drop; the next run archives the partition again
+        if not partitions.drop(name, archived):
+            transaction.set_rollback(True)
+            return False
+    return True
+
+
+def archive_rows(before, chunk_size, stats):
+    """Archive and delete the readings before ``before``, patient by patient."""
+    for patient_id in PatientProfile.objects.order_by("pk").values_list("pk", flat=True):
+        readings = Measurement.objects.filter(patient_id=patient_id, timestamp__lt=before)
+        while True:
+            rows = list(readings.order_by("timestamp", "id").values(*MeasurementArchive.FIELDS)[:chunk_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                _archive(patient_id, rows, before, stats)
+                Measurement.objects.filter(pk__in=[row["id"] for row in rows]).only("id").delete()
+            if len(rows) < chunk_size:
+                break
+
+
+def run(days, chunk_size):
+    """Archive the readings older than ``days`` days; returns a summary dict."""
+    before = cutoff(days)
+    stats = {"before": before, "rows": 0, "chunks": 0, "bytes": 0, "dropped": [], "kept": []}
+    if partitions.supported() and partitions.is_partitioned():
+        for name, lower, upper in partitions.partitions():
+            if upper is not None and upper <= before:
+                dropped = archive_partition(name, lower, upper, before, chunk_size, stats)
+                stats["dropped" if dropped else "kept"].append(name)
+    archive_rows(before, chunk_size, stats)
+    return stats
+
+
+def pending(days):
+    """(cutoff, number of readings older than it) for a dry run."""
+    before = cutoff(days)
+    return before, Measurement.objects.filter(timestamp__lt=before).count()
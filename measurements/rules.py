@@ -0,0 +1,295 @@
+# health_project/measurements/rules.py
+"""
+Clinical rules, declared as data and compiled once at import.
+
+Each rule belongs to a group; within a group rules are tried in order and
+the first match wins (so list the most severe first). A rule matches when
+all of its ``requires`` metrics are present and any of its ``when``
+clauses holds (a rule with no clauses always matches). Every rule has a
+fixed ``bit`` in the alert-flag bitmask; bits are persisted, so never
+reuse or renumber one.
+
+    VITALS.evaluate(measurement)          -> Evaluation (one reading)
+    VITALS.evaluate_batch({"spo2": [...]}) -> BatchEvaluation (NumPy arrays)
+"""
+import hashlib
+import json
+import operator
+from collections.abc import Mapping
+
+import numpy as np
+
+LEVELS = ("normal", "watch", "warning", "critical")
+NORMAL, WATCH, WARNING, CRITICAL = range(len(LEVELS))
+
+# Readings outside these (low, high) bounds are out of range: value < low
+# or value >= high. The WATCH-level rules below use the same bounds.
+NORMAL_RANGES = {
+    "heart_rate": (50, 100),
+    "spo2": (95, None),
+    "temperature": (36.1, 37.5),
+    "systolic_bp": (None, 130),
+    "diastolic_bp": (None, 80),
+}
+
+VITAL_RULES = [
+    # Oxygen saturation
+    {"code": "SPO2_LOW", "bit": 0, "group": "spo2", "level": CRITICAL,
+     "when": [("spo2", "lt", 92)],
+     "condition": "Low SpO₂", "alert": "Low oxygen saturation",
+     "advice": "Low SpO₂ detected — seek medical attention."},
+    {"code": "SPO2_BORDERLINE", "bit": 1, "group": "spo2", "level": WATCH,
+     "when": [("spo2", "lt", 95)],
+     "condition": "Borderline SpO₂", "alert": "Borderline oxygen saturation",
+     "advice": "Borderline SpO₂ — rest and re-check in 30 mins."},
+
+    # Heart rate
+    {"code": "HR_HIGH", "bit": 2, "group": "heart_rate", "level": WARNING,
+     "when": [("heart_rate", "gt", 120)],
+     "condition": "Abnormal HR", "alert": "High heart rate",
+     "advice": "High heart rate — rest and consult doctor if persists."},
+    {"code": "HR_LOW", "bit": 3, "group": "heart_rate", "level": WARNING,
+     "when": [("heart_rate", "lt", 45)],
+     "condition": "Abnormal HR", "alert": "Low heart rate",
+     "advice": "Low heart rate — seek medical advice."},
+    {"code": "HR_ELEVATED", "bit": 4, "group": "heart_rate", "level": WATCH,
+     "when": [("heart_rate", "ge", 100)],
+     "condition": "Elevated HR", "alert": "Elevated heart rate",
+     "advice": "Unusual heart rate — contact your doctor if persistent."},
+    {"code": "HR_BELOW_NORMAL", "bit": 5, "group": "heart_rate", "level": WATCH,
+     "when": [("heart_rate", "lt", 50)],
+     "condition": "Low HR", "alert": "Heart rate below normal",
+     "advice": "Unusual heart rate — contact your doctor if persistent."},
+
+    # Temperature
+    {"code": "FEVER_HIGH", "bit": 6, "group": "temperature", "level": WARNING,
+     "when": [("temperature", "ge", 38.5)],
+     "condition": "High fever", "alert": "High temperature",
+     "advice": "High temperature (≥38.5°C) — rest, stay hydrated and contact your healthcare provider."},
+    {"code": "FEVER", "bit": 7, "group": "temperature", "level": WATCH,
+     "when": [("temperature", "ge", 37.5)],
+     "condition": "Fever", "alert": "Raised temperature",
+     "advice": "Mild fever — rest, hydrate and re-check temperature in 2–3 hours."},
+    {"code": "TEMP_LOW", "bit": 8, "group": "temperature", "level": WATCH,
+     "when": [("temperature", "lt", 36.1)],
+     "condition": "Low temperature", "alert": "Low body temperature",
+     "advice": "Low body temperature — keep warm and re-check."},
+
+    # Blood pressure (AHA categories; the higher of the two readings wins)
+    {"code": "BP_STAGE2", "bit": 9, "group": "bp", "level": CRITICAL,
+     "requires": ["systolic_bp", "diastolic_bp"],
+     "when": [("systolic_bp", "ge", 140), ("diastolic_bp", "ge", 90)],
+     "label": "Stage 2 Hypertension", "condition": "Severe HTN", "alert": "Stage 2 Hypertension",
+     "advice": "HIGH BLOOD PRESSURE ALERT: Seek immediate medical attention."},
+    {"code": "BP_STAGE1", "bit": 10, "group": "bp", "level": WARNING,
+     "requires": ["systolic_bp", "diastolic_bp"],
+     "when": [("systolic_bp", "ge", 130), ("diastolic_bp", "ge", 80)],
+     "label": "Stage 1 Hypertension", "condition": "Stage 1 HTN", "alert": "Stage 1 Hypertension",
+     "advice": "Blood pressure elevated - schedule doctor consultation."},
+    {"code": "BP_ELEVATED", "bit": 11, "group": "bp", "level": NORMAL,
+     "requires": ["systolic_bp", "diastolic_bp"],
+     "when": [("systolic_bp", "ge", 120)],
+     "label": "Elevated"},
+    {"code": "BP_NORMAL", "bit": 12, "group": "bp", "level": NORMAL,
+     "requires": ["systolic_bp", "diastolic_bp"],
+     "label": "Normal"},
+]
+
+CYCLE_RULES = [
+    {"code": "HEAVY_FLOW", "bit": 0, "group": "flow", "level": WATCH,
+     "when": [("flow_intensity", "eq", "heavy")],
+     "alert": "Heavy menstrual bleeding",
+     "advice": "Heavy menstrual bleeding detected - monitor for anemia symptoms."},
+    {"code": "SEVERE_PAIN", "bit": 1, "group": "pain", "level": WATCH,
+     "when": [("pain_level", "ge", 8)],
+     "alert": "Severe menstrual pain",
+     "advice": "Severe menstrual pain reported - consider medical evaluation."},
+]
+
+OPS = {
+    "lt": operator.lt, "le": operator.le,
+    "gt": operator.gt, "ge": operator.ge,
+    "eq": operator.eq,
+}
+
+
+def out_of_range(metric, value):
+    if value is None:
+        return False
+    low, high = NORMAL_RANGES[metric]
+    return (low is not None and value < low) or (high is not None and value >= high)
+
+
+class Rule:
+    __slots__ = ("code", "bit", "flag", "group", "level", "when", "requires",
+                 "label", "condition", "alert", "advice", "matches")
+
+    def __init__(self, code, bit, group, level=NORMAL, when=(), requires=(),
+                 label=None, condition=None, alert=None, advice=None):
+        self.code, self.bit, self.flag = code, bit, 1 << bit
+        self.group, self.level = group, level
+        self.when = tuple((metric, OPS[op], value) for metric, op, value in when)
+        self.requires = tuple(requires)
+        self.label, self.condition, self.alert, self.advice = label, condition, alert, advice
+        self.matches = self._compile()
+
+    def _compile(self):
+        requires, when = self.requires, self.when
+
+        def matches(values):
+            for metric in requires:
+                if values[metric] is None:
+                    return False
+            if not when:
+                return True
+            for metric, op, threshold in when:
+                value = values[metric]
+                if value is not None and op(value, threshold):
+                    return True
+            return False
+        return matches
+
+    def mask(self, arrays, n):
+        """Vectorized ``matches`` over columns of float arrays (NaN = missing)."""
+        mask = np.ones(n, dtype=bool)
+        for metric in self.requires:
+            mask &= ~np.isnan(arrays[metric])
+        if self.when:
+            hit = np.zeros(n, dtype=bool)
+            with np.errstate(invalid="ignore"):
+                for metric, op, threshold in self.when:
+                    hit |= op(arrays[metric], threshold)
+            mask &= hit
+        return mask
+
+    def __repr__(self):
+        return f"<Rule {self.code}>"
+
+
+class Evaluation:
+    """The rules matched by one reading: at most one per group."""
+    __slots__ = ("matches", "level", "flags")
+
+    def __init__(self, matches):
+        self.matches = matches
+        self.level = max((r.level for r in matches), default=NORMAL)
+        self.flags = sum(r.flag for r in matches)
+
+    @property
+    def level_name(self):
+        return LEVELS[self.level]
+
+    @property
+    def codes(self):
+        return [r.code for r in self.matches]
+
+    @property
+    def alerts(self):
+        return [r.alert for r in self.matches if r.alert]
+
+    @property
+    def advice(self):
+        return list(dict.fromkeys(r.advice for r in self.matches if r.advice))
+
+    @property
+    def condition(self):
+        """Headline for the most severe alerting rule (first declared on ties)."""
+        worst = None
+        for r in self.matches:
+            if r.condition and r.level > NORMAL and (worst is None or r.level > worst.level):
+                worst = r
+        return worst.condition if worst else "Stable"
+
+    def label(self, group):
+        for r in self.matches:
+            if r.group == group:
+                return r.label
+        return None
+
+    def has(self, *codes):
+        return any(r.code in codes for r in self.matches)
+
+
+class BatchEvaluation:
+    """Per-row results for a batch: ``levels``, ``flags`` and, per group, the
+    index of the matching rule within that group (-1 for none)."""
+
+    def __init__(self, ruleset, levels, flags, chosen):
+        self.ruleset = ruleset
+        self.levels = levels
+        self.flags = flags
+        self.chosen = chosen
+
+    def labels(self, group):
+        """Object array of the matching rule's label per row (None if none)."""
+        table = np.array([r.label for r in self.ruleset.groups[group]] + [None], dtype=object)
+        return table[self.chosen[group]]
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = tuple(Rule(**r) for r in rules)
+        bits = [r.bit for r in self.rules]
+        if len(set(bits)) != len(bits):
+            raise ValueError("Rule bits must be unique")
+        self.by_code = {r.code: r for r in self.rules}
+        self.groups = {}
+        for r in self.rules:
+            self.groups.setdefault(r.group, []).append(r)
+        self.metrics = tuple(dict.fromkeys(
+            m for r in self.rules for m in r.requires + tuple(c[0] for c in r.when)))
+        self._groups = tuple(tuple(rules) for rules in self.groups.values())
+        # Changes whenever the rule data does; stored with reclassification progress
+        self.fingerprint = hashlib.sha1(
+            json.dumps(rules, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+    def flag(self, *codes):
+        """Bitmask for the given rule codes."""
+        return sum(self.by_code[c].flag for c in codes)
+
+    def decode(self, flags):
+        """The rules whose bits are set in ``flags``."""
+        return [r for r in self.rules if flags & r.flag]
+
+    def evaluate(self, obj):
+        """Evaluate one reading (a model instance or a mapping of metric values)."""
+        if obj is None:
+            return Evaluation(())
+        if isinstance(obj, Mapping):
+            values = {m: obj.get(m) for m in self.metrics}
+        else:
+            values = {m: getattr(obj, m, None) for m in self.metrics}
+        matches = []
+        for rules in self._groups:
+            for rule in rules:
+                if rule.matches(values):
+                    matches.append(rule)
+                    break
+        return Evaluation(tuple(matches))
+
+    def evaluate_batch(self, columns):
+        """
+        Evaluate many readings at once. ``columns`` maps each numeric metric
+        to a sequence (None or NaN for missing values); all must be the same
+        length. Returns a BatchEvaluation.
+        """
+        arrays = {m: np.asarray(columns[m], dtype=np.float64) for m in self.metrics}
+        n = len(next(iter(arrays.values()))) if arrays else 0
+        levels = np.zeros(n, dtype=np.int8)
+        flags = np.zeros(n, dtype=np.int64)
+        chosen = {}
+        for group, rules in self.groups.items():
+            index = np.full(n, -1, dtype=np.int16)
+            remaining = np.ones(n, dtype=bool)
+            for i, rule in enumerate(rules):
+                mask = rule.mask(arrays, n) & remaining
+                index[mask] = i
+                remaining &= ~mask
+                levels[mask] = np.maximum(levels[mask], rule.level)
+                flags[mask] |= rule.flag
+            chosen[group] = index
+        return BatchEvaluation(self, levels, flags, chosen)
+
+
+VITALS = RuleSet(VITAL_RULES)
+CYCLE = RuleSet(CYCLE_RULES)
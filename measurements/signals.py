@@ -0,0 +1,23 @@
+# health_project/measurements/signals.py
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from measurements.models import MenstrualCycle, PatientProfile
+
+
+@receiver([post_save, post_delete], sender=MenstrualCycle)
+def touch_cycle_patient(sender, instance, **kwargs):
+    # The doctor dashboard row shows the latest cycle (see measurements/summaries.py)
+    PatientProfile.objects.filter(pk=instance.patient_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def touch_user_patient(sender, instance, update_fields=None, **kwargs):
+    # Doctors see the patient's name and phone; logins only touch last_login.
+    # Moving the profile's stamp refreshes the dashboard row and the
+    # doctor_patients version (measurements/versions.py).
+    if not instance.is_patient or update_fields == frozenset({"last_login"}):
+        return
+    PatientProfile.objects.filter(user=instance).update(updated_at=timezone.now())
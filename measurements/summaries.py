@@ -0,0 +1,78 @@
+# health_project/measurements/summaries.py
+"""
+Cached rows for the doctor dashboard's patient list.
+
+Each patient's row is cached under the version of the data behind it:
+the profile's ``updated_at`` (moved when the profile, the patient's user
+or one of their menstrual cycles is saved, see measurements/signals.py)
+and the vitals snapshot's ``updated_at`` (moved by every newer reading and
+by process_ppg). Each doctor's assembled list is cached under the versions
+of all its rows. A view reads the versions with one small query, so a
+repeat view is that query plus a cache read, and after a change only the
+rows whose version moved are rebuilt.
+
+The versions live in the database, so a change made by any process (a
+worker such as process_ppg or drain_ingest_spool, another web worker)
+is seen by all of them, whatever the cache backend. Entries for old
+versions are left to expire (DOCTOR_SUMMARY_CACHE_TTL).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import rules
+from .models import PatientProfile
+
+# Rows hold rule output, so a change to the rules starts a fresh set of keys
+PREFIX = f"doctor-summary:{rules.VITALS.fingerprint}{rules.CYCLE.fingerprint}"
+
+
+def row_key(profile_id, version):
+    return f"{PREFIX}:row:{profile_id}:{version}"
+
+
+def rows_key(doctor_id, versions):
+    digest = hashlib.md5(repr(versions).encode()).hexdigest()
+    return f"{PREFIX}:rows:{doctor_id}:{digest}"
+
+
+def _timeout():
+    return getattr(settings, "DOCTOR_SUMMARY_CACHE_TTL", 600)
+
+
+def _stamp(when):
+    return when.isoformat() if when else "-"
+
+
+def row_versions(doctor):
+    """[(profile id, row version)] for ``doctor``'s patients; one query."""
+    stamps = (PatientProfile.objects.filter(assigned_doctor=doctor).order_by("pk")
+              .values_list("pk", "updated_at", "latest_vitals__updated_at"))
+    return [(pk, f"{_stamp(profile)}/{_stamp(vitals)}") for pk, profile, vitals in stamps]
+
+
+def doctor_rows(doctor, build):
+    """
+    Dashboard rows for ``doctor``'s patients. ``build(patients)`` turns a
+    PatientProfile queryset into {profile id: row}; it is only called for
+    rows that aren't cached at their current version.
+    """
+    versions = row_versions(doctor)
+    key = rows_key(doctor.pk, versions)
+    rows = cache.get(key)
+    if rows is not None:
+        return rows
+
+    keys = {pk: row_key(pk, version) for pk, version in versions}
+    found = cache.get_many(keys.values())
+    cached = {pk: found[k] for pk, k in keys.items() if k in found}
+    missing = [pk for pk in keys if pk not in cached]
+    if missing:
+        built = build(PatientProfile.objects.filter(pk__in=missing))
+        cache.set_many({keys[pk]: row for pk, row in built.items()}, _timeout())
+        cached.update(built)
+
+    rows = [cached[pk] for pk, _ in versions if pk in cached]
+    cache.set(key, rows, _timeout())
+    return rows
@@ -1,3 +1,736 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import tempfile
+from unittest import mock, skipIf
+from datetime import date, datetime, timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from devices.ingestion import store_readings
+from users.models import User
+from . import events, export, ppg, rules, timeseries
+from .models import (PatientProfile, Measurement, MenstrualCycle, LatestVitals, VitalsRollup, Symptom,
+                     MeasurementArchive)
+
+
+class DoctorDashboardQueryCountTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user("doc", password="pw", is_doctor=True)
+        self.client.force_login(self.doctor)
+
+    def add_patients(self, count):
+        now = timezone.now()
+        for _ in range(count):
+            n = PatientProfile.objects.count()
+            user = User.objects.create_user(f"patient{n}", password="pw", is_patient=True)
+            profile = PatientProfile.objects.create(user=user, gender="F", assigned_doctor=self.doctor)
+            LatestVitals.record([
+                Measurement.objects.create(
+                    patient=profile, timestamp=now - timedelta(minutes=minutes),
+                    heart_rate=70 + minutes, spo2=97, systolic_bp=125, diastolic_bp=78,
+                )
+                for minutes in range(3)
+            ])
+            MenstrualCycle.objects.create(patient=profile, start_date=date(2025, 1, 1),
+                                          flow_intensity="light", pain_level=2)
+            MenstrualCycle.objects.create(patient=profile, start_date=date(2025, 2, 1),
+                                          flow_intensity="heavy", pain_level=9)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_doctor_dashboard_query_count_is_constant(self):
+        self.add_patients(1)
+        small, _ = self.count_queries(reverse("doctor-dashboard"))
+        self.add_patients(10)
+        large, response = self.count_queries(reverse("doctor-dashboard"))
+        self.assertEqual(small, large)
+
+        patients = response.context["patients"]
+        self.assertEqual(len(patients), 11)
+        self.assertEqual(patients[0]["latest_hr"], 70)
+        self.assertIn("Heavy menstrual bleeding", patients[0]["alerts"])
+        self.assertIn("Severe menstrual pain", patients[0]["alerts"])
+
+    def test_doctor_patients_json_query_count_is_constant(self):
+        self.add_patients(1)
+        small, _ = self.count_queries(reverse("api-doctor-patients"))
+        self.add_patients(10)
+        large, response = self.count_queries(reverse("api-doctor-patients"))
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.json()), 11)
+        self.assertTrue(all(row["latest_hr"] == 70 for row in response.json()))
+
+
+class PatientTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("patient", password="pw", is_patient=True)
+        self.profile = PatientProfile.objects.create(user=self.user, gender="F")
+        self.client.force_login(self.user)
+
+    def add_readings(self, start, count, step=timedelta(minutes=30), rollups=True, **values):
+        values = dict({"heart_rate": 70, "spo2": 98}, **values)
+        created = [Measurement.objects.create(patient=self.profile, timestamp=start + i * step, **values)
+                   for i in range(count)]
+        if rollups:
+            VitalsRollup.record(created)
+        return created
+
+
+class LatestVitalsTests(PatientTestCase):
+    def snapshot(self):
+        return LatestVitals.objects.values("measurement_id", *LatestVitals.SNAPSHOT_FIELDS).get(patient=self.profile)
+
+    def test_older_reading_arriving_late_leaves_the_snapshot(self):
+        now = timezone.now()
+        # same timestamp as the newer one but a lower id, so still older
+        tied, newer = self.add_readings(now, 2, step=timedelta(0), heart_rate=80)
+        LatestVitals.record([newer])
+        expected = self.snapshot()
+        self.assertEqual(expected["measurement_id"], newer.pk)
+
+        late, = self.add_readings(now - timedelta(minutes=10), 1, heart_rate=120)
+        LatestVitals.record([late])
+        self.assertEqual(self.snapshot(), expected)
+        LatestVitals.record([tied])
+        self.assertEqual(self.snapshot(), expected)
+
+        newest, = self.add_readings(now + timedelta(minutes=1), 1, heart_rate=75)
+        LatestVitals.record([newest, late])
+        self.assertEqual(self.snapshot(), dict(expected, measurement_id=newest.pk,
+                                               timestamp=newest.timestamp, heart_rate=75))
+
+
+class RollupCoverageTests(PatientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.make_aware(datetime(2026, 1, 1, 8))
+        self.new = timezone.make_aware(datetime(2026, 1, 3, 8))
+        # History from before rollups were kept, then readings recorded on ingest
+        self.add_readings(self.old, 4, rollups=False, heart_rate=60)
+        self.add_readings(self.new, 4, heart_rate=80)
+
+    def hourly(self, **params):
+        response = self.client.get(reverse("api-patient-measurements"),
+                                   {"resolution": "hour", "start": "2026-01-01", "end": "2026-01-04", **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_history_before_the_first_rollup_is_bucketed_from_raw(self):
+        rows = self.hourly()
+        self.assertEqual(sum(row["count"] for row in rows), 8)
+        self.assertEqual([row["heart_rate"] for row in rows], [80, 80, 60, 60])
+        timestamps = [row["timestamp"] for row in rows]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+
+    def test_rolled_up_and_raw_buckets_have_the_same_fields(self):
+        self.add_readings(self.old, 1, rollups=False, heart_rate=120)
+        rows = self.hourly()
+        self.assertEqual(len({tuple(row) for row in rows}), 1)
+        self.assertEqual([row["heart_rate_out_of_range"] for row in rows], [0, 0, 0, 1])
+
+        columns = self.hourly(format="columnar")
+        self.assertEqual(columns["heart_rate_out_of_range"], [0, 0, 0, 1])
+        self.assertEqual(columns["count"], [2, 2, 2, 3])
+
+    def test_backfill_migration_covers_old_history(self):
+        migration = importlib.import_module("measurements.migrations.0013_backfill_vitals_rollups")
+        migration.backfill(apps, None)
+        hours = VitalsRollup.objects.filter(patient=self.profile, period=VitalsRollup.HOUR)
+        self.assertEqual(sum(hours.values_list("count", flat=True)), 8)
+        self.assertEqual(VitalsRollup.objects.get(period=VitalsRollup.DAY, bucket_start=self.old.replace(hour=0)).count, 4)
+        self.assertEqual(sum(row["count"] for row in self.hourly()), 8)
+
+
+class ResolutionTests(PatientTestCase):
+    def test_long_window_stays_under_max_points(self):
+        self.add_readings(timezone.make_aware(datetime(2025, 1, 6, 8)), 40, step=timedelta(weeks=1))
+        params = {"start": "2025-01-01", "end": "2026-01-01", "max_points": "3"}
+        pages, counts = 0, 0
+        while True:
+            response = self.client.get(reverse("api-patient-measurements"), params)
+            self.assertEqual(response.status_code, 200)
+            rows = response.json()
+            self.assertLessEqual(len(rows), 3)
+            pages, counts = pages + 1, counts + sum(row["count"] for row in rows)
+            if "X-Next-Cursor" not in response:
+                break
+            params["cursor"] = response["X-Next-Cursor"]
+        # Ten months, three to a page
+        self.assertEqual((pages, counts), (4, 40))
+
+
+class ColumnarTests(PatientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.make_aware(datetime(2026, 1, 1, 8))
+
+    def columns(self, **params):
+        response = self.client.get(reverse("api-patient-measurements"), {"format": "columnar", **params})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len({len(values) for values in data.values()}), 1, data)
+        return data
+
+    def test_raw_readings(self):
+        readings = self.add_readings(self.start, 3, heart_rate=120)
+        data = self.columns(start="2026-01-01", resolution="raw")
+        self.assertEqual(data["id"], [m.id for m in reversed(readings)])
+        self.assertEqual(data["timestamp"][-1], self.start.timestamp())
+        self.assertEqual(data["heart_rate"], [120] * 3)
+
+    def test_buckets(self):
+        self.add_readings(self.start, 4, rollups=False)
+        data = self.columns(start="2026-01-01", resolution="hour")
+        self.assertEqual(list(data), list(timeseries.BUCKET_FIELDS))
+        self.assertEqual(data["count"], [2, 2])
+        self.assertEqual(data["timestamp"][-1], self.start.timestamp())
+
+    def test_empty_window_has_every_field(self):
+        for resolution in ("hour", "week"):
+            data = self.columns(start="2026-01-01", end="2026-01-02", resolution=resolution)
+            self.assertEqual(data, {field: [] for field in timeseries.BUCKET_FIELDS})
+
+    def test_rollups_with_older_raw_history(self):
+        self.add_readings(self.start, 2, rollups=False, spo2=90)
+        self.add_readings(self.start + timedelta(days=1), 2)
+        data = self.columns(start="2026-01-01", end="2026-01-03", resolution="hour")
+        self.assertEqual(list(data), list(timeseries.BUCKET_FIELDS))
+        self.assertEqual(data["spo2_out_of_range"], [0, 2])
+
+
+class PPGTests(PatientTestCase):
+    def test_round_trip(self):
+        samples = {"red": [50000, 50010, 49990, -3], "ir": [1, 2, 3, 2 ** 31 - 1]}
+        for delta in (True, False):
+            for compress in (True, False):
+                blob = ppg.encode(samples, 100, delta=delta, compress=compress)
+                names, data, fs = ppg.decode(blob)
+                self.assertEqual(names, ["red", "ir"])
+                self.assertEqual(fs, 100)
+                self.assertEqual(ppg.to_python(blob), samples)
+        self.assertEqual(ppg.to_python(ppg.encode([5, 6, 7])), [5, 6, 7])
+
+    def test_corrupt_blobs_raise_format_errors(self):
+        blob = ppg.encode(list(range(500)), 100)
+        for bad in (blob[:5], blob[:-10], blob.replace(b"ppg", b"\xff\xfe\xfd")):
+            with self.assertRaises(ppg.PPGFormatError):
+                ppg.decode(bad)
+        # raw samples have no checksum; overwritten compressed data is caught by zlib
+        blob = ppg.encode(list(range(500)), 100, delta=True, compress=True)
+        with self.assertRaises(ppg.PPGFormatError):
+            ppg.decode(blob[:-10] + b"x" * 10)
+
+    def test_corrupt_blob_does_not_wedge_the_worker(self):
+        good = ppg.encode([int(1000 * (i % 100 < 50)) for i in range(1000)], 100)
+        bad, ok = self.add_readings(timezone.now(), 2, rollups=False)
+        Measurement.objects.filter(pk=bad.pk).update(raw_ppg_packed=good[:-20])
+        Measurement.objects.filter(pk=ok.pk).update(raw_ppg_packed=good)
+        call_command("process_ppg", stdout=mock.Mock())
+        self.assertFalse(Measurement.objects.filter(ppg_processed_at__isnull=True).exists())
+        bad.refresh_from_db()
+        self.assertEqual(bad.ppg_quality, 0.0)
+
+    def test_encode_rejects_what_the_header_cannot_hold(self):
+        for samples, rate in (([1, 2], 70000), ([1, 2], -1), ([1.5, 2], 100), (["1", "2"], 100),
+                              ({str(i): [1] for i in range(256)}, 100), ({"x" * 70000: [1]}, 100)):
+            with self.assertRaises(ppg.PPGFormatError):
+                ppg.encode(samples, rate)
+        self.assertEqual(ppg.to_python(ppg.encode([1.0, 2.0], 65535)), [1, 2])
+
+    def test_default_storage_is_read_in_place(self):
+        reading = Measurement(patient=self.profile, timestamp=timezone.now())
+        reading.set_raw_ppg(list(range(1000)), 100)
+        names, data, fs = ppg.decode(reading.raw_ppg_packed)
+        self.assertFalse(data.flags.owndata)
+        with self.settings(PPG_STORAGE="compressed"):
+            reading.set_raw_ppg(list(range(1000)), 100)
+        self.assertLess(len(reading.raw_ppg_packed), 1000)
+        self.assertEqual(ppg.to_python(reading.raw_ppg_packed), list(range(1000)))
+
+
+class ExportTests(PatientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_readings(timezone.now() - timedelta(days=1), 5)
+        MenstrualCycle.objects.create(patient=self.profile, start_date=date(2025, 1, 1),
+                                      flow_intensity="light", pain_level=2)
+
+    def test_async_records_match_sync_records(self):
+        async def collect():
+            return [record async for record in export.arecords(self.profile, chunk_size=2)]
+        expected = list(export.records(self.profile, chunk_size=2))
+        self.assertEqual(len(expected), 6)
+        self.assertEqual(async_to_sync(collect)(), expected)
+
+    def test_wsgi_export_streams_ndjson(self):
+        response = self.client.get(reverse("api-patient-export"))
+        self.assertFalse(response.is_async)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+
+    def test_asgi_export_streams_from_an_async_iterator(self):
+        client = AsyncClient()
+        async_to_sync(client.aforce_login)(self.user)
+
+        async def fetch():
+            response = await client.get(reverse("api-patient-export"), {"format": "csv"})
+            return response, b"".join([chunk async for chunk in response.streaming_content])
+        response, body = async_to_sync(fetch)()
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(body.decode().splitlines()), 7)
+
+
+class VersionTests(PatientTestCase):
+    def etag(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse(name), params, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        return response["ETag"]
+
+    def ingest(self, start, count=1):
+        LatestVitals.record(self.add_readings(start, count))
+
+    def test_measurements_etag_changes_on_new_reading(self):
+        self.ingest(timezone.now() - timedelta(minutes=5), 2)
+        before = self.etag("api-patient-measurements")
+        self.ingest(timezone.now())
+        self.assertNotEqual(self.etag("api-patient-measurements"), before)
+
+    def test_measurements_etag_changes_on_late_reading(self):
+        self.ingest(timezone.now())
+        before = self.etag("api-patient-measurements")
+        self.ingest(timezone.now() - timedelta(days=1))
+        self.assertNotEqual(self.etag("api-patient-measurements"), before)
+
+    def test_measurements_etag_follows_the_rules_without_counting(self):
+        self.ingest(timezone.now())
+        before = self.etag("api-patient-measurements")
+        with CaptureQueriesContext(connection) as ctx:
+            self.etag("api-patient-measurements")
+        self.assertFalse([q for q in ctx.captured_queries if "COUNT(" in q["sql"]])
+        with mock.patch.object(rules.VITALS, "fingerprint", "new rules"):
+            self.assertNotEqual(self.etag("api-patient-measurements"), before)
+
+    def test_menstrual_etag_changes_on_edit(self):
+        cycle = MenstrualCycle.objects.create(patient=self.profile, start_date=date(2025, 1, 1),
+                                              flow_intensity="light", pain_level=2)
+        before = self.etag("patient_menstrual_json")
+        cycle.pain_level = 9
+        cycle.save()
+        self.assertNotEqual(self.etag("patient_menstrual_json"), before)
+
+    def test_doctor_patients_etag_changes_when_a_patient_is_renamed(self):
+        doctor = User.objects.create_user("doc", password="pw", is_doctor=True)
+        self.profile.assigned_doctor = doctor
+        self.profile.save()
+        self.client.force_login(doctor)
+        before = self.etag("api-doctor-patients")
+        self.user.first_name = "Ada"
+        self.user.save()
+        self.assertNotEqual(self.etag("api-doctor-patients"), before)
+
+
+class DoctorRowCacheTests(PatientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = User.objects.create_user("doc", password="pw", is_doctor=True)
+        self.profile.assigned_doctor = self.doctor
+        self.profile.save()
+        LatestVitals.record(self.add_readings(timezone.now() - timedelta(minutes=5), 1))
+        self.client.force_login(self.doctor)
+
+    def rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("doctor-dashboard"))
+        return response.context["patients"], len(ctx.captured_queries)
+
+    def test_warm_view_reads_versions_only(self):
+        self.rows()
+        rows, warm = self.rows()
+        self.assertEqual(rows[0]["latest_hr"], 70)
+        # session, user, and the row versions
+        self.assertLessEqual(warm, 3)
+
+    def test_rows_follow_database_stamps_changed_elsewhere(self):
+        self.rows()
+        # As a worker in another process would: no signals, no cache access here
+        LatestVitals.objects.filter(patient=self.profile).update(heart_rate=55, updated_at=timezone.now())
+        self.assertEqual(self.rows()[0][0]["latest_hr"], 55)
+
+        MenstrualCycle.objects.create(patient=self.profile, start_date=date(2025, 3, 1),
+                                      flow_intensity="heavy", pain_level=9)
+        self.assertIn("Severe menstrual pain", self.rows()[0][0]["alerts"])
+
+        self.user.first_name, self.user.last_name = "Ada", "Lovelace"
+        self.user.save()
+        self.assertEqual(self.rows()[0][0]["full_name"], "Ada Lovelace")
+
+    def test_dashboard_opens_one_live_stream(self):
+        response = self.client.get(reverse("doctor-dashboard"))
+        self.assertEqual(response.content.decode().count("new EventSource("), 1)
+
+    def test_reassigned_patient_moves_between_lists(self):
+        self.rows()
+        other = User.objects.create_user("doc2", password="pw", is_doctor=True)
+        PatientProfile.objects.filter(pk=self.profile.pk).update(assigned_doctor=other)
+        self.assertEqual(self.rows()[0], [])
+
+
+class PatientDashboardFragmentTests(PatientTestCase):
+    def setUp(self):
+        super().setUp()
+        LatestVitals.record(self.add_readings(timezone.now() - timedelta(minutes=5), 1))
+
+    def page(self):
+        response = self.client.get(reverse("patient-dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_fragments_follow_database_changes_made_elsewhere(self):
+        self.assertNotIn("High heart rate", self.page())
+        # As process_ppg in another process would: no signals, no cache access here
+        LatestVitals.objects.filter(patient=self.profile).update(heart_rate=130, updated_at=timezone.now())
+        self.assertIn("High heart rate", self.page())
+
+        Symptom.objects.bulk_create([Symptom(patient=self.profile, symptom_type="headache", severity=4)])
+        self.assertIn("Headache", self.page())
+
+    def test_warm_page_skips_the_fragment_queries(self):
+        self.page()
+        with CaptureQueriesContext(connection) as ctx:
+            self.page()
+        # session, user, and the profile with its versions
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+
+
+# On PostgreSQL events only go out on commit, through NOTIFY (see devices.tests.SpoolTests)
+@skipIf(connection.vendor == "postgresql", "publishes in-process on other databases")
+class LiveEventTests(PatientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, *topics):
+        async def subscribe():
+            return events.broker.subscribe(topics)
+        subscription = self.loop.run_until_complete(subscribe())
+        self.addCleanup(subscription.close)
+        return subscription
+
+    def store(self, **values):
+        reading = dict({"heart_rate": 70, "patient_user_id": str(self.user.id)}, **values)
+        with self.captureOnCommitCallbacks(execute=True):
+            return store_readings([("band", reading, None)], touch_devices=False)
+
+    def test_readings_fan_out_to_every_subscriber(self):
+        dashboards = [self.subscribe(self.profile.pk) for _ in range(2)]
+        other = self.subscribe(self.profile.pk + 1)
+        result = self.store(heart_rate=130)[0]
+        for subscription in dashboards:
+            event = self.loop.run_until_complete(subscription.get(1))
+            self.assertEqual((event["id"], event["heart_rate"]), (result["measurement_id"], 130))
+            self.assertEqual(event["alert_level"], "warning")
+        self.assertIsNone(self.loop.run_until_complete(other.get(0.05)))
+
+    @override_settings(LIVE_EVENTS_HEARTBEAT=0.05)
+    def test_stream_follows_patients_assigned_later(self):
+        assigned = {}
+
+        async def following():
+            return dict(assigned)
+
+        body = events.stream(following)
+        self.addCleanup(lambda: self.loop.run_until_complete(body.aclose()))
+        self.assertEqual(self.loop.run_until_complete(anext(body)), "retry: 5000\n\n")
+        assigned[self.profile.pk] = str(self.user.id)
+        # A heartbeat passes and the stream looks the patients up again
+        for _ in range(2):
+            self.assertEqual(self.loop.run_until_complete(anext(body)), ": ping\n\n")
+        self.store()
+        message = self.loop.run_until_complete(anext(body))
+        self.assertIn(f'"patient_user_id":"{self.user.id}"', message)
+
+
+class PatientEndpointTests(TestCase):
+    def test_patient_without_profile_gets_404(self):
+        user = User.objects.create_user("new", password="pw", is_patient=True)
+        self.client.force_login(user)
+        for name in ("api-patient-measurements", "patient-symptoms-json"):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 404, name)
+
+
+class DoctorPatientDetailTests(PatientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = User.objects.create_user("doc", password="pw", is_doctor=True)
+        self.profile.assigned_doctor = self.doctor
+        self.profile.save()
+        self.client.force_login(self.doctor)
+
+    def detail(self, **params):
+        return self.client.get(reverse("api-doctor-patient-detail"), params)
+
+    def test_detail_of_own_patient(self):
+        self.add_readings(timezone.now() - timedelta(hours=1), 3)
+        response = self.detail(patient_id=self.user.id)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["patient"]["user_id"], str(self.user.id))
+        self.assertEqual(len(body["measurements"]), 3)
+
+    def test_other_doctors_patient_is_not_found(self):
+        other = User.objects.create_user("doc2", password="pw", is_doctor=True)
+        self.client.force_login(other)
+        self.assertEqual(self.detail(patient_id=self.user.id).status_code, 404)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.detail().status_code, 400)
+        self.assertEqual(self.detail(patient_id="not-a-uuid").status_code, 404)
+        self.assertEqual(self.detail(patient_id=self.user.id, max_points=timeseries.MAX_POINTS_LIMIT + 1).status_code,
+                         400)
+        self.client.force_login(self.user)
+        self.assertEqual(self.detail(patient_id=self.user.id).status_code, 403)
+
+    def test_measurements_are_capped_at_max_points(self):
+        self.add_readings(timezone.now() - timedelta(days=1), 600, step=timedelta(minutes=1), rollups=False)
+        for params, cap in (({}, 500), ({"max_points": 5}, 5)):
+            body = self.detail(patient_id=self.user.id, **params).json()
+            # coarser buckets, still covering every reading
+            self.assertLessEqual(len(body["measurements"]), cap)
+            self.assertEqual(sum(row["count"] for row in body["measurements"]), 600)
+
+
+class DoctorAlertsTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user("doc", password="pw", is_doctor=True)
+        other = User.objects.create_user("doc2", password="pw", is_doctor=True)
+        now = timezone.now()
+        for name, doctor, minutes, values in (("low_spo2", self.doctor, 5, {"spo2": 90}),
+                                              ("fast", self.doctor, 1, {"heart_rate": 130}),
+                                              ("stage2", self.doctor, 2, {"systolic_bp": 145, "diastolic_bp": 95}),
+                                              ("watch", self.doctor, 1, {"heart_rate": 105}),
+                                              ("fine", self.doctor, 1, {}),
+                                              ("elsewhere", other, 1, {"spo2": 85})):
+            user = User.objects.create_user(name, password="pw", is_patient=True)
+            profile = PatientProfile.objects.create(user=user, gender="F", assigned_doctor=doctor)
+            values = dict({"heart_rate": 70, "spo2": 98}, **values)
+            LatestVitals.record([Measurement.objects.create(
+                patient=profile, timestamp=now - timedelta(minutes=minutes), **values)])
+        self.client.force_login(self.doctor)
+
+    def alerts(self, **params):
+        response = self.client.get(reverse("api-doctor-alerts"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_alerting_patients_most_critical_first(self):
+        rows = self.alerts()
+        self.assertEqual([(r["username"], r["level"]) for r in rows],
+                         [("stage2", "critical"), ("low_spo2", "critical"), ("fast", "warning")])
+        self.assertEqual(rows[0]["codes"], ["BP_STAGE2"])
+        self.assertEqual(rows[0]["bp_category"], "Stage 2 Hypertension")
+        self.assertEqual(rows[1]["alerts"], ["Low oxygen saturation"])
+        self.assertEqual([r["username"] for r in self.alerts(min_level="watch")],
+                         ["stage2", "low_spo2", "fast", "watch"])
+
+    def test_flags_narrow_the_list(self):
+        self.assertEqual([r["username"] for r in self.alerts(flags="spo2_low,HR_HIGH")], ["low_spo2", "fast"])
+        self.assertEqual(self.alerts(flags="HR_ELEVATED"), [])
+
+    def test_bad_requests(self):
+        url = reverse("api-doctor-alerts")
+        self.assertEqual(self.client.get(url, {"min_level": "severe"}).status_code, 400)
+        response = self.client.get(url, {"flags": "SPO2_LOW,NOPE"})
+        self.assertEqual((response.status_code, response.json()["error"]), (400, "Unknown flag(s): NOPE"))
+        self.client.force_login(User.objects.get(username="fast"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class ClassificationTests(PatientTestCase):
+    def test_editing_vitals_reclassifies(self):
+        m, = self.add_readings(timezone.now(), 1, rollups=False)
+        self.assertEqual(m.alert_level, rules.NORMAL)
+
+        m.spo2 = 90
+        m.save()
+        m.refresh_from_db()
+        self.assertEqual(m.alert_level, rules.CRITICAL)
+
+        m.spo2 = 98
+        m.save(update_fields=["spo2"])
+        m.refresh_from_db()
+        self.assertEqual((m.alert_level, m.alert_flags), (rules.NORMAL, 0))
+
+    def test_reclassify_updates_latest_vitals(self):
+        m, = self.add_readings(timezone.now(), 1, rollups=False, spo2=90)
+        LatestVitals.record([m])
+        # As if classified under older rules
+        Measurement.objects.filter(pk=m.pk).update(alert_level=rules.NORMAL, alert_flags=0)
+        LatestVitals.objects.filter(patient=self.profile).update(alert_level=rules.NORMAL, alert_flags=0)
+        before = LatestVitals.objects.get(patient=self.profile).updated_at
+
+        call_command("reclassify_measurements", restart=True, checkpoint=str(self.checkpoint()),
+                     stdout=mock.Mock())
+        m.refresh_from_db()
+        vitals = LatestVitals.objects.get(patient=self.profile)
+        self.assertEqual(m.alert_level, rules.CRITICAL)
+        self.assertEqual((vitals.alert_level, vitals.alert_flags), (m.alert_level, m.alert_flags))
+        self.assertGreater(vitals.updated_at, before)
+
+    def checkpoint(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return Path(directory.name) / "checkpoint.json"
+
+
+class RuleTests(SimpleTestCase):
+    CASES = [
+        # (reading, level, bp label)
+        ({"spo2": 95}, rules.NORMAL, None),
+        ({"spo2": 94.9}, rules.WATCH, None),
+        ({"spo2": 92}, rules.WATCH, None),
+        ({"spo2": 91.9}, rules.CRITICAL, None),
+        ({"heart_rate": 99}, rules.NORMAL, None),
+        ({"heart_rate": 100}, rules.WATCH, None),
+        ({"heart_rate": 120}, rules.WATCH, None),
+        ({"heart_rate": 121}, rules.WARNING, None),
+        ({"heart_rate": 49}, rules.WATCH, None),
+        ({"heart_rate": 44}, rules.WARNING, None),
+        ({"temperature": 37.5}, rules.WATCH, None),
+        ({"temperature": 38.5}, rules.WARNING, None),
+        ({"systolic_bp": 119, "diastolic_bp": 79}, rules.NORMAL, "Normal"),
+        ({"systolic_bp": 120, "diastolic_bp": 79}, rules.NORMAL, "Elevated"),
+        ({"systolic_bp": 125, "diastolic_bp": 80}, rules.WARNING, "Stage 1 Hypertension"),
+        ({"systolic_bp": 139, "diastolic_bp": 70}, rules.WARNING, "Stage 1 Hypertension"),
+        ({"systolic_bp": 140, "diastolic_bp": 70}, rules.CRITICAL, "Stage 2 Hypertension"),
+        ({"systolic_bp": 150}, rules.NORMAL, None),  # needs both readings
+    ]
+
+    def test_thresholds(self):
+        for reading, level, label in self.CASES:
+            result = rules.VITALS.evaluate(reading)
+            self.assertEqual((result.level, result.label("bp")), (level, label), reading)
+
+    def test_batch_matches_single_evaluation(self):
+        columns = {m: [reading.get(m) for reading, _, _ in self.CASES] for m in rules.VITALS.metrics}
+        batch = rules.VITALS.evaluate_batch(columns)
+        for i, (reading, _, _) in enumerate(self.CASES):
+            single = rules.VITALS.evaluate(reading)
+            self.assertEqual((batch.levels[i], batch.flags[i], batch.labels("bp")[i]),
+                             (single.level, single.flags, single.label("bp")), reading)
+
+
+class PaginationTests(PatientTestCase):
+    def test_cursor_walks_every_reading_once(self):
+        now = timezone.now().replace(microsecond=0)
+        created = self.add_readings(now - timedelta(hours=1), 5, step=timedelta(minutes=1))
+        # Ties on timestamp are broken on id
+        created += self.add_readings(now, 2, step=timedelta(0))
+        params, seen = {"page_size": "3"}, []
+        while True:
+            response = self.client.get(reverse("api-patient-measurements"), params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page), 3)
+            seen += [row["id"] for row in page]
+            if "X-Next-Cursor" not in response:
+                break
+            self.assertIn('rel="next"', response["Link"])
+            params["cursor"] = response["X-Next-Cursor"]
+        newest_first = sorted(created, key=lambda m: (m.timestamp, m.pk), reverse=True)
+        self.assertEqual(seen, [m.pk for m in newest_first])
+
+    def test_bad_cursor_is_a_bad_request(self):
+        for params in ({"cursor": "nonsense"}, {"page_size": "0"}):
+            response = self.client.get(reverse("api-patient-measurements"), params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class ArchiveTests(PatientTestCase):
+    def test_archived_readings_round_trip(self):
+        old = timezone.now() - timedelta(days=200)
+        readings = self.add_readings(old, 3, heart_rate=61)
+        readings[0].set_raw_ppg([5, 7, 9, 7], 100)
+        readings[0].save()
+        kept = self.add_readings(timezone.now() - timedelta(days=1), 1)
+        originals = {row["id"]: row for row in
+                     Measurement.objects.filter(timestamp__lt=old + timedelta(days=1))
+                     .values(*MeasurementArchive.FIELDS)}
+
+        call_command("archive_measurements", days=180, chunk_size=2, stdout=mock.Mock())
+        self.assertEqual(list(Measurement.objects.values_list("pk", flat=True)), [kept[0].pk])
+        archives = MeasurementArchive.objects.filter(patient=self.profile).order_by("start")
+        self.assertEqual([a.rows for a in archives], [2, 1])
+
+        restored = [row for archive in archives for row in archive.readings()]
+        self.assertEqual(sorted(row["id"] for row in restored), sorted(originals))
+        for row in restored:
+            original = originals[row["id"]]
+            self.assertEqual(datetime.fromisoformat(row["timestamp"]), original["timestamp"])
+            self.assertEqual(row["heart_rate"], original["heart_rate"])
+            # PostgreSQL hands back memoryviews
+            packed = original["raw_ppg_packed"]
+            self.assertEqual(row["raw_ppg_packed"], bytes(packed) if packed is not None else None)
+        packed = next(row["raw_ppg_packed"] for row in restored if row["raw_ppg_packed"])
+        self.assertEqual(ppg.to_python(packed), [5, 7, 9, 7])
+        # The hourly/daily history survives
+        self.assertEqual(sum(VitalsRollup.objects.filter(period=VitalsRollup.DAY)
+                             .values_list("count", flat=True)), 4)
+
+    def archive(self):
+        call_command("archive_measurements", days=180, chunk_size=2, stdout=mock.Mock())
+
+    def test_rebuild_uses_each_patients_own_horizon(self):
+        old = VitalsRollup.bucket_for(timezone.now() - timedelta(days=200), VitalsRollup.DAY) + timedelta(hours=1)
+        self.add_readings(old, 2)
+        self.archive()
+        other = PatientProfile.objects.create(
+            user=User.objects.create_user("other", password="pw", is_patient=True), gender="M")
+        Measurement.objects.create(patient=other, timestamp=old, heart_rate=80)
+
+        call_command("rebuild_vitals_rollups", stdout=mock.Mock())
+        days = VitalsRollup.objects.filter(period=VitalsRollup.DAY, bucket_start__lt=old + timedelta(days=1))
+        # this patient's archived history is kept, the other's old reading is rolled up
+        self.assertEqual(dict(days.values_list("patient_id", "count")), {self.profile.pk: 2, other.pk: 1})
+
+    def test_export_includes_archived_readings(self):
+        old = timezone.now() - timedelta(days=200)
+        self.add_readings(old, 3, step=timedelta(days=1), heart_rate=61)
+        self.add_readings(timezone.now() - timedelta(days=1), 1)
+        window = {"start": old + timedelta(hours=12), "end": old + timedelta(days=5)}
+        before = list(export.records(self.profile)), list(export.records(self.profile, **window))
+
+        self.archive()
+        self.assertEqual(Measurement.objects.count(), 1)
+        self.assertEqual((list(export.records(self.profile)), list(export.records(self.profile, **window))),
+                         before)
+        self.assertEqual([row["heart_rate"] for _, row in before[1]], [61, 61])
+
+        async def collect():
+            return [record async for record in export.arecords(self.profile)]
+        self.assertEqual(async_to_sync(collect)(), before[0])
+
+    def test_rebuild_keeps_snapshot_of_archived_readings(self):
+        readings = self.add_readings(timezone.now() - timedelta(days=200), 2, heart_rate=61)
+        LatestVitals.record(readings)
+        self.archive()
+        self.assertFalse(Measurement.objects.exists())
+
+        LatestVitals.objects.all().delete()
+        self.assertEqual(LatestVitals.rebuild(PatientProfile.objects.all()), 1)
+        snapshot = LatestVitals.objects.get(patient=self.profile)
+        self.assertEqual((snapshot.timestamp, snapshot.heart_rate), (readings[-1].timestamp, 61))
+        self.assertIsNone(snapshot.measurement_id)
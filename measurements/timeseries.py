@@ -0,0 +1,220 @@
+# health_project/measurements/timeseries.py
+"""
+Server-side downsampling for the chart endpoints. Readings are bucketed
+per interval in the database and returned as min/mean/max, so the payload
+size depends on the number of buckets rather than the length of the window.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import pagination, rules
+from .models import VitalsRollup
+
+# name -> (truncate function, bucket width)
+RESOLUTIONS = {
+    "minute": (TruncMinute, timedelta(minutes=1)),
+    "hour": (TruncHour, timedelta(hours=1)),
+    "day": (TruncDay, timedelta(days=1)),
+    "week": (TruncWeek, timedelta(weeks=1)),
+    "month": (TruncMonth, timedelta(days=31)),
+}
+METRICS = ("heart_rate", "spo2", "temperature", "systolic_bp", "diastolic_bp")
+MAX_POINTS_LIMIT = 5000
+# The fields of a bucket row (see bucket_row), in order
+BUCKET_FIELDS = ("timestamp", "count",
+                 *(f"{metric}{suffix}" for metric in METRICS for suffix in ("", "_min", "_max", "_out_of_range")),
+                 "bp_category")
+
+
+class TimeSeriesError(ValueError):
+    pass
+
+
+def parse_when(value, name):
+    if not value:
+        return None
+    dt = parse_datetime(value)
+    if dt is None:
+        d = parse_date(value)
+        if d is None:
+            raise TimeSeriesError(f"Invalid {name}")
+        dt = datetime.combine(d, time.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def parse_params(params):
+    """
+    Read start/end/resolution/max_points from a QueryDict. Returns None when
+    none of them are present so callers can keep their legacy behaviour.
+    """
+    if not any(k in params for k in ("start", "end", "resolution", "max_points")):
+        return None
+    start = parse_when(params.get("start"), "start")
+    end = parse_when(params.get("end"), "end")
+    if start and end and start >= end:
+        raise TimeSeriesError("start must be before end")
+
+    resolution = params.get("resolution") or None
+    if resolution and resolution != "raw" and resolution not in RESOLUTIONS:
+        raise TimeSeriesError(f"resolution must be one of raw, {', '.join(RESOLUTIONS)}")
+
+    max_points = params.get("max_points")
+    try:
+        max_points = int(max_points) if max_points else None
+    except ValueError:
+        raise TimeSeriesError("Invalid max_points")
+    if max_points is not None and not (1 <= max_points <= MAX_POINTS_LIMIT):
+        raise TimeSeriesError(f"max_points must be between 1 and {MAX_POINTS_LIMIT}")
+
+    return {"start": start, "end": end, "resolution": resolution, "max_points": max_points}
+
+
+def window(qs, start=None, end=None):
+    if start:
+        qs = qs.filter(timestamp__gte=start)
+    if end:
+        qs = qs.filter(timestamp__lt=end)
+    return qs
+
+
+def choose_resolution(qs, start, end, max_points):
+    """
+    Pick the finest resolution that keeps the series under max_points. A
+    window too long even for monthly buckets gets months, and ``limit``
+    pages through them.
+    """
+    stats = qs.aggregate(n=Count("id"), first=Min("timestamp"), last=Max("timestamp"))
+    if stats["n"] <= max_points:
+        return "raw"
+    span = (end or stats["last"]) - (start or stats["first"])
+    for name, (_, width) in RESOLUTIONS.items():
+        if span / width <= max_points:
+            return name
+    return name
+
+
+def before_cursor(qs, params):
+    """
+    Narrow ``qs`` to the readings before ``params["cursor"]`` (from ``limit``).
+    Returns (qs, new end of the window).
+    """
+    if not params.get("cursor"):
+        return qs, None
+    value, _ = pagination.decode_cursor(params["cursor"])
+    end = parse_when(value, "cursor")
+    return qs.filter(timestamp__lt=end), end
+
+
+def limit(data, max_points):
+    """
+    The newest ``max_points`` buckets of ``data`` (newest first) and a
+    cursor for the rest, or None when they all fit.
+    """
+    if len(data) <= max_points:
+        return data, None
+    data = data[:max_points]
+    return data, pagination.encode_cursor(datetime.fromisoformat(data[-1]["timestamp"]), 0)
+
+
+def bucketed(qs, resolution):
+    """Aggregate ``qs`` into one row per bucket, newest bucket first."""
+    trunc, _ = RESOLUTIONS[resolution]
+    aggregates = {"count": Count("id")}
+    for metric in METRICS:
+        aggregates[f"{metric}_mean"] = Avg(metric)
+        aggregates[f"{metric}_min"] = Min(metric)
+        aggregates[f"{metric}_max"] = Max(metric)
+        aggregates[f"{metric}_out_of_range"] = Count("id", filter=VitalsRollup.out_of_range(metric))
+    rows = (qs.order_by()
+              .annotate(bucket=trunc("timestamp"))
+              .values("bucket")
+              .annotate(**aggregates)
+              .order_by("-bucket"))
+    return [bucket_row(row) for row in rows]
+
+
+def rolled_up(patient, resolution, start=None, end=None):
+    """
+    Read hourly/daily buckets from VitalsRollup instead of scanning raw
+    readings. Returns an empty list when the resolution has no rollup.
+    Buckets overlapping the window edges are returned whole.
+    """
+    if resolution not in (VitalsRollup.HOUR, VitalsRollup.DAY):
+        return []
+    rows = VitalsRollup.objects.filter(patient=patient, period=resolution)
+    if start:
+        rows = rows.filter(bucket_start__gte=VitalsRollup.bucket_for(start, resolution))
+    if end:
+        rows = rows.filter(bucket_start__lt=end)
+    data = []
+    for rollup in rows.order_by("-bucket_start"):
+        row = {"bucket": rollup.bucket_start, "count": rollup.count}
+        for metric in METRICS:
+            row[f"{metric}_mean"] = rollup.mean(metric)
+            row[f"{metric}_min"] = getattr(rollup, f"{metric}_min")
+            row[f"{metric}_max"] = getattr(rollup, f"{metric}_max")
+            row[f"{metric}_out_of_range"] = getattr(rollup, f"{metric}_out_of_range")
+        data.append(bucket_row(row))
+    return data
+
+
+def buckets(patient, qs, resolution, start=None, end=None):
+    """
+    ``qs`` (the patient's readings between ``start`` and ``end``) as buckets,
+    newest first. Hourly and daily buckets are read from the rollups from
+    the patient's first rollup onwards; readings older than that (history
+    from before rollups were kept that hasn't been backfilled) are bucketed
+    from the raw rows.
+    """
+    if resolution not in (VitalsRollup.HOUR, VitalsRollup.DAY):
+        return bucketed(qs, resolution)
+    first = (VitalsRollup.objects.filter(patient=patient, period=resolution)
+             .aggregate(first=Min("bucket_start"))["first"])
+    if first is None:
+        return bucketed(qs, resolution)
+    data = rolled_up(patient, resolution, start, end) if end is None or end > first else []
+    if start is None or start < first:
+        data += bucketed(qs.filter(timestamp__lt=first), resolution)
+    return data
+
+
+def bucket_row(row):
+    data = {"timestamp": row["bucket"].isoformat(), "count": row["count"]}
+    for metric in METRICS:
+        mean = row[f"{metric}_mean"]
+        data[metric] = round(mean, 1) if mean is not None else None
+        data[f"{metric}_min"] = row[f"{metric}_min"]
+        data[f"{metric}_max"] = row[f"{metric}_max"]
+        data[f"{metric}_out_of_range"] = row[f"{metric}_out_of_range"]
+    data["bp_category"] = rules.VITALS.evaluate(data).label("bp")
+    return data
+
+
+def epoch(dt):
+    return round(dt.timestamp(), 3)
+
+
+def raw_columns(rows):
+    """
+    Parallel arrays for raw readings (dicts from ``.values("id", "timestamp",
+    *METRICS)``), with epoch-second timestamps and bp_category classified
+    in one vectorized pass.
+    """
+    data = {"timestamp": [epoch(r["timestamp"]) for r in rows], "id": [r["id"] for r in rows]}
+    for metric in METRICS:
+        data[metric] = [r[metric] for r in rows]
+    data["bp_category"] = rules.VITALS.evaluate_batch(data).labels("bp").tolist() if rows else []
+    return data
+
+
+def to_columns(rows):
+    """Pivot bucketed rows (lists of dicts from ``bucketed``/``rolled_up``) into parallel arrays."""
+    data = {key: [row[key] for row in rows] for key in BUCKET_FIELDS}
+    data["timestamp"] = [epoch(datetime.fromisoformat(ts)) for ts in data["timestamp"]]
+    return data
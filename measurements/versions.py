@@ -0,0 +1,75 @@
+# health_project/measurements/versions.py
+"""
+Cheap version tokens for the patient JSON endpoints, used for HTTP
+conditional requests (ETag / Last-Modified -> 304 Not Modified).
+
+Each token is one aggregate query over indexed columns (counts, max ids,
+updated_at stamps); no rows are materialized. Counts and max ids catch
+rows being added or deleted, the stamps catch edits. Measurements, too
+many to count on every request, are versioned on stamps maintained as
+they are written. Views compute
+the token first and only run their main query when it has changed. The
+patient tokens are coroutines, for the async patient endpoints.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import rules
+from .models import PatientProfile
+
+
+class Version:
+    __slots__ = ("etag", "last_modified")
+
+    def __init__(self, *parts, last_modified=None):
+        self.etag = '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+        self.last_modified = last_modified
+
+    def not_modified(self, request):
+        """A 304 response if the client's copy is current, else None."""
+        return get_conditional_response(
+            request, etag=self.etag,
+            last_modified=int(self.last_modified.timestamp()) if self.last_modified else None)
+
+    def stamp(self, response):
+        response["ETag"] = self.etag
+        if self.last_modified:
+            response["Last-Modified"] = http_date(self.last_modified.timestamp())
+        # Let the browser keep the body but check back every time
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+async def ameasurements(profile):
+    # LatestVitals.updated_at moves on every reading recorded at ingest (late
+    # ones too), when process_ppg fills in vitals and on reclassification;
+    # the archive horizon moves when old readings are archived. Buckets are
+    # classified at read time, so the rules are part of the version too.
+    agg = await PatientProfile.objects.filter(pk=profile.pk).aaggregate(
+        updated=Max("latest_vitals__updated_at"), archived=Max("measurement_archives__before"))
+    return Version("measurements", profile.pk, rules.VITALS.fingerprint, agg["updated"], agg["archived"],
+                   last_modified=agg["updated"])
+
+
+async def asymptoms(profile):
+    agg = await profile.symptoms.order_by().aaggregate(n=Count("id"), last_id=Max("id"), last=Max("created_at"))
+    return Version("symptoms", profile.pk, agg["n"], agg["last_id"], last_modified=agg["last"])
+
+
+async def amenstrual(profile):
+    agg = await profile.menstrual_cycles.order_by().aaggregate(
+        n=Count("id"), last_id=Max("id"), updated=Max("updated_at"))
+    return Version("menstrual", profile.pk, agg["n"], agg["last_id"], agg["updated"],
+                   last_modified=agg["updated"])
+
+
+def doctor_patients(doctor):
+    # The profiles' own stamp covers edits to them and their users (names)
+    agg = PatientProfile.objects.filter(assigned_doctor=doctor).aggregate(
+        n=Count("id"), ids=Sum("id"), vitals=Max("latest_vitals__updated_at"), profiles=Max("updated_at"))
+    stamps = [stamp for stamp in (agg["vitals"], agg["profiles"]) if stamp]
+    return Version("doctor-patients", doctor.pk, agg["n"], agg["ids"], agg["vitals"], agg["profiles"],
+                   last_modified=max(stamps, default=None))
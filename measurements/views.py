@@ -1,115 +1,120 @@
 # health_project/measurements/views.py
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from .models import PatientProfile, Measurement, Symptom, MenstrualCycle
-from django.http import JsonResponse
+from .models import PatientProfile, Measurement, Symptom, MenstrualCycle, LatestVitals, ToolTip
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from . import events, export, fragments, pagination, rules, summaries, timeseries, versions
+from django.conf import settings
+from django.db.models import F, OuterRef, Prefetch, Subquery, prefetch_related_objects
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils.dateparse import parse_datetime
 from django.views.decorators.http import require_POST
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.contrib import messages
 
 
 
+def _with_latest(patients):
+    """
+    Attach each patient's latest vitals snapshot and menstrual cycle as
+    ``latest`` / ``latest_cycle`` using a fixed number of queries,
+    instead of two extra queries per patient.
+    """
+    latest_cycle = MenstrualCycle.objects.filter(
+        patient=OuterRef("pk")).order_by("-start_date").values("pk")[:1]
+    patients = list(patients.select_related("latest_vitals").annotate(
+        latest_cycle_id=Subquery(latest_cycle),
+    ))
+    cycles = MenstrualCycle.objects.in_bulk(
+        [p.latest_cycle_id for p in patients if p.latest_cycle_id])
+    for p in patients:
+        p.latest = p.vitals
+        p.latest_cycle = cycles.get(p.latest_cycle_id)
+    return patients
+
+
+# What the patient dashboard's cached fragments show, fetched together the
+# first time one of them misses the cache
+PATIENT_DASHBOARD_PREFETCH = (
+    Prefetch("symptoms", Symptom.objects.order_by("-created_at", "-id")[:10], to_attr="recent_symptoms"),
+    Prefetch("menstrual_cycles", MenstrualCycle.objects.order_by("-start_date", "-id")[:3],
+             to_attr="recent_cycles"),
+    Prefetch("tooltips", ToolTip.objects.order_by("-created_at", "-id")[:3], to_attr="recent_tooltips"),
+)
+
+
+def _patient_data(profile):
+    if not hasattr(profile, "recent_symptoms"):
+        prefetch_related_objects([profile], *PATIENT_DASHBOARD_PREFETCH)
+    return profile
+
+
+def _recommendations(profile):
+    latest = profile.vitals if profile else None
+    recommendations = rules.VITALS.evaluate(latest).advice
+
+    # Fibroid/Menstrual Monitoring (for female patients)
+    if latest and profile.gender == 'F':
+        cycles = _patient_data(profile).recent_cycles
+        recommendations += rules.CYCLE.evaluate(cycles[0] if cycles else None).advice
+    return recommendations
+
+
 @login_required
 def patient_dashboard(request):
     if not request.user.is_patient:
         return redirect("doctor-dashboard")
-    profile = PatientProfile.objects.filter(user=request.user).first()
-    # print(f"User gender: {profile.gender if profile else 'No profile'}")
-    
-    latest = profile.measurements.first() if profile else None
-    recommendations = []
-    if latest:
-        if latest.spo2 is not None and latest.spo2 < 95:
-            recommendations.append("Re-check SpO₂ in 30 mins; rest.")
-        if latest.heart_rate is not None and (latest.heart_rate > 100 or latest.heart_rate < 50):
-            recommendations.append("Unusual heart rate — contact your doctor if persistent.")
-
-    if latest:
-        # Blood Pressure Recommendations
-        if latest.systolic_bp and latest.diastolic_bp:
-            bp_category = latest.bp_category
-            if bp_category == "Stage 2 Hypertension":
-                recommendations.append("HIGH BLOOD PRESSURE ALERT: Seek immediate medical attention.")
-            elif bp_category == "Stage 1 Hypertension":
-                recommendations.append("Blood pressure elevated - schedule doctor consultation.")
-
-        # Fibroid/Menstrual Monitoring (for female patients)
-        if profile.gender == 'F':
-            latest_cycle = profile.menstrual_cycles.order_by('-start_date').first()
-            if latest_cycle and latest_cycle.flow_intensity == 'heavy':
-                recommendations.append("Heavy menstrual bleeding detected - monitor for anemia symptoms.")
-            
-            if latest_cycle and latest_cycle.pain_level >= 8:
-                recommendations.append("Severe menstrual pain reported - consider medical evaluation.")
-
-    # Add symptoms + latest tooltip to context
-    recent_symptoms = profile.symptoms.order_by('-created_at')[:10] if profile else []
-    latest_tooltip = profile.tooltips.order_by('-created_at').first() if profile else None
+    profile = fragments.with_versions(
+        PatientProfile.objects.select_related("user", "latest_vitals").filter(user=request.user)).first()
 
+    # The lists below are lazy: they are only loaded (one prefetch plan) when
+    # a fragment isn't cached for the current data versions
     context = {
         "profile": profile,
-        "latest": latest,
-        "recommendations": recommendations,
-        "recent_symptoms": profile.symptoms.order_by('-created_at')[:10] if profile else [],
-        "menstrual_data": profile.menstrual_cycles.order_by('-start_date')[:3] if profile and profile.gender == 'F' else None,
-        "latest_tooltip": latest_tooltip,
+        "latest": profile.vitals if profile else None,
+        "versions": fragments.data_versions(profile) if profile else {},
+        "fragment_ttl": settings.PATIENT_DASHBOARD_CACHE_TTL,
+        "recommendations": SimpleLazyObject(lambda: _recommendations(profile)),
+        "recent_symptoms": SimpleLazyObject(lambda: _patient_data(profile).recent_symptoms) if profile else [],
+        "recent_tooltips": SimpleLazyObject(lambda: _patient_data(profile).recent_tooltips) if profile else [],
+        "menstrual_data": SimpleLazyObject(lambda: _patient_data(profile).recent_cycles) if profile and profile.gender == 'F' else None,
         "show_menstrual": profile.gender == 'F' if profile else False,  # Add this explicit flag
     }
-    
-    # Debug print - remove after testing
-    # print(f"Menstrual data: {context['menstrual_data']}")
-    # print(f"Show menstrual: {context['show_menstrual']}")
-    
     return render(request, "measurements/patient_dashboard.html", context)
 
 
-
 @login_required
 def doctor_dashboard(request):
     if not request.user.is_doctor:
         return redirect("patient-dashboard")
 
-    patients = PatientProfile.objects.filter(assigned_doctor=request.user).select_related("user")
-    data = []
-    for p in patients:
-        latest = p.measurements.first()
-        condition = "Stable"
-        alerts = []
-
-        if latest:
-            # Check vitals
-            if latest.spo2 and latest.spo2 < 94:
-                condition = "Low SpO₂"
-                alerts.append("Low oxygen saturation")
-            elif latest.heart_rate and (latest.heart_rate < 50 or latest.heart_rate > 110):
-                condition = "Abnormal HR"
-                alerts.append("Abnormal heart rate")
-            
-            # Check blood pressure
-            if latest.systolic_bp and latest.diastolic_bp:
-                if latest.bp_category == "Stage 2 Hypertension":
-                    condition = "Severe HTN"
-                    alerts.append("Stage 2 Hypertension")
-                elif latest.bp_category == "Stage 1 Hypertension":
-                    condition = "Stage 1 HTN"
-                    alerts.append("Stage 1 Hypertension")
+    # Rows are cached per patient and rebuilt only when their data changes
+    data = summaries.doctor_rows(request.user, _dashboard_rows)
+    return render(request, "measurements/doctor_dashboard.html", {"patients": data})
+
+
+def _dashboard_rows(patients):
+    """The doctor dashboard row of each of ``patients``, keyed by profile id."""
+    rows = {}
+    for p in _with_latest(patients.select_related("user")):
+        latest = p.latest
+        vitals = rules.VITALS.evaluate(latest)
+        condition = vitals.condition
+        alerts = vitals.alerts
 
         # Check menstrual data for female patients
         if p.gender == 'F':
-            latest_cycle = p.menstrual_cycles.order_by('-start_date').first()
-            if latest_cycle:
-                if latest_cycle.flow_intensity == 'heavy':
-                    alerts.append("Heavy menstrual bleeding")
-                if latest_cycle.pain_level >= 8:
-                    alerts.append("Severe menstrual pain")
+            alerts += rules.CYCLE.evaluate(p.latest_cycle).alerts
         last_seen = None
         if latest and latest.timestamp:
             last_seen = {
                 'date': latest.timestamp.strftime("%b %d, %Y"),
                 'time': latest.timestamp.strftime("%H:%M")
             }
-        data.append({
+        rows[p.pk] = {
             "user_id": str(p.user.id),
             "username": p.user.username,
             "full_name": f"{p.user.first_name} {p.user.last_name}",
@@ -118,14 +123,13 @@ def doctor_dashboard(request):
             "latest_spo2": latest.spo2 if latest else None,
             "latest_temp": latest.temperature if latest else None,
             "latest_bp": f"{latest.systolic_bp}/{latest.diastolic_bp}" if latest and latest.systolic_bp and latest.diastolic_bp else None,
-            "bp_category": latest.bp_category if latest and latest.systolic_bp and latest.diastolic_bp else None,
+            "bp_category": vitals.label("bp"),
             "last_seen": last_seen,
             "condition": condition,
             "alerts": alerts,
             "gender": p.gender
-        })
-
-    return render(request, "measurements/doctor_dashboard.html", {"patients": data})
+        }
+    return rows
 
 # @login_required
 # def patient_measurements_json(request):
@@ -146,22 +150,70 @@ def doctor_dashboard(request):
 #     qs = profile.measurements.all()[:500]
 #     data = [{"timestamp":m.timestamp.isoformat(), "heart_rate":m.heart_rate, "spo2":m.spo2, "temperature":m.temperature, "id":m.id} for m in qs]
 #     return JsonResponse(data, safe=False)
+# The patient JSON endpoints are async: the profile lookup and the version
+# check (enough to answer a 304) use the async ORM, and the payload query
+# runs as one hop on the ORM thread.
+
 @login_required
-def patient_measurements_json(request):
-    if request.user.is_doctor:
+async def patient_measurements_json(request):
+    user = await request.auser()
+    if user.is_doctor:
         pid = request.GET.get("patient_id")
         if not pid:
             return JsonResponse({"error":"patient_id required"}, status=400)
         try:
-            profile = PatientProfile.objects.get(user__id=pid, assigned_doctor=request.user)
+            profile = await PatientProfile.objects.aget(user__id=pid, assigned_doctor=user)
         except PatientProfile.DoesNotExist:
             return JsonResponse({"error":"not found"}, status=404)
     else:
-        profile = PatientProfile.objects.filter(user=request.user).first()
+        profile = await PatientProfile.objects.filter(user=user).afirst()
         if not profile:
             return JsonResponse({"error":"profile not found"}, status=404)
 
-    qs = profile.measurements.all()[:500]
+    version = await versions.ameasurements(profile)
+    not_modified = version.not_modified(request)
+    if not_modified:
+        return not_modified
+    try:
+        data, next_cursor = await sync_to_async(_measurement_series)(profile, request.GET)
+    except (timeseries.TimeSeriesError, pagination.PaginationError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return version.stamp(pagination.with_next(JsonResponse(data, safe=False), request, next_cursor))
+
+
+def _measurement_series(profile, query):
+    """
+    The measurements payload for ``query`` (a QueryDict): raw readings one
+    cursor page at a time, or buckets when a window/resolution is asked for.
+    Returns (data, next cursor or None). format=columnar gives parallel
+    arrays with epoch-second timestamps.
+    """
+    params = timeseries.parse_params(query)
+    columnar = query.get("format") == "columnar"
+
+    if params is None:
+        qs = profile.measurements.all()
+        page_size = 500
+    else:
+        qs = timeseries.window(profile.measurements.all(), params["start"], params["end"])
+        resolution = params["resolution"]
+        max_points = params["max_points"] or (500 if resolution is None else timeseries.MAX_POINTS_LIMIT)
+        if resolution is None:
+            resolution = timeseries.choose_resolution(qs, params["start"], params["end"], max_points)
+        if resolution != "raw":
+            # Buckets past max_points are paged like raw readings, newest first
+            qs, end = timeseries.before_cursor(qs, query)
+            data = timeseries.buckets(profile, qs, resolution, params["start"], end or params["end"])
+            data, next_cursor = timeseries.limit(data, max_points)
+            return (timeseries.to_columns(data) if columnar else data), next_cursor
+        page_size = params["max_points"] or 500
+
+    if columnar:
+        qs = qs.values("id", "timestamp", *timeseries.METRICS)
+    qs, next_cursor = pagination.paginate(qs, query, "timestamp", page_size, timeseries.MAX_POINTS_LIMIT)
+    if columnar:
+        return timeseries.raw_columns(qs), next_cursor
+
     data = [{
         "timestamp": m.timestamp.isoformat(),
         "heart_rate": m.heart_rate,
@@ -172,15 +224,85 @@ def patient_measurements_json(request):
         "bp_category": m.bp_category,
         "id": m.id
     } for m in qs]
-    return JsonResponse(data, safe=False)
+    return data, next_cursor
+
+
+def _symptom_row(s):
+    return {"symptom_type": s.get_symptom_type_display(), "created_at": s.created_at}
+
+
+def _cycle_row(m):
+    return {
+        "start_date": m.start_date.isoformat() if m.start_date else None,
+        "end_date": m.end_date.isoformat() if m.end_date else None,
+        "flow_intensity": m.flow_intensity,
+        "pain_level": m.pain_level,
+        "notes": m.notes
+    }
+
+
+@login_required
+def doctor_patient_detail_json(request):
+    """
+    Everything the doctor's patient modal shows, in one request: the chart
+    measurements (same query parameters as patient_measurements_json, default
+    max_points=500), recent symptoms, menstrual cycles and the latest tooltip.
+    """
+    if not request.user.is_doctor:
+        return JsonResponse({"error":"for doctors only"}, status=403)
+    pid = request.GET.get("patient_id")
+    if not pid:
+        return JsonResponse({"error":"patient_id required"}, status=400)
+    try:
+        profile = (PatientProfile.objects
+                   .select_related("user")
+                   .prefetch_related(
+                       Prefetch("symptoms", Symptom.objects.order_by("-created_at", "-id")[:20],
+                                to_attr="recent_symptoms"),
+                       Prefetch("menstrual_cycles", MenstrualCycle.objects.order_by("-start_date", "-id")[:10],
+                                to_attr="recent_cycles"),
+                       Prefetch("tooltips", ToolTip.objects.order_by("-created_at", "-id")[:1],
+                                to_attr="recent_tooltips"))
+                   .get(user__id=pid, assigned_doctor=request.user))
+    except (PatientProfile.DoesNotExist, ValidationError):
+        return JsonResponse({"error":"not found"}, status=404)
+
+    query = request.GET.copy()
+    if not any(k in query for k in ("start", "end", "resolution", "max_points")):
+        query["max_points"] = "500"
+    try:
+        measurements, next_cursor = _measurement_series(profile, query)
+    except (timeseries.TimeSeriesError, pagination.PaginationError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    tooltip = profile.recent_tooltips[0] if profile.recent_tooltips else None
+    return JsonResponse({
+        "patient": {
+            "user_id": str(profile.user.id),
+            "username": profile.user.username,
+            "full_name": f"{profile.user.first_name} {profile.user.last_name}",
+            "gender": profile.gender,
+        },
+        "measurements": measurements,
+        "measurements_next_cursor": next_cursor,
+        "symptoms": [_symptom_row(s) for s in profile.recent_symptoms],
+        "menstrual": [_cycle_row(m) for m in profile.recent_cycles],
+        "latest_tooltip": {"message": tooltip.message, "created_at": tooltip.created_at} if tooltip else None,
+    })
+
+
 @login_required
 def doctor_patients_json(request):
     if not request.user.is_doctor:
         return JsonResponse({"error":"for doctors only"}, status=403)
-    patients = PatientProfile.objects.filter(assigned_doctor=request.user).select_related("user")
+    version = versions.doctor_patients(request.user)
+    not_modified = version.not_modified(request)
+    if not_modified:
+        return not_modified
+    patients = _with_latest(PatientProfile.objects.filter(assigned_doctor=request.user).select_related("user"))
     data = []
     for p in patients:
-        latest = p.measurements.first()
+        latest = p.latest
         data.append({
             "user_id": str(p.user.id),
             "username": p.user.username,
@@ -190,6 +312,113 @@ def doctor_patients_json(request):
             "latest_temp": latest.temperature if latest else None,
             "last_seen": latest.timestamp.isoformat() if latest else None
         })
+    return version.stamp(JsonResponse(data, safe=False))
+
+@login_required
+def patient_export(request):
+    """
+    Stream a patient's full history as NDJSON (default) or CSV:
+    ?format=ndjson|csv, optional start/end, and patient_id for doctors.
+    """
+    if request.user.is_doctor:
+        pid = request.GET.get("patient_id")
+        if not pid:
+            return JsonResponse({"error":"patient_id required"}, status=400)
+        try:
+            profile = PatientProfile.objects.select_related("user").get(user__id=pid, assigned_doctor=request.user)
+        except PatientProfile.DoesNotExist:
+            return JsonResponse({"error":"not found"}, status=404)
+    else:
+        profile = PatientProfile.objects.select_related("user").filter(user=request.user).first()
+        if not profile:
+            return JsonResponse({"error":"profile not found"}, status=404)
+
+    fmt = request.GET.get("format", "ndjson")
+    if fmt not in export.FORMATS:
+        return JsonResponse({"error": f"format must be one of {', '.join(export.FORMATS)}"}, status=400)
+    try:
+        start = timeseries.parse_when(request.GET.get("start"), "start")
+        end = timeseries.parse_when(request.GET.get("end"), "end")
+    except timeseries.TimeSeriesError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Under ASGI the stream has to be async, or Django buffers all of it
+    stream = export.astream if isinstance(request, ASGIRequest) else export.stream
+    response = StreamingHttpResponse(
+        stream(profile, fmt, start, end),
+        content_type="application/x-ndjson" if fmt == "ndjson" else "text/csv",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{profile.user.username}-history.{fmt}"'
+    return response
+
+
+@login_required
+async def live_events(request):
+    """
+    Server-Sent Events stream of new measurements (with their alerts) for
+    the patient's own profile, or every patient assigned to the doctor.
+    Needs the ASGI server; see measurements/events.py.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error":"live updates need the ASGI server"}, status=501)
+    user = await request.auser()
+    if user.is_doctor:
+        qs = PatientProfile.objects.filter(assigned_doctor=user)
+    else:
+        qs = PatientProfile.objects.filter(user=user)
+        if not await qs.aexists():
+            return JsonResponse({"error":"profile not found"}, status=404)
+
+    async def following():
+        return {pk: str(user_id) async for pk, user_id in qs.values_list("id", "user_id")}
+
+    response = StreamingHttpResponse(
+        events.stream(following),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
+
+
+@login_required
+def doctor_alerts_json(request):
+    """
+    The doctor's patients whose latest reading is at or above ``min_level``
+    (default "warning"), most critical first. ``flags`` narrows this to
+    patients matching any of the given rule codes, e.g. flags=BP_STAGE2,SPO2_LOW.
+    """
+    if not request.user.is_doctor:
+        return JsonResponse({"error":"for doctors only"}, status=403)
+    min_level = request.GET.get("min_level", "warning")
+    if min_level not in rules.LEVELS:
+        return JsonResponse({"error": f"min_level must be one of {', '.join(rules.LEVELS)}"}, status=400)
+    codes = [c for c in request.GET.get("flags", "").upper().split(",") if c]
+    unknown = [c for c in codes if c not in rules.VITALS.by_code]
+    if unknown:
+        return JsonResponse({"error": f"Unknown flag(s): {', '.join(unknown)}"}, status=400)
+
+    qs = (LatestVitals.objects
+          .filter(patient__assigned_doctor=request.user, alert_level__gte=rules.LEVELS.index(min_level))
+          .order_by("-alert_level", "-timestamp"))
+    if codes:
+        qs = qs.alias(hits=F("alert_flags").bitand(rules.VITALS.flag(*codes))).filter(hits__gt=0)
+    rows = qs.values_list("patient__user_id", "patient__user__username", "patient__user__first_name",
+                          "patient__user__last_name", "alert_level", "alert_flags", "timestamp")
+
+    data = []
+    for user_id, username, first_name, last_name, level, flags, timestamp in rows:
+        matched = rules.VITALS.decode(flags)
+        data.append({
+            "user_id": str(user_id),
+            "username": username,
+            "full_name": f"{first_name} {last_name}",
+            "level": rules.LEVELS[level],
+            "alerts": [r.alert for r in matched if r.alert],
+            "codes": [r.code for r in matched if r.level > rules.NORMAL],
+            "bp_category": next((r.label for r in matched if r.group == "bp"), None),
+            "timestamp": timestamp.isoformat(),
+        })
     return JsonResponse(data, safe=False)
 
 from .models import Symptom, ToolTip  # add ToolTip import at top with your other imports
@@ -228,7 +457,9 @@ def submit_symptom(request):
     )
 
     # Fetch latest measurement (if any)
-    latest = profile.measurements.first()
+    latest = profile.vitals
+    vitals = rules.VITALS.evaluate(latest)
+    low_spo2 = vitals.has("SPO2_LOW", "SPO2_BORDERLINE")
 
     # Generate a safe, conservative tooltip message (NOT a formal diagnosis)
     message = "Monitor your symptoms and follow up with your doctor if things worsen."
@@ -237,16 +468,12 @@ def submit_symptom(request):
     if symptom_type == "fever":
         # if we have temperature data, use it
         if latest and latest.temperature:
-            try:
-                temp = float(latest.temperature)
-                if temp >= 38.5:
-                    message = "High temperature recorded (≥38.5°C). Rest, stay hydrated, consider antipyretic, and contact your healthcare provider."
-                elif temp >= 37.5:
-                    message = "Mild fever recorded. Rest, hydrate, and re-check temperature in 2–3 hours."
-                else:
-                    message = "Fever reported but latest temperature is normal. Re-check temperature and monitor."
-            except:
-                message = "Fever reported — monitor temperature regularly and rest."
+            if vitals.has("FEVER_HIGH"):
+                message = "High temperature recorded (≥38.5°C). Rest, stay hydrated, consider antipyretic, and contact your healthcare provider."
+            elif vitals.has("FEVER"):
+                message = "Mild fever recorded. Rest, hydrate, and re-check temperature in 2–3 hours."
+            else:
+                message = "Fever reported but latest temperature is normal. Re-check temperature and monitor."
         else:
             message = "Fever reported — monitor temperature regularly, rest, and stay hydrated."
 
@@ -254,20 +481,20 @@ def submit_symptom(request):
         message = "Headache reported. Rest in a quiet, dim room, stay hydrated. Seek help if severe or sudden."
 
     elif symptom_type == "fatigue":
-        if latest and latest.heart_rate and latest.heart_rate > 100:
+        if vitals.has("HR_HIGH", "HR_ELEVATED"):
             message = "Fatigue with elevated heart rate. Rest, avoid strenuous activity, and contact your doctor if it continues."
         else:
             message = "Fatigue reported. Ensure adequate sleep and hydration; contact your clinician if persistent."
 
     elif symptom_type == "chest_pain":
         # chest pain is urgent — check SpO2/HR if available
-        if latest and latest.spo2 and latest.spo2 < 94:
+        if low_spo2:
             message = "Chest pain with low SpO₂ detected. Seek urgent medical attention (call emergency services)."
         else:
             message = "Chest pain reported — seek immediate medical attention."
 
     elif symptom_type == "shortness_of_breath":
-        if latest and latest.spo2 and latest.spo2 < 94:
+        if low_spo2:
             message = "Shortness of breath with low SpO₂. Seek urgent medical care."
         else:
             message = "Shortness of breath reported. Sit upright, try controlled breathing. Seek care if it worsens."
@@ -285,20 +512,30 @@ def submit_symptom(request):
     return redirect("patient-dashboard")
 
 @login_required
-def patient_symptoms_json(request):
-    if request.user.is_doctor:
+async def patient_symptoms_json(request):
+    user = await request.auser()
+    if user.is_doctor:
         pid = request.GET.get("patient_id")
         if not pid:
             return JsonResponse({"error": "patient_id required"}, status=400)
         try:
-            profile = PatientProfile.objects.get(user__id=pid, assigned_doctor=request.user)
+            profile = await PatientProfile.objects.aget(user__id=pid, assigned_doctor=user)
         except PatientProfile.DoesNotExist:
             return JsonResponse({"error": "not found"}, status=404)
     else:
-        profile = PatientProfile.objects.filter(user=request.user).first()
-    qs = profile.symptoms.all().order_by('-created_at')[:20]
-    data = [{"symptom_type": s.get_symptom_type_display(), "created_at": s.created_at} for s in qs]
-    return JsonResponse(data, safe=False)
+        profile = await PatientProfile.objects.filter(user=user).afirst()
+        if not profile:
+            return JsonResponse({"error": "profile not found"}, status=404)
+    version = await versions.asymptoms(profile)
+    not_modified = version.not_modified(request)
+    if not_modified:
+        return not_modified
+    try:
+        qs, next_cursor = await pagination.apaginate(profile.symptoms.all(), request.GET, "created_at", 20)
+    except pagination.PaginationError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    data = [_symptom_row(s) for s in qs]
+    return version.stamp(pagination.with_next(JsonResponse(data, safe=False), request, next_cursor))
 
 
 @require_POST
@@ -340,9 +577,10 @@ def record_menstrual_cycle(request):
         )
 
         # Generate recommendation based on data
-        if flow_intensity == 'heavy':
+        findings = rules.CYCLE.evaluate(cycle)
+        if findings.has("HEAVY_FLOW"):
             message = "Heavy flow reported. Monitor for signs of anemia and rest adequately."
-        elif pain_level >= 8:
+        elif findings.has("SEVERE_PAIN"):
             message = "Severe menstrual pain reported. Consider pain management and consult your doctor."
         else:
             message = "Menstrual cycle recorded. Track any changes in flow or pain levels."
@@ -364,27 +602,29 @@ def record_menstrual_cycle(request):
 
 
 @login_required
-def patient_menstrual_json(request):
-    if request.user.is_doctor:
+async def patient_menstrual_json(request):
+    user = await request.auser()
+    if user.is_doctor:
         pid = request.GET.get("patient_id")
         if not pid:
             return JsonResponse({"error": "patient_id required"}, status=400)
         try:
-            profile = PatientProfile.objects.get(user__id=pid, assigned_doctor=request.user)
+            profile = await PatientProfile.objects.aget(user__id=pid, assigned_doctor=user)
         except PatientProfile.DoesNotExist:
             return JsonResponse({"error": "not found"}, status=404)
     else:
-        profile = PatientProfile.objects.filter(user=request.user).first()
+        profile = await PatientProfile.objects.filter(user=user).afirst()
     
     if not profile:
         return JsonResponse([], safe=False)
     
-    qs = profile.menstrual_cycles.all().order_by('-start_date')[:10]
-    data = [{
-        "start_date": m.start_date.isoformat() if m.start_date else None,
-        "end_date": m.end_date.isoformat() if m.end_date else None,
-        "flow_intensity": m.flow_intensity,
-        "pain_level": m.pain_level,
-        "notes": m.notes
-    } for m in qs]
-    return JsonResponse(data, safe=False)
\ No newline at end of file
+    version = await versions.amenstrual(profile)
+    not_modified = version.not_modified(request)
+    if not_modified:
+        return not_modified
+    try:
+        qs, next_cursor = await pagination.apaginate(profile.menstrual_cycles.all(), request.GET, "start_date", 10)
+    except pagination.PaginationError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    data = [_cycle_row(m) for m in qs]
+    return version.stamp(pagination.with_next(JsonResponse(data, safe=False), request, next_cursor))
\ No newline at end of file